@@ -0,0 +1,315 @@
+"""
+Admission control: per-client rate limits and a global concurrency limit.
+
+Every request (static files, media and /metrics aside) takes a token from its client's
+bucket for the route: `login`, `register`, `search` (product listings with `search=`) or
+`default`. Clients are the user id of a valid bearer token, otherwise the remote address;
+login and register are always per address. An empty bucket answers 429 with Retry-After.
+
+Admitted requests then need one of `admission_max_concurrency` slots. Up to
+`admission_max_queue` requests wait for a slot, for at most
+`admission_queue_timeout_seconds`; beyond that, and whenever recent database pool checkouts
+have waited longer than `admission_max_pool_wait_seconds`, requests are shed with 503 and
+Retry-After before they can pile onto the pool.
+
+Buckets live in process memory by default. With several workers set
+RATE_LIMIT_BACKEND=redis to share them through CACHE_URL; the shared store approximates
+each bucket with a sliding window of `burst` requests per `burst / rate` seconds, which
+needs only atomic INCR, so it also runs against the `python -m app.resp` stand-in.
+"""
+import asyncio
+import math
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from . import database
+from .config import settings
+from .dependencies import decode_token
+from .resp import RespClient, RespError
+
+EXEMPT_PREFIXES = ("/static/", "/media/", "/metrics")
+# Streams that stay open for minutes: rate limited, but they hold no concurrency slot.
+LONG_LIVED_PATHS = ("/events",)
+
+
+def parse_budget(value: str) -> Optional[Tuple[float, float]]:
+    """
+    "<rate>:<burst>" as (tokens per second, bucket size), or None when turned off.
+    """
+    if not value.strip():
+        return None
+    rate, _, burst = value.partition(":")
+    rate, burst = float(rate), float(burst or rate)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit budget: {value!r}")
+    return rate, burst
+
+
+class RateLimitStore:
+    """
+    No-op store: every request is allowed.
+    """
+    name = "none"
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Take one token from `key`'s bucket. Returns 0 if allowed, otherwise how many
+        seconds until a token will be available.
+        """
+        return 0.0
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    Exact token buckets for this process, least recently used dropped beyond `max_keys`
+    (a dropped bucket comes back full, which only ever errs towards allowing).
+    """
+    name = "memory"
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RespRateLimitStore(RateLimitStore):
+    """
+    Buckets shared by all workers over the Redis protocol, as sliding-window counters.
+    If the store is unreachable, requests are allowed.
+    """
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        self.client = RespClient(url, settings.cache_timeout_seconds)
+        self.prefix = prefix
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        window = burst / rate
+        position = time.time() / window
+        index = int(position)
+        current = f"{self.prefix}{key}:{index}"
+        try:
+            count = await self.client.execute("INCR", current)
+            if count == 1:
+                await self.client.execute("PEXPIRE", current, int(window * 2000) + 1000)
+            previous = int(await self.client.execute("GET", f"{self.prefix}{key}:{index - 1}") or 0)
+        except (RespError, ConnectionError, OSError, ValueError):
+            return 0.0
+
+        # The previous window counts for the part of it still inside a sliding window.
+        if previous * (1 - (position - index)) + count <= burst:
+            return 0.0
+        return 1 / rate
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def create_store(name: str) -> RateLimitStore:
+    if name == "memory":
+        return MemoryRateLimitStore(settings.rate_limit_max_clients)
+    if name == "redis":
+        return RespRateLimitStore(settings.cache_url)
+    if name == "none":
+        return RateLimitStore()
+    raise ValueError(f"Unknown rate limit backend: {name}")
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        store: RateLimitStore,
+        budgets: Dict[str, Optional[Tuple[float, float]]],
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        max_pool_wait: float,
+    ):
+        self.store = store
+        self.budgets = budgets
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_pool_wait = max_pool_wait
+
+        self.in_flight = 0
+        self.admitted = 0
+        self.limited: Counter = Counter()
+        self.shed: Counter = Counter()
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @staticmethod
+    def route_budget(scope) -> str:
+        method, path = scope["method"], scope["path"]
+        if method == "POST" and path == "/auth/login":
+            return "login"
+        if method == "POST" and path == "/auth/register":
+            return "register"
+        if method == "GET" and path.rstrip("/") == "/products" and b"search" in scope["query_string"]:
+            # Only a search term the endpoint acts on (non-blank) costs a search.
+            query = parse_qsl(scope["query_string"].decode("latin-1"))
+            if any(name == "search" and value.strip() for name, value in query):
+                return "search"
+        return "default"
+
+    @staticmethod
+    def client_key(scope, budget: str) -> str:
+        if budget not in ("login", "register"):
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    scheme, _, token = value.decode("latin-1").partition(" ")
+                    if scheme.lower() == "bearer" and token:
+                        try:
+                            return f"user:{decode_token(token)['sub']}"
+                        except (HTTPException, KeyError):
+                            pass
+                    break
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def check_rate(self, scope) -> Optional[float]:
+        """
+        Seconds the client must wait before this request is allowed, or None.
+        """
+        budget = self.route_budget(scope)
+        limits = self.budgets.get(budget)
+        if limits is None:
+            return None
+        wait = await self.store.take(f"{budget}:{self.client_key(scope, budget)}", *limits)
+        if wait <= 0:
+            return None
+        self.limited[budget] += 1
+        return wait
+
+    def _pool_wait(self) -> float:
+        metrics = getattr(database.engine.pool, "metrics", None)
+        return metrics.recent_wait() if metrics is not None else 0.0
+
+    async def enter(self) -> Optional[str]:
+        """
+        Take a concurrency slot, waiting in line if needed. Returns why the request was
+        shed instead, or None once it holds a slot.
+        """
+        if self.max_pool_wait and self._pool_wait() > self.max_pool_wait:
+            return "pool_wait"
+        if self.in_flight < self.max_concurrency:
+            self.in_flight += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return None
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot that was handed over meanwhile.
+            if waiter.done() and not waiter.cancelled():
+                self.leave()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return None
+
+    def leave(self) -> None:
+        # Hand the slot straight to the next waiter, if any is still waiting.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.store.name,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rate_limited": dict(self.limited),
+            "shed": dict(self.shed),
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        wait = await controller.check_rate(scope)
+        if wait is not None:
+            response = JSONResponse(
+                {"detail": "Rate limit exceeded"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        if scope["path"] in LONG_LIVED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await controller.enter()
+        if reason is not None:
+            controller.shed[reason] += 1
+            response = JSONResponse(
+                {"detail": "Server busy, please retry shortly"},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        controller.admitted += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.leave()
+
+
+admission = AdmissionController(
+    create_store(settings.rate_limit_backend),
+    budgets={
+        "default": parse_budget(settings.rate_limit_default),
+        "search": parse_budget(settings.rate_limit_search),
+        "login": parse_budget(settings.rate_limit_login),
+        "register": parse_budget(settings.rate_limit_register),
+    },
+    max_concurrency=settings.admission_max_concurrency,
+    max_queue=settings.admission_max_queue,
+    queue_timeout=settings.admission_queue_timeout_seconds,
+    max_pool_wait=settings.admission_max_pool_wait_seconds,
+)
@@ -0,0 +1,128 @@
+"""
+Set-based bulk changes to the catalog (repricing a category, clearing discontinued items).
+
+Products are selected by id list and/or filters (category, price range, stock range) and
+changed in chunks of `bulk_chunk_size`. Each chunk is one SELECT of the next matching ids
+(keyset on id), one UPDATE or DELETE over those ids that re-checks the filters, and a
+commit, so row locks are held for one chunk and a failure leaves earlier chunks applied.
+The category statistics are refreshed in the chunk's transaction; cached products and
+listings, the search index and change feed subscribers are updated once per chunk after
+it commits.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Numeric, cast, delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import facets, models, schemas
+from .cache import product_cache
+from .changefeed import catalog_event, changefeed
+from .config import settings
+from .search import FIELD_WEIGHTS, search_index
+
+products = models.Product.__table__
+
+
+def _conditions(selector: schemas.ProductSelector) -> list:
+    conditions = []
+    if selector.ids is not None:
+        conditions.append(products.c.id.in_(selector.ids))
+    if selector.category is not None:
+        conditions.append(products.c.category == selector.category)
+    if selector.min_price is not None:
+        conditions.append(products.c.price >= selector.min_price)
+    if selector.max_price is not None:
+        conditions.append(products.c.price <= selector.max_price)
+    if selector.min_stock is not None:
+        conditions.append(products.c.stock >= selector.min_stock)
+    if selector.max_stock is not None:
+        conditions.append(products.c.stock <= selector.max_stock)
+    return conditions
+
+
+def _values(changes: schemas.ProductBulkChanges) -> Dict[str, object]:
+    values = changes.model_dump(exclude_unset=True, exclude={"price_factor"})
+    for required in ("price", "stock"):
+        if values.get(required, 0) is None:
+            del values[required]
+    if changes.price_factor is not None:
+        values["price"] = func.round(cast(products.c.price * changes.price_factor, Numeric), 2)
+    return values
+
+
+async def _next_chunk(db: AsyncSession, conditions: list, after: int, size: int) -> List[Tuple[int, Optional[str]]]:
+    result = await db.execute(
+        select(products.c.id, products.c.category)
+        .where(*conditions, products.c.id > after)
+        .order_by(products.c.id)
+        .limit(size)
+    )
+    return result.all()
+
+
+async def bulk_update(
+    db: AsyncSession,
+    selector: schemas.ProductSelector,
+    changes: schemas.ProductBulkChanges,
+    chunk_size: Optional[int] = None,
+) -> schemas.BulkResult:
+    chunk_size = chunk_size or settings.bulk_chunk_size
+    conditions = _conditions(selector)
+    values = _values(changes)
+    reindex = bool(FIELD_WEIGHTS.keys() & values.keys())
+    report = schemas.BulkResult()
+
+    after = 0
+    while chunk := await _next_chunk(db, conditions, after, chunk_size):
+        after = chunk[-1].id
+        result = await db.execute(
+            update(products)
+            .where(products.c.id.in_([row.id for row in chunk]), *conditions)
+            .values(**values)
+            .returning(*products.c)
+        )
+        rows = result.all()
+        categories = {row.category for row in chunk} | {row.category for row in rows}
+        await facets.refresh(db, categories)
+        await db.commit()
+
+        report.affected += len(rows)
+        report.chunks += 1
+        if reindex:
+            for row in rows:
+                search_index.add(models.Product(**row._mapping))
+        await product_cache.invalidate([row.id for row in rows], categories)
+        await changefeed.publish(catalog_event("bulk_update", categories))
+    return report
+
+
+async def bulk_delete(
+    db: AsyncSession,
+    selector: schemas.ProductSelector,
+    chunk_size: Optional[int] = None,
+) -> schemas.BulkResult:
+    chunk_size = chunk_size or settings.bulk_chunk_size
+    conditions = _conditions(selector)
+    report = schemas.BulkResult()
+
+    after = 0
+    while chunk := await _next_chunk(db, conditions, after, chunk_size):
+        after = chunk[-1].id
+        result = await db.execute(
+            delete(products)
+            .where(products.c.id.in_([row.id for row in chunk]), *conditions)
+            .returning(products.c.id, products.c.category)
+        )
+        rows = result.all()
+        categories = {row.category for row in rows}
+        await facets.refresh(db, categories)
+        await db.commit()
+
+        report.affected += len(rows)
+        report.chunks += 1
+        for row in rows:
+            search_index.remove(row.id)
+        await product_cache.invalidate([row.id for row in rows], categories)
+        await changefeed.publish(catalog_event("bulk_delete", categories))
+    return report
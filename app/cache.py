@@ -0,0 +1,315 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from .config import settings
+from .resp import RespClient, RespError
+
+
+class TTLCache:
+    """
+    Synchronous LRU map with a per-entry deadline, for small in-process lookups.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Any) -> Any:
+        entry = self._entries.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class CacheBackend:
+    """
+    Byte-oriented key/value store. Implementations must treat failures as misses:
+    the cache may never be the reason a request fails.
+    """
+    name = "none"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        pass
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """
+        Set `key` only if it is absent. Returns False if it was already there.
+        """
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        pass
+
+    async def incr(self, key: str) -> int:
+        return 0
+
+    async def counter(self, key: str) -> int:
+        return 0
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Per-process LRU with TTL, bounded by entry count and total value size.
+    Counters live outside the LRU so eviction can never roll a generation back.
+    """
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                self._discard(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self.size += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+            self._discard(next(iter(self._entries)))
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._discard(key)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+class RespCacheBackend(CacheBackend):
+    """
+    Shared cache for multi-worker deployments, over the Redis protocol
+    (Redis itself, or the stand-in from `python -m app.resp`).
+    """
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "cache:"):
+        super().__init__()
+        self.client = RespClient(url, settings.cache_timeout_seconds)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            value = await self.client.execute("GET", self.prefix + key)
+        except (RespError, ConnectionError, OSError):
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        try:
+            await self.client.execute("SET", self.prefix + key, value, "EX", ttl)
+        except (RespError, ConnectionError, OSError):
+            pass
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        try:
+            return await self.client.execute("SET", self.prefix + key, value, "PX", int(ttl * 1000), "NX") is not None
+        except (RespError, ConnectionError, OSError):
+            return True
+
+    async def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        try:
+            await self.client.execute("DEL", *(self.prefix + key for key in keys))
+        except (RespError, ConnectionError, OSError):
+            pass
+
+    async def incr(self, key: str) -> int:
+        try:
+            return await self.client.execute("INCR", self.prefix + key)
+        except (RespError, ConnectionError, OSError):
+            return 0
+
+    async def counter(self, key: str) -> int:
+        try:
+            return int(await self.client.execute("GET", self.prefix + key) or 0)
+        except (RespError, ConnectionError, OSError, ValueError):
+            return 0
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def create_backend(name: str) -> CacheBackend:
+    if name == "memory":
+        return MemoryCacheBackend(settings.cache_max_entries, settings.cache_max_bytes)
+    if name == "redis":
+        return RespCacheBackend(settings.cache_url)
+    if name == "none":
+        return CacheBackend()
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+class CachedResponse:
+    """
+    A serialized JSON body plus its ETag. Stored as one blob: a JSON header line, then the body.
+
+    There is no Last-Modified: the entry's age says when it was cached, not when the
+    product changed, so clients revalidate with If-None-Match only.
+    """
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, etag: str, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.etag = etag
+        self.headers = headers or {}
+
+    @classmethod
+    def build(cls, body: bytes, headers: Optional[Dict[str, str]] = None) -> "CachedResponse":
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        return cls(body, etag, headers)
+
+    def dump(self) -> bytes:
+        meta = json.dumps({"etag": self.etag, "headers": self.headers})
+        return meta.encode() + b"\n" + self.body
+
+    @classmethod
+    def load(cls, blob: bytes) -> "CachedResponse":
+        meta, body = blob.split(b"\n", 1)
+        data = json.loads(meta)
+        return cls(body, data["etag"], data["headers"])
+
+    def not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is None:
+            return False
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or self.etag in candidates
+
+    def to_response(self, request: Request) -> Response:
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            **self.headers,
+        }
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+class ProductCache:
+    """
+    Read-through cache for product detail and listing responses.
+
+    Listing keys embed a per-category generation counter (and one for the unfiltered
+    listing); a write bumps only the generations it affects, so stale pages become
+    unreachable and age out of the LRU instead of being scanned for and deleted.
+    """
+    ALL = "*"
+
+    def __init__(self, backend: CacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def product_key(product_id: int) -> str:
+        return f"product:{product_id}"
+
+    async def list_key(self, category: Optional[str], *params) -> str:
+        scope = category if category is not None else self.ALL
+        generation = await self.backend.counter(f"gen:{scope}")
+        suffix = ":".join("" if p is None else str(p) for p in params)
+        return f"products:{scope}:{generation}:{suffix}"
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        blob = await self.backend.get(key)
+        if blob is None:
+            return None
+        try:
+            return CachedResponse.load(blob)
+        except (ValueError, KeyError):
+            await self.backend.delete(key)
+            return None
+
+    async def put(self, key: str, body: bytes, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        entry = CachedResponse.build(body, headers)
+        await self.backend.set(key, entry.dump(), self.ttl)
+        return entry
+
+    async def invalidate(self, product_ids: Iterable[int] = (), categories: Iterable[Optional[str]] = ()) -> None:
+        await self.backend.delete(*(self.product_key(pid) for pid in product_ids))
+        for scope in {self.ALL, *(c for c in categories if c is not None)}:
+            await self.backend.incr(f"gen:{scope}")
+
+
+product_cache = ProductCache(create_backend(settings.cache_backend), settings.cache_ttl_seconds)
@@ -0,0 +1,260 @@
+"""
+Bulk product import and export in CSV or NDJSON.
+
+Imports are parsed as a stream, validated against `schemas.ProductCreate` batch by
+batch, and written with multi-row statements (Postgres COPY for plain inserts).
+Rows that fail validation are reported individually; they never abort the import.
+Upserts are keyed on the product name, since products have no separate SKU. Names are not
+unique in the table, so a row whose name matches several existing products is reported as
+an error instead of updating an arbitrary one of them.
+
+The CLI writes straight to the database, so running servers only see its changes in
+their search index and product cache after a restart (or once cache entries expire).
+
+    python -m app.catalog_io import products.csv [--mode insert]
+    python -m app.catalog_io export products.ndjson
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+from collections import Counter
+from itertools import islice
+from typing import IO, AsyncIterator, Dict, Iterator, List, Literal, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import facets, models, schemas
+from .cache import product_cache
+from .changefeed import catalog_event, changefeed
+from .config import settings
+from .database import AsyncSessionLocal
+from .search import search_index
+
+MAX_REPORTED_ERRORS = 1000
+
+Format = Literal["csv", "ndjson"]
+Mode = Literal["upsert", "insert"]
+
+COLUMNS = ["name", "description", "specs", "price", "stock", "image_url", "category"]
+EXPORT_COLUMNS = ["id"] + COLUMNS
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> Format:
+    if (filename or "").lower().endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+
+def iter_rows(stream: IO[bytes], fmt: Format) -> Iterator[Tuple[int, object]]:
+    """
+    Yield (line number, raw row) pairs. Blocking: run it off the event loop.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key: (value if value != "" else None) for key, value in row.items() if key}
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+
+def record_error(report: schemas.ImportReport, line_number: int, errors: List[str]) -> None:
+    report.failed += 1
+    if len(report.errors) < MAX_REPORTED_ERRORS:
+        report.errors.append(schemas.ImportRowError(row=line_number, errors=errors))
+
+
+def validate_batch(batch: List[Tuple[int, object]], report: schemas.ImportReport) -> Dict[str, Tuple[int, dict]]:
+    """
+    Validate a batch of raw rows. Returns valid rows keyed by name (the last occurrence wins).
+    """
+    valid: Dict[str, Tuple[int, dict]] = {}
+    for line_number, raw in batch:
+        if isinstance(raw, Exception):
+            record_error(report, line_number, [f"Invalid JSON: {raw}"])
+            continue
+        try:
+            product = schemas.ProductCreate.model_validate(raw)
+        except ValidationError as e:
+            record_error(report, line_number, [
+                f"{'.'.join(str(loc) for loc in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+            ])
+            continue
+        valid[product.name] = (line_number, product.model_dump())
+    return valid
+
+
+async def _copy_insert(db: AsyncSession, rows: List[dict]) -> None:
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        models.Product.__tablename__,
+        records=[tuple(row[column] for column in COLUMNS) for row in rows],
+        columns=COLUMNS,
+    )
+
+
+async def write_batch(db: AsyncSession, rows: Dict[str, Tuple[int, dict]], mode: Mode, report: schemas.ImportReport) -> bool:
+    """
+    Write one validated batch in its own transaction. Returns True when rows went in through
+    COPY, in which case the search index has to be rebuilt afterwards.
+    """
+    if not rows:
+        return False
+
+    existing: Dict[str, int] = {}
+    matches: Counter = Counter()
+    previous_categories = set()
+    if mode == "upsert":
+        result = await db.execute(
+            select(models.Product.name, models.Product.id, models.Product.category).where(models.Product.name.in_(rows))
+        )
+        for name, product_id, category in result.all():
+            existing[name] = product_id
+            matches[name] += 1
+            previous_categories.add(category)
+        for name, count in matches.items():
+            if count > 1:
+                line_number, _ = rows.pop(name)
+                record_error(report, line_number, [f"name: matches {count} existing products, cannot choose one to update"])
+        if not rows:
+            await db.rollback()
+            return False
+
+    to_insert = [row for name, (_, row) in rows.items() if name not in existing]
+    to_update = [{"id": existing[name], **row} for name, (_, row) in rows.items() if name in existing]
+
+    inserted: List[dict] = []
+    use_copy = bool(to_insert) and mode == "insert" and db.bind.dialect.driver == "asyncpg"
+    try:
+        if use_copy:
+            await _copy_insert(db, to_insert)
+        elif to_insert:
+            result = await db.execute(
+                insert(models.Product).returning(models.Product.id, sort_by_parameter_order=True),
+                to_insert
+            )
+            inserted = [{"id": product_id, **row} for product_id, row in zip(result.scalars().all(), to_insert)]
+        if to_update:
+            await db.execute(update(models.Product), to_update)
+        categories = previous_categories | {row["category"] for row in to_insert + to_update}
+        await facets.refresh(db, categories)
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        for line_number, _ in rows.values():
+            record_error(report, line_number, [f"Database error: {e.__class__.__name__}"])
+        return False
+
+    report.inserted += len(to_insert)
+    report.updated += len(to_update)
+
+    for row in inserted + to_update:
+        search_index.add(models.Product(**row))
+
+    await product_cache.invalidate([row["id"] for row in to_update], categories)
+    await changefeed.publish(catalog_event("import", categories))
+    return use_copy
+
+
+async def import_products(
+    db: AsyncSession,
+    stream: IO[bytes],
+    fmt: Format,
+    mode: Mode = "upsert",
+    batch_size: Optional[int] = None,
+) -> schemas.ImportReport:
+    batch_size = batch_size or settings.import_batch_size
+    report = schemas.ImportReport()
+    rows = iter_rows(stream, fmt)
+    reindex = False
+
+    while True:
+        batch = await asyncio.to_thread(lambda: list(islice(rows, batch_size)))
+        if not batch:
+            break
+        report.processed += len(batch)
+        reindex |= await write_batch(db, validate_batch(batch, report), mode, report)
+
+    if reindex:
+        await search_index.rebuild(db)
+    return report
+
+
+async def export_products(fmt: Format, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Stream the products table in chunks from a dedicated session, selecting plain columns only.
+    """
+    chunk_size = chunk_size or settings.stream_chunk_size
+    columns = [getattr(models.Product, column) for column in EXPORT_COLUMNS]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue().encode()
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            select(*columns).order_by(models.Product.id).execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            if fmt == "csv":
+                writer.writerows(partition)
+            else:
+                for row in partition:
+                    buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n")
+            yield buffer.getvalue().encode()
+
+
+async def _run_import(path: str, fmt: Optional[Format], mode: Mode) -> None:
+    with open(path, "rb") as stream:
+        async with AsyncSessionLocal() as db:
+            report = await import_products(db, stream, fmt or detect_format(path, None), mode)
+    print(report.model_dump_json(indent=2))
+
+
+async def _run_export(path: str, fmt: Optional[Format]) -> None:
+    fmt = fmt or detect_format(path, None)
+    with open(path, "wb") as out:
+        async for chunk in export_products(fmt):
+            out.write(chunk)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk product import/export")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Import products from a CSV or NDJSON file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"])
+    import_parser.add_argument("--mode", choices=["upsert", "insert"], default="upsert")
+
+    export_parser = commands.add_parser("export", help="Export all products to a CSV or NDJSON file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=["csv", "ndjson"])
+
+    args = parser.parse_args()
+    if args.command == "import":
+        asyncio.run(_run_import(args.path, args.format, args.mode))
+    else:
+        asyncio.run(_run_export(args.path, args.format))
+
+
+if __name__ == "__main__":
+    main()
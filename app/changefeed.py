@@ -0,0 +1,334 @@
+"""
+Change feed: product, stock and order changes pushed to clients as server-sent events
+(`GET /events`), so they need not re-poll listings and profiles.
+
+Write endpoints publish small events after their transaction commits. The hub hands each
+event to the subscribers interested in it; a subscriber holds at most
+`changefeed_queue_size` undelivered events, keyed by what they are about, so a burst of
+updates to one product (or order) collapses into its latest state. A subscriber that
+falls further behind than that is dropped with a `reset` event; EventSource reconnects
+by itself and the client refetches what it shows. Order events only reach their owner.
+
+With CHANGEFEED_BACKEND=postgres (the default on PostgreSQL) events travel through
+NOTIFY on `changefeed_channel`, and every worker LISTENs on a dedicated connection and
+feeds its own subscribers, so clients see changes made through any worker. After the
+listener reconnects, every subscriber gets `reset`, since notifications may have been
+missed in between. The memory backend only reaches subscribers of the same process.
+"""
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from . import database
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+TOPICS = {"product": "products", "catalog": "products", "order": "orders"}
+# NOTIFY payloads must stay under 8000 bytes.
+MAX_NOTIFY_BYTES = 7500
+RETRY_MILLISECONDS = 3000
+
+
+class HubFull(Exception):
+    pass
+
+
+def product_event(action: str, product_id: int, **fields) -> dict:
+    return {"type": "product", "id": product_id, "action": action, **fields}
+
+
+def stock_event(product_id: int, stock: Optional[int]) -> dict:
+    return {"type": "product", "id": product_id, "action": "stock", "stock": stock}
+
+
+def order_event(order_id: int, user_id: int, status: str, **fields) -> dict:
+    return {"type": "order", "id": order_id, "user_id": user_id, "status": status, **fields}
+
+
+def catalog_event(action: str, categories: Iterable[Optional[str]] = ()) -> dict:
+    """
+    Many products changed at once (bulk edits, imports): clients refetch what they show.
+    """
+    return {"type": "catalog", "id": None, "action": action, "categories": sorted(c for c in categories if c)}
+
+
+class Subscriber:
+    def __init__(self, user_id: Optional[int], topics: Set[str], max_pending: int):
+        self.user_id = user_id
+        self.topics = topics
+        self.max_pending = max_pending
+        self.pending: "OrderedDict[Tuple[str, Optional[int]], dict]" = OrderedDict()
+        self.dropped = False
+        self._wakeup = asyncio.Event()
+
+    def wants(self, event: dict) -> bool:
+        if TOPICS.get(event["type"]) not in self.topics:
+            return False
+        return event["type"] != "order" or event["user_id"] == self.user_id
+
+    def offer(self, event: dict) -> Optional[bool]:
+        """
+        Queue an event. Returns True if it was folded into a pending one for the same
+        product or order, False if it was queued, None if the queue is full.
+        """
+        key = (event["type"], event["id"])
+        previous = self.pending.get(key)
+        if previous is not None:
+            if event.get("action") == "stock" and previous.get("action") in ("created", "updated"):
+                event = {**previous, "stock": event["stock"]}
+            self.pending[key] = event
+            return True
+        if len(self.pending) >= self.max_pending:
+            return None
+        self.pending[key] = event
+        self._wakeup.set()
+        return False
+
+    def drop(self) -> None:
+        self.dropped = True
+        self.pending.clear()
+        self._wakeup.set()
+
+    async def next_batch(self, timeout: float) -> List[dict]:
+        """
+        Wait up to `timeout` for events and take everything pending.
+        """
+        if not self.pending and not self.dropped:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        batch = list(self.pending.values())
+        self.pending.clear()
+        return batch
+
+
+class ChangeHub:
+    def __init__(self, max_pending: int, max_subscribers: int, keepalive: float):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self.subscribers: Set[Subscriber] = set()
+
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.events: Counter = Counter()
+
+    def subscribe(self, user_id: Optional[int], topics: Set[str]) -> Subscriber:
+        if len(self.subscribers) >= self.max_subscribers:
+            raise HubFull()
+        subscriber = Subscriber(user_id, topics, self.max_pending)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+
+    def deliver(self, events: Iterable[dict]) -> None:
+        for event in events:
+            self.events[event["type"]] += 1
+            for subscriber in list(self.subscribers):
+                if not subscriber.wants(event):
+                    continue
+                outcome = subscriber.offer(event)
+                if outcome is None:
+                    self.dropped += 1
+                    self.unsubscribe(subscriber)
+                    subscriber.drop()
+                elif outcome:
+                    self.coalesced += 1
+                else:
+                    self.delivered += 1
+
+    def reset(self) -> None:
+        """
+        Drop every subscriber, e.g. after events may have been lost.
+        """
+        for subscriber in list(self.subscribers):
+            self.unsubscribe(subscriber)
+            subscriber.drop()
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n".encode()
+            while True:
+                batch = await subscriber.next_batch(self.keepalive)
+                if subscriber.dropped:
+                    yield b"event: reset\ndata: {}\n\n"
+                    return
+                if not batch:
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"".join(
+                    b"event: " + event["type"].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+                    for event in batch
+                )
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "events": dict(self.events),
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "dropped_subscribers": self.dropped,
+        }
+
+
+class LocalTransport:
+    name = "memory"
+
+    def __init__(self, hub: ChangeHub):
+        self.hub = hub
+
+    async def send(self, events: List[dict]) -> None:
+        self.hub.deliver(events)
+
+    def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class PostgresTransport:
+    """
+    Fan-out through NOTIFY/LISTEN: sending notifies through the pool; a dedicated
+    connection per worker listens and delivers to the hub, including this worker's own
+    events.
+    """
+    name = "postgres"
+
+    def __init__(self, hub: ChangeHub, dsn: str, channel: str, retry_seconds: float = 1.0):
+        self.hub = hub
+        self.dsn = dsn
+        self.channel = channel
+        self.retry_seconds = retry_seconds
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _payloads(events: List[dict]) -> List[str]:
+        payloads, chunk = [], []
+        for event in events:
+            encoded = orjson.dumps(event)
+            if chunk and sum(map(len, chunk)) + len(encoded) + len(chunk) + 2 > MAX_NOTIFY_BYTES:
+                payloads.append(b"[" + b",".join(chunk) + b"]")
+                chunk = []
+            chunk.append(encoded)
+        if chunk:
+            payloads.append(b"[" + b",".join(chunk) + b"]")
+        return [payload.decode() for payload in payloads]
+
+    async def send(self, events: List[dict]) -> None:
+        async with database.engine.connect() as conn:
+            for payload in self._payloads(events):
+                await conn.execute(select(func.pg_notify(self.channel, payload)))
+            await conn.commit()
+
+    def _received(self, connection, pid, channel, payload) -> None:
+        try:
+            self.hub.deliver(orjson.loads(payload))
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            logger.warning("Ignoring malformed change feed notification", extra={"channel": channel})
+
+    async def run(self) -> None:
+        import asyncpg
+
+        first = True
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self.channel, self._received)
+                self.connected = True
+                if not first:
+                    self.hub.reset()
+                first = False
+                await closed.wait()
+                logger.warning("Change feed listener disconnected")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change feed listener failed")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.retry_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ChangeFeed:
+    def __init__(self, hub: ChangeHub, transport):
+        self.hub = hub
+        self.transport = transport
+
+    async def publish(self, *events: dict) -> None:
+        """
+        Publish committed changes. Never raises: the change itself has already happened.
+        """
+        if not events:
+            return
+        self.hub.published += len(events)
+        try:
+            await self.transport.send(list(events))
+        except Exception:
+            logger.exception("Publishing change feed events failed", extra={"events": len(events)})
+
+    def subscribe(self, user_id: Optional[int], topics: Set[str]) -> Subscriber:
+        return self.hub.subscribe(user_id, topics)
+
+    def start(self) -> None:
+        self.transport.start()
+
+    async def stop(self) -> None:
+        await self.transport.stop()
+        self.hub.reset()
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": self.transport.name, **self.hub.stats()}
+
+
+def create_feed(name: str, dialect: str) -> ChangeFeed:
+    hub = ChangeHub(
+        settings.changefeed_queue_size,
+        settings.changefeed_max_subscribers,
+        settings.changefeed_keepalive_seconds,
+    )
+    if name == "auto":
+        name = "postgres" if dialect == "postgresql" else "memory"
+    if name == "memory":
+        return ChangeFeed(hub, LocalTransport(hub))
+    if name == "postgres":
+        dsn = settings.database_url.replace("postgresql+asyncpg://", "postgresql://")
+        return ChangeFeed(hub, PostgresTransport(hub, dsn, settings.changefeed_channel))
+    raise ValueError(f"Unknown change feed backend: {name}")
+
+
+changefeed = create_feed(settings.changefeed_backend, database.engine.dialect.name)
@@ -0,0 +1,180 @@
+"""
+Negotiated response compression (brotli, then gzip).
+
+Compresses text-like responses of at least `compression_min_bytes`, and streamed
+responses chunk by chunk. Bodies that carry an ETag (the cached product responses) are
+compressed once per encoding and reused until they age out. brotli is optional; without
+it only gzip is offered.
+"""
+import zlib
+from typing import List, Optional, Tuple
+
+from .cache import TTLCache
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    Preferred supported encoding in an Accept-Encoding header, or None for identity.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(offered, key=lambda coding: weights.get(coding, weights.get("*", 0.0)))
+    return best if weights.get(best, weights.get("*", 0.0)) > 0 else None
+
+
+class Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality, lgwin=22)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """
+        Compress a chunk. `flush` makes everything so far decodable, so streamed lines
+        reach the client without waiting for the next chunk.
+        """
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.minimum_size = settings.compression_min_bytes
+        self.gzip_level = settings.gzip_level
+        self.brotli_quality = settings.brotli_quality
+        self.compressed = TTLCache(settings.compression_cache_entries, settings.cache_ttl_seconds)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor: Optional[Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = _header_map(message["headers"])
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    message["status"] in (204, 304)
+                    or b"content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith("text/event-stream")
+                )
+                if passthrough:
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None and not more_body:
+                # The whole body is known: compress it in one go, or not at all when small.
+                if len(body) < self.minimum_size:
+                    await send(_with_vary(start))
+                    await send(message)
+                    return
+                headers = _header_map(start["headers"])
+                etag = headers.get(b"etag")
+                compressed = None if etag is None else self.compressed.get((etag, encoding))
+                if compressed is None:
+                    one_shot = Compressor(encoding, self.gzip_level, self.brotli_quality)
+                    compressed = one_shot.compress(body) + one_shot.finish()
+                    if etag is not None:
+                        self.compressed.set((etag, encoding), compressed)
+                await send(_compressed_start(start, encoding, len(compressed)))
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            if compressor is None:
+                compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+                await send(_compressed_start(start, encoding, None))
+
+            chunk = compressor.compress(body, flush=more_body)
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _header_map(headers: List[Tuple[bytes, bytes]]) -> dict:
+    return {name.lower(): value for name, value in headers}
+
+
+def _with_vary(start: dict) -> dict:
+    headers = [(name, value) for name, value in start["headers"] if name.lower() != b"vary"]
+    vary = _header_map(start["headers"]).get(b"vary")
+    headers.append((b"vary", b"Accept-Encoding" if vary is None else vary + b", Accept-Encoding"))
+    return {**start, "headers": headers}
+
+
+def _compressed_start(start: dict, encoding: str, length: Optional[int]) -> dict:
+    headers = []
+    for name, value in _with_vary(start)["headers"]:
+        lowered = name.lower()
+        if lowered == b"content-length":
+            continue
+        if lowered == b"etag" and not value.startswith(b"W/"):
+            # The compressed bytes differ from the identity body, so the tag becomes weak.
+            value = b"W/" + value
+        headers.append((name, value))
+
+    headers.append((b"content-encoding", encoding.encode()))
+    if length is not None:
+        headers.append((b"content-length", str(length).encode()))
+    return {**start, "headers": headers}
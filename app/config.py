@@ -1,11 +1,125 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     database_url: str
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 500
+
+    # Comma-separated read replica URLs; empty sends every read to the primary.
+    db_replica_urls: str = ""
+    db_replica_strategy: str = "round_robin"
+    db_replica_max_lag_seconds: float = 5.0
+    db_replica_retry_seconds: float = 30.0
+    db_replica_check_seconds: float = 5.0
+    read_your_writes_seconds: float = 5.0
 
     secret_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 14
+    revocation_sync_seconds: float = 5.0
+    revocation_filter_capacity: int = 100000
+    revocation_filter_error_rate: float = 0.001
+
+    default_page_size: int = 50
+    max_page_size: int = 500
+    stream_chunk_size: int = 1000
+
+    search_backend: str = "auto"
+    search_max_results: int = 1000
+
+    cache_backend: str = "memory"
+    cache_url: str = "redis://localhost:6379/0"
+    # Limit on each command to CACHE_URL; a slow store then counts as unavailable.
+    cache_timeout_seconds: float = 0.25
+    cache_ttl_seconds: int = 300
+    cache_max_entries: int = 10000
+    cache_max_bytes: int = 64 * 1024 * 1024
+
+    password_hash_executor: str = "thread"
+    password_hash_workers: int = 0
+    password_hash_max_concurrency: int = 0
+    password_hash_max_queue: int = 256
+
+    principal_cache_ttl_seconds: int = 60
+    principal_cache_max_entries: int = 10000
+
+    import_batch_size: int = 1000
+    bulk_chunk_size: int = 1000
+
+    inventory_max_batch: int = 256
+    inventory_coalesce: bool = True
+
+    media_root: Optional[str] = None
+    upload_max_bytes: int = 10 * 1024 * 1024
+    upload_chunk_size: int = 1024 * 1024
+
+    image_workers: int = 0
+    image_quality: int = 82
+    image_variant_cache_bytes: int = 512 * 1024 * 1024
+    image_pregenerate: bool = True
+
+    compression_min_bytes: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 4
+    compression_cache_entries: int = 1024
+
+    outbox_dispatch: bool = True
+    outbox_batch_size: int = 50
+    outbox_poll_seconds: float = 5.0
+    outbox_max_attempts: int = 8
+    outbox_backoff_seconds: float = 30.0
+    outbox_max_backoff_seconds: float = 3600.0
+    outbox_lease_seconds: float = 300.0
+    outbox_smtp_idle_seconds: float = 60.0
+
+    # Token buckets as "<tokens per second>:<burst>"; an empty value turns the budget off.
+    rate_limit_backend: str = "memory"
+    rate_limit_max_clients: int = 100000
+    rate_limit_default: str = "50:200"
+    rate_limit_search: str = "5:20"
+    rate_limit_login: str = "0.2:10"
+    rate_limit_register: str = "0.05:5"
+
+    admission_max_concurrency: int = 256
+    admission_max_queue: int = 512
+    admission_queue_timeout_seconds: float = 2.0
+    admission_max_pool_wait_seconds: float = 0.5
+
+    changefeed_backend: str = "auto"
+    changefeed_channel: str = "changefeed"
+    changefeed_queue_size: int = 256
+    changefeed_max_subscribers: int = 1000
+    changefeed_keepalive_seconds: float = 15.0
+
+    # Replay of POST responses by Idempotency-Key: "memory" (per process), "redis"
+    # (shared through CACHE_URL) or "none" to ignore the header.
+    idempotency_backend: str = "memory"
+    idempotency_ttl_seconds: int = 24 * 3600
+    idempotency_max_entries: int = 10000
+    idempotency_max_bytes: int = 32 * 1024 * 1024
+    idempotency_max_request_bytes: int = 1024 * 1024
+    idempotency_max_response_bytes: int = 256 * 1024
+    idempotency_wait_seconds: float = 10.0
+    idempotency_lock_seconds: float = 60.0
+
+    sales_rollup_shards: int = 8
+    sales_rebuild_chunk_size: int = 10000
+    sales_max_range_days: int = 366
+
+    web_concurrency: int = 0
+    warmup_connections: int = 2
+    warmup_listings: bool = True
+    warmup_listing_categories: int = 20
+
+    log_level: str = "INFO"
+    log_format: str = "text"
+    n_plus_one_threshold: int = 5
 
     debug: bool = False
 
@@ -1,28 +1,350 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import math
+import time
+from typing import List, Optional
+
+from fastapi import Depends, Request
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from .cache import MemoryCacheBackend, RespCacheBackend
 from .config import settings
+from .metrics import Histogram
 
-SQLALCHEMY_DATABASE_URL = settings.database_url
-if "postgresql://" in SQLALCHEMY_DATABASE_URL:
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+logger = logging.getLogger(__name__)
 
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL,
-    echo=settings.debug,
-    future=True
-)
+
+def async_url(url: str) -> str:
+    if "postgresql://" in url:
+        return url.replace("postgresql://", "postgresql+asyncpg://")
+    return url
+
+
+SQLALCHEMY_DATABASE_URL = async_url(settings.database_url)
+
+
+class PoolMetrics:
+    # Time constant of `recent_wait`: a burst of slow checkouts fades within seconds.
+    RECENT_SECONDS = 5.0
+
+    def __init__(self):
+        self.wait = Histogram()
+        self.timeouts = 0
+        self._recent_wait = 0.0
+        self._recent_at = time.monotonic()
+
+    def observe_wait(self, seconds: float) -> None:
+        self.wait.observe(seconds)
+        self._recent_wait = 0.8 * self.recent_wait() + 0.2 * seconds
+        self._recent_at = time.monotonic()
+
+    def recent_wait(self) -> float:
+        """
+        Moving average of checkout waits that also decays while nothing checks out, so a
+        pool that stops being asked for connections does not look congested forever.
+        """
+        return self._recent_wait * math.exp((self._recent_at - time.monotonic()) / self.RECENT_SECONDS)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that times every checkout (including waits for a free connection)
+    and counts checkout timeouts. `engine_options` hands each engine its own subclass,
+    so metrics are per engine and survive the pool being recreated on dispose.
+    """
+    metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - started)
+
+
+def engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite needs its single shared connection; leave the default pool alone.
+        return {}
+
+    options = {
+        "poolclass": type(InstrumentedQueuePool.__name__, (InstrumentedQueuePool,), {"metrics": PoolMetrics()}),
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if parsed.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": settings.db_statement_cache_size}
+    return options
+
+
+def create_engine(url: str):
+    return create_async_engine(url, echo=settings.debug, future=True, **engine_options(url))
+
+
+class _ReadPins:
+    """
+    Callers that recently committed a write, keyed by a digest of their Authorization
+    header. Shared through Redis when that is the cache backend, so a pin holds across
+    workers; otherwise per process.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        if settings.cache_backend == "redis":
+            self.backend = RespCacheBackend(settings.cache_url, prefix="pin:")
+        else:
+            self.backend = MemoryCacheBackend(settings.cache_max_entries, settings.cache_max_bytes)
+
+    @staticmethod
+    def key(request: Request) -> Optional[str]:
+        authorization = request.headers.get("authorization")
+        if not authorization:
+            return None
+        return hashlib.blake2b(authorization.encode(), digest_size=16).hexdigest()
+
+    async def pin(self, key: str) -> None:
+        await self.backend.set(key, b"1", math.ceil(self.seconds))
+
+    async def pinned(self, key: Optional[str]) -> bool:
+        return key is not None and await self.backend.get(key) is not None
+
+
+read_pins = _ReadPins(settings.read_your_writes_seconds)
+
+
+class RoutingSession(AsyncSession):
+    """
+    Primary session. When it commits a write on behalf of a caller (`get_db` records who
+    in `info["pin_key"]`) and replicas are configured, that caller reads from the primary
+    for the next `read_your_writes_seconds`, so they never see a replica older than their
+    own change. The pin is set before the response is sent.
+    """
+
+    async def commit(self) -> None:
+        await super().commit()
+        if self.info.pop("wrote", False) and replica_set.replicas:
+            pin_key = self.info.get("pin_key")
+            if pin_key is not None:
+                await read_pins.pin(pin_key)
+
+
+@event.listens_for(Session, "after_flush")
+def _note_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_dml(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_writes(session):
+    session.info.pop("wrote", None)
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_engine(url)
+        self.sessionmaker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.in_flight = 0
+        self.reads = 0
+        self.failures = 0
+        self.lag_seconds = 0.0
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+
+
+class ReplicaSet:
+    """
+    Read replicas and how to pick one. A replica is skipped while it is down (a connection
+    failed within the last `retry_seconds`) or lagging (replay more than `max_lag_seconds`
+    behind, as measured by the background health check; PostgreSQL only, other backends
+    report no lag). "round_robin" rotates through available replicas; "least_busy" takes
+    the one with the fewest sessions open in this worker.
+    """
+
+    # Zero when the standby has replayed everything it received, so an idle primary does
+    # not read as lag; NULL (no lag) when the server is not a standby at all.
+    LAG_QUERY = text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )
+
+    def __init__(self, urls: List[str], strategy: str, max_lag_seconds: float, retry_seconds: float, check_seconds: float):
+        if strategy not in ("round_robin", "least_busy"):
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.replicas = [Replica(f"replica{i}", async_url(url)) for i, url in enumerate(urls)]
+        self.strategy = strategy
+        self.max_lag_seconds = max_lag_seconds
+        self.retry_seconds = retry_seconds
+        self.check_seconds = check_seconds
+        self.primary_reads = 0
+        self._rotation = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def available(self, replica: Replica) -> bool:
+        return replica.down_until <= time.monotonic() and replica.lag_seconds <= self.max_lag_seconds
+
+    def choose(self) -> Optional[Replica]:
+        candidates = [replica for replica in self.replicas if self.available(replica)]
+        if not candidates:
+            return None
+        start = next(self._rotation)
+        if self.strategy == "least_busy":
+            return min(
+                candidates,
+                key=lambda replica: (replica.in_flight, (candidates.index(replica) - start) % len(candidates))
+            )
+        return candidates[start % len(candidates)]
+
+    def mark_down(self, replica: Replica, error: BaseException) -> None:
+        replica.failures += 1
+        replica.down_until = time.monotonic() + self.retry_seconds
+        replica.last_error = f"{error.__class__.__name__}: {error}"
+        logger.warning("Read replica unavailable", extra={"replica": replica.name, "error": replica.last_error})
+
+    async def check(self, replica: Replica) -> None:
+        try:
+            async with replica.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    replica.lag_seconds = float((await conn.execute(self.LAG_QUERY)).scalar() or 0.0)
+                else:
+                    await conn.execute(text("SELECT 1"))
+        except (exc.DBAPIError, exc.TimeoutError, OSError) as e:
+            self.mark_down(replica, e)
+            return
+        replica.down_until = 0.0
+        if replica.lag_seconds > self.max_lag_seconds:
+            logger.warning("Read replica lagging", extra={"replica": replica.name, "lag_seconds": replica.lag_seconds})
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(self.check_seconds)
+
+    def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 AsyncSessionLocal = sessionmaker(
     engine,
-    class_=AsyncSession,
+    class_=RoutingSession,
     expire_on_commit=False
 )
 
+replica_set = ReplicaSet(
+    [url.strip() for url in settings.db_replica_urls.split(",") if url.strip()],
+    strategy=settings.db_replica_strategy,
+    max_lag_seconds=settings.db_replica_max_lag_seconds,
+    retry_seconds=settings.db_replica_retry_seconds,
+    check_seconds=settings.db_replica_check_seconds,
+)
+
 Base = declarative_base()
 
-async def get_db():
+def _pool_status(pool) -> dict:
+    status = {"class": type(pool).__name__}
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update({
+            "size": pool.size(),
+            "max_overflow": settings.db_max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "timeout_seconds": settings.db_pool_timeout,
+            "checkout_timeouts": pool.metrics.timeouts,
+            "checkout_wait_seconds": pool.metrics.wait.snapshot(),
+            "recent_wait_seconds": round(pool.metrics.recent_wait(), 6),
+        })
+    return status
+
+def pool_status() -> dict:
+    status = _pool_status(engine.pool)
+    if replica_set.replicas:
+        status["primary_reads"] = replica_set.primary_reads
+        status["replicas"] = [
+            {
+                "name": replica.name,
+                "url": replica.url,
+                "available": replica_set.available(replica),
+                "lag_seconds": replica.lag_seconds,
+                "in_flight": replica.in_flight,
+                "reads": replica.reads,
+                "failures": replica.failures,
+                "last_error": replica.last_error,
+                "pool": _pool_status(replica.engine.pool),
+            }
+            for replica in replica_set.replicas
+        ]
+    return status
+
+async def get_db(request: Request):
     async with AsyncSessionLocal() as session:
+        session.info["pin_key"] = read_pins.key(request)
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    """
+    Session for queries that only read. Uses an available replica when any are configured,
+    and the request's primary session (the same one `get_db` gives the route) when none
+    is, when the caller is pinned after a write, or when every replica fails to connect.
+    """
+    replica = None
+    if replica_set.replicas and not await read_pins.pinned(primary.info["pin_key"]):
+        replica = replica_set.choose()
+
+    while replica is not None:
+        session = replica.sessionmaker()
+        try:
+            # Check out the connection now, so a dead replica falls back instead of failing the route.
+            await session.connection()
+        except (exc.DBAPIError, exc.TimeoutError, OSError) as e:
+            await session.close()
+            replica_set.mark_down(replica, e)
+            replica = replica_set.choose()
+            continue
+
+        replica.reads += 1
+        replica.in_flight += 1
+        try:
+            yield session
+        finally:
+            replica.in_flight -= 1
+            await session.close()
+        return
+
+    replica_set.primary_reads += 1
+    yield primary
\ No newline at end of file
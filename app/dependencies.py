@@ -1,9 +1,14 @@
+from datetime import datetime, timezone
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from . import database, models, config
+from sqlalchemy.orm import make_transient_to_detached
+from . import database, models, config, schemas
+from .principals import principal_cache
+from .revocation import revocations
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="/auth/login",
@@ -11,22 +16,69 @@ oauth2_scheme = OAuth2PasswordBearer(
     description="Enter your **Email** and Password to get authorized"
 )
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
 
+def _decode_jwt(token: str) -> dict:
     try:
-        payload = jwt.decode(token, config.settings.secret_key, algorithms=config.settings.algorithm)
-        user_id: int = int(payload.get("sub"))
+        return jwt.decode(token, config.settings.secret_key, algorithms=config.settings.algorithm)
+    except JWTError:
+        raise credentials_exception
 
-        if user_id is None:
+def decode_token(token: str) -> dict:
+    """
+    Claims of a valid, unrevoked access token. Revocation is checked in memory on every
+    call, cached claims included.
+    """
+    payload = principal_cache.tokens.get(token)
+    if payload is None:
+        payload = _decode_jwt(token)
+        if payload.get("typ") == "refresh":
             raise credentials_exception
-    
-    except (JWTError, ValueError):
+
+        # Never keep a token cached past its own expiry.
+        ttl = principal_cache.tokens.ttl
+        if "exp" in payload:
+            ttl = min(ttl, payload["exp"] - datetime.now(timezone.utc).timestamp())
+        if ttl > 0:
+            principal_cache.tokens.set(token, payload, ttl)
+
+    if revocations.is_revoked(payload):
+        raise credentials_exception
+    return payload
+
+def decode_refresh_token(token: str) -> dict:
+    payload = _decode_jwt(token)
+    if payload.get("typ") != "refresh" or "jti" not in payload or "sid" not in payload:
         raise credentials_exception
+    _user_id(payload)
+    if revocations.is_revoked({"sid": payload["sid"]}):
+        raise credentials_exception
+    return payload
+
+def _user_id(payload: dict) -> int:
+    try:
+        return int(payload.get("sub"))
+    except (TypeError, ValueError):
+        raise credentials_exception
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_read_db)):
+    """
+    The caller as a `User` for reading. It may come from the principal cache, so treat it
+    as read-only: routes that change the user must load it by id in their own session.
+    """
+    user_id = _user_id(decode_token(token))
+
+    cached = principal_cache.get(user_id)
+    if cached is not None:
+        # Rebuild the user from cached columns, detached: it is kept out of the request
+        # session, so a route that selects the user there gets the row, not this snapshot.
+        user = models.User(**cached)
+        make_transient_to_detached(user)
+        return user
     
     result = await db.execute(
         select(models.User).where(models.User.id == user_id)
@@ -36,4 +88,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     if user is None:
         raise credentials_exception
 
-    return user
\ No newline at end of file
+    principal_cache.put(user)
+    return user
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> schemas.Principal:
+    """
+    Authorization from token claims alone: no session, no database round trip.
+    Use it for routes that only need the caller's id and role.
+    """
+    payload = decode_token(token)
+    return schemas.Principal(id=_user_id(payload), role=payload.get("role"))
+
+async def require_admin(principal: schemas.Principal = Depends(get_current_principal)) -> schemas.Principal:
+    if principal.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return principal
@@ -1,36 +1,57 @@
+import json
 import os
+from functools import lru_cache
 from pathlib import Path
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+from typing import TYPE_CHECKING
 from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+
+if TYPE_CHECKING:
+    from fastapi_mail import ConnectionConfig
 
 BASE_DIR = Path(__file__).resolve().parent
 TEMPLATE_FOLDER = BASE_DIR / "templates"
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("MAIL_FROM"),
-    MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
-    MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=TEMPLATE_FOLDER
-)
-
-async def send_welcome_email(email_to: EmailStr, username: str):
-    template_body = {
-        "username": username
-    }
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+@lru_cache(maxsize=None)
+def mail_config() -> "ConnectionConfig":
+    """
+    SMTP settings, validated on first use rather than at import: fastapi_mail is slow to
+    import and only the outbox dispatcher needs it.
+    """
+    from fastapi_mail import ConnectionConfig
 
-    message = MessageSchema(
-        subject="Welcome to InventoryPro!",
-        recipients=[email_to],
-        template_body=template_body,
-        subtype=MessageType.html
+    return ConnectionConfig(
+        MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
+        MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
+        MAIL_FROM=os.getenv("MAIL_FROM"),
+        MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
+        MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
+        MAIL_STARTTLS=_env_flag("MAIL_STARTTLS", True),
+        MAIL_SSL_TLS=_env_flag("MAIL_SSL_TLS", False),
+        USE_CREDENTIALS=_env_flag("MAIL_USE_CREDENTIALS", True),
+        VALIDATE_CERTS=_env_flag("MAIL_VALIDATE_CERTS", True),
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER
     )
 
-    fm = FastMail(conf)
+def queue_email(db: AsyncSession, email_to: str, subject: str, template: str, template_body: dict) -> None:
+    """
+    Add a message to the outbox as part of the caller's transaction; the outbox
+    dispatcher sends it once the transaction commits.
+    """
+    db.add(models.OutboxEmail(
+        recipient=email_to,
+        subject=subject,
+        template=template,
+        context=json.dumps(template_body)
+    ))
+
+def queue_welcome_email(db: AsyncSession, email_to: EmailStr, username: str) -> None:
+    template_body = {
+        "username": username
+    }
 
-    await fm.send_message(message, template_name="welcome.html")
\ No newline at end of file
+    queue_email(db, email_to, "Welcome to InventoryPro!", "welcome.html", template_body)
\ No newline at end of file
@@ -0,0 +1,306 @@
+"""
+Incrementally maintained per-category catalog statistics (product count, in-stock count,
+price sum, min and max price), behind `GET /products/facets`.
+
+The product endpoints adjust a category's row with one atomic UPDATE in the same
+transaction as the product change, after the change has been flushed. Removing a product
+priced at the category's minimum or maximum re-reads that one bound from the products
+table; a category without a row (new, or created before statistics existed) is computed
+from the products table on first use. Bulk writes (imports) refresh the categories they
+touched. Stock reservations only move `in_stock_count`, when a product sells out or comes
+back. Products with a NULL stock are untracked and count as in stock.
+
+    python -m app.facets rebuild
+    python -m app.facets check
+"""
+import argparse
+import asyncio
+import sys
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, delete, func, insert, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .database import AsyncSessionLocal
+
+UNCATEGORIZED = ""
+
+# The columns of a product that statistics depend on, in this order.
+Facts = Tuple[Optional[str], Optional[float], Optional[int]]
+
+
+def _key(category: Optional[str]) -> str:
+    return UNCATEGORIZED if category is None else category
+
+
+def _in_stock(stock: Optional[int]) -> bool:
+    return stock is None or stock > 0
+
+
+def _aggregate(categories: Optional[Iterable[str]] = None, product_ids: Optional[Sequence[int]] = None):
+    products = models.Product
+    category = func.coalesce(products.category, UNCATEGORIZED).label("category")
+    query = select(
+        category,
+        func.count(products.id).label("product_count"),
+        func.coalesce(func.sum(case((or_(products.stock.is_(None), products.stock > 0), 1), else_=0)), 0).label("in_stock_count"),
+        func.coalesce(func.sum(products.price), 0.0).label("price_sum"),
+        func.min(products.price).label("min_price"),
+        func.max(products.price).label("max_price"),
+    ).group_by(category)
+    if categories is not None:
+        categories = set(categories)
+        named = [c for c in categories if c != UNCATEGORIZED]
+        conditions = [products.category.in_(named)] if named else []
+        if UNCATEGORIZED in categories:
+            conditions.append(products.category.is_(None))
+        query = query.where(or_(*conditions) if conditions else False)
+    if product_ids is not None:
+        query = query.where(products.id.in_(product_ids))
+    return query
+
+
+def _stats_row(row) -> dict:
+    return {
+        "category": row.category,
+        "product_count": row.product_count,
+        "in_stock_count": row.in_stock_count,
+        "price_sum": float(row.price_sum),
+        "min_price": row.min_price,
+        "max_price": row.max_price,
+    }
+
+
+def _insert_ignore(dialect: str, row: dict):
+    if dialect == "postgresql":
+        return postgresql.insert(models.CategoryStats).values(**row).on_conflict_do_nothing(index_elements=["category"])
+    if dialect == "sqlite":
+        return sqlite.insert(models.CategoryStats).values(**row).on_conflict_do_nothing(index_elements=["category"])
+    return insert(models.CategoryStats).values(**row)
+
+
+async def refresh(db: AsyncSession, categories: Iterable[Optional[str]]) -> None:
+    """
+    Recompute the given categories from the products table, including changes already
+    flushed in this transaction.
+    """
+    keys = {_key(category) for category in categories}
+    if not keys:
+        return
+    stats = models.CategoryStats
+    computed = {row.category: _stats_row(row) for row in (await db.execute(_aggregate(keys))).all()}
+    for key in keys:
+        row = computed.get(key)
+        if row is None:
+            await db.execute(delete(stats).where(stats.category == key))
+            continue
+        statement = update(stats).where(stats.category == key).values(**row)
+        result = await db.execute(statement)
+        if result.rowcount == 0:
+            result = await db.execute(_insert_ignore(db.bind.dialect.name, row))
+            if result.rowcount == 0:
+                await db.execute(statement)
+
+
+async def _refresh_bounds(db: AsyncSession, key: str) -> None:
+    products, stats = models.Product, models.CategoryStats
+    in_category = products.category.is_(None) if key == UNCATEGORIZED else products.category == key
+    bounds = select(func.min(products.price), func.max(products.price)).where(in_category)
+    low, high = (await db.execute(bounds)).one()
+    await db.execute(update(stats).where(stats.category == key).values(min_price=low, max_price=high))
+
+
+async def record_added(db: AsyncSession, category: Optional[str], price: Optional[float], stock: Optional[int]) -> None:
+    """
+    Count a new product. Call after it has been flushed, before the commit.
+    """
+    stats = models.CategoryStats
+    key = _key(category)
+    values = {
+        "product_count": stats.product_count + 1,
+        "in_stock_count": stats.in_stock_count + (1 if _in_stock(stock) else 0),
+    }
+    if price is not None:
+        values.update(
+            price_sum=stats.price_sum + price,
+            min_price=case((or_(stats.min_price.is_(None), stats.min_price > price), price), else_=stats.min_price),
+            max_price=case((or_(stats.max_price.is_(None), stats.max_price < price), price), else_=stats.max_price),
+        )
+    result = await db.execute(update(stats).where(stats.category == key).values(**values))
+    if result.rowcount == 0:
+        await refresh(db, [key])
+
+
+async def record_removed(db: AsyncSession, category: Optional[str], price: Optional[float], stock: Optional[int]) -> None:
+    """
+    Uncount a deleted (or re-categorized, or re-priced) product. Call after the change has
+    been flushed, before the commit.
+    """
+    stats = models.CategoryStats
+    key = _key(category)
+    values = {
+        "product_count": stats.product_count - 1,
+        "in_stock_count": stats.in_stock_count - (1 if _in_stock(stock) else 0),
+    }
+    if price is not None:
+        values["price_sum"] = stats.price_sum - price
+    result = await db.execute(
+        update(stats).where(stats.category == key).values(**values)
+        .returning(stats.product_count, stats.min_price, stats.max_price)
+    )
+    row = result.first()
+    if row is None:
+        await refresh(db, [key])
+    elif row.product_count <= 0:
+        await db.execute(delete(stats).where(stats.category == key))
+    elif price is not None and (row.min_price is None or price <= row.min_price or price >= row.max_price):
+        await _refresh_bounds(db, key)
+
+
+async def record_changed(db: AsyncSession, before: Facts, after: Facts) -> None:
+    """
+    Account for an updated product given its (category, price, stock) before and after.
+    """
+    if before == after:
+        return
+    if _key(before[0]) == _key(after[0]) and before[1] == after[1]:
+        await record_stock(db, before[0], before[2], after[2])
+        return
+    await record_removed(db, *before)
+    await record_added(db, *after)
+
+
+async def record_stock(db: AsyncSession, category: Optional[str], before: Optional[int], after: Optional[int]) -> None:
+    """
+    A product's stock moved; only selling out or coming back in stock changes anything.
+    """
+    change = int(_in_stock(after)) - int(_in_stock(before))
+    if change:
+        stats = models.CategoryStats
+        result = await db.execute(
+            update(stats).where(stats.category == _key(category)).values(in_stock_count=stats.in_stock_count + change)
+        )
+        if result.rowcount == 0:
+            await refresh(db, [category])
+
+
+def _facet(row) -> dict:
+    return {
+        "category": None if row.category == UNCATEGORIZED else row.category,
+        "product_count": row.product_count,
+        "in_stock_count": row.in_stock_count,
+        "min_price": row.min_price,
+        "max_price": row.max_price,
+        "avg_price": round(row.price_sum / row.product_count, 2) if row.product_count else None,
+    }
+
+
+async def get_facets(db: AsyncSession, product_ids: Optional[Sequence[int]] = None) -> dict:
+    """
+    Per-category facets and catalog totals, from the statistics table or, for a search
+    result, aggregated over the matching ids (a bounded set).
+    """
+    if product_ids is None:
+        stats = models.CategoryStats
+        rows = (await db.execute(select(stats).order_by(stats.category))).scalars().all()
+    elif product_ids:
+        rows = (await db.execute(_aggregate(product_ids=product_ids).order_by("category"))).all()
+    else:
+        rows = []
+
+    categories = [_facet(row) for row in rows if row.product_count > 0]
+    count = sum(row.product_count for row in rows)
+    lows = [row.min_price for row in rows if row.min_price is not None]
+    highs = [row.max_price for row in rows if row.max_price is not None]
+    return {
+        "product_count": count,
+        "in_stock_count": sum(row.in_stock_count for row in rows),
+        "min_price": min(lows) if lows else None,
+        "max_price": max(highs) if highs else None,
+        "avg_price": round(sum(row.price_sum for row in rows) / count, 2) if count else None,
+        "categories": categories,
+    }
+
+
+async def rebuild(db: AsyncSession) -> int:
+    """
+    Recompute every category from the products table. Returns the number of categories.
+    """
+    rows = [_stats_row(row) for row in (await db.execute(_aggregate())).all()]
+    await db.execute(delete(models.CategoryStats))
+    if rows:
+        await db.execute(insert(models.CategoryStats), rows)
+    await db.commit()
+    return len(rows)
+
+
+async def ensure_built(db: AsyncSession) -> None:
+    """
+    Build the statistics once for a catalog that predates them.
+    """
+    if await db.scalar(select(models.CategoryStats.category).limit(1)) is not None:
+        return
+    if await db.scalar(select(models.Product.id).limit(1)) is None:
+        return
+    try:
+        await rebuild(db)
+    except IntegrityError:
+        # Another worker built them first.
+        await db.rollback()
+
+
+async def check(db: AsyncSession) -> List[str]:
+    """
+    Compare the maintained statistics with a fresh aggregate; returns the differences.
+    """
+    expected = {row.category: _stats_row(row) for row in (await db.execute(_aggregate())).all()}
+    actual = {
+        row.category: {column: getattr(row, column) for column in _stats_columns()}
+        for row in (await db.execute(select(models.CategoryStats))).scalars().all()
+    }
+    problems = []
+    for category in sorted(expected.keys() | actual.keys()):
+        want, have = expected.get(category), actual.get(category)
+        if want is None or have is None:
+            problems.append(f"{category!r}: expected {want}, stored {have}")
+            continue
+        for column, value in want.items():
+            stored = have[column]
+            if isinstance(value, float) and stored is not None and abs(value - stored) < 1e-6 * max(1.0, abs(value)):
+                continue
+            if value != stored:
+                problems.append(f"{category!r}: {column} expected {value}, stored {stored}")
+    return problems
+
+
+def _stats_columns() -> List[str]:
+    return [column.key for column in models.CategoryStats.__table__.columns]
+
+
+async def _run(command: str) -> int:
+    async with AsyncSessionLocal() as db:
+        if command == "rebuild":
+            print(f"Rebuilt statistics for {await rebuild(db)} categories")
+            return 0
+        problems = await check(db)
+    for problem in problems:
+        print(problem)
+    print("Category statistics are consistent" if not problems else f"{len(problems)} differences; run rebuild")
+    return 1 if problems else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain per-category catalog statistics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="Recompute all statistics from the products table")
+    commands.add_parser("check", help="Report differences between the statistics and the products table")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_run(args.command)))
+
+
+if __name__ == "__main__":
+    main()
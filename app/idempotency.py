@@ -0,0 +1,274 @@
+"""
+Idempotency keys for POST requests: a client that retries with the same `Idempotency-Key`
+header gets the first response again instead of a second order (or user, or product).
+
+The key is scoped to the client (the user of a valid bearer token, otherwise the remote
+address) and bound to the request it was first used with: the same key with a different
+method, path or body is refused with 422. The first request for a key claims it and runs;
+duplicates arriving meanwhile wait for it, for up to `idempotency_wait_seconds` (then 409
+with Retry-After), and duplicates arriving later are answered from the store without
+running the endpoint. Replays carry `Idempotent-Replayed: true`. The token endpoints
+(login, refresh, logout) ignore the header: replaying their responses would hand out
+tokens again, and a refresh token again after it had been rotated away.
+
+Responses are kept for `idempotency_ttl_seconds` unless they are 5xx or say the request
+was never processed (401, 403, 408, 429); then the key is released and a retry runs
+again, as it does when the request fails with an exception or the client disconnects.
+Responses over `idempotency_max_response_bytes` are not kept.
+
+The memory backend is a bounded LRU per process. With several workers set
+IDEMPOTENCY_BACKEND=redis: the claim is then a pending marker set with SET NX in the
+shared store, which expires after `idempotency_lock_seconds` in case its worker dies,
+and duplicates in other workers poll it. Like the other caches the store fails open: if
+it is unreachable, requests run as if they had no key.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from .admission import AdmissionController
+from .cache import CacheBackend, MemoryCacheBackend, RespCacheBackend
+from .config import settings
+
+HEADER = b"idempotency-key"
+METHODS = ("POST",)
+# Token endpoints: their responses must never be replayed.
+EXCLUDED_PATHS = frozenset({"/auth/login", "/auth/refresh", "/auth/logout"})
+MAX_KEY_LENGTH = 255
+# Statuses that do not mean the request was processed; retrying them must run again.
+UNSTORED_STATUSES = frozenset({401, 403, 408, 429})
+PENDING = b"\x00pending"
+POLL_SECONDS = 0.05
+
+
+class KeyInProgress(Exception):
+    pass
+
+
+class StoredResponse:
+    """
+    A complete response and the fingerprint of the request that produced it. Stored as
+    one blob: a JSON header line, then the body.
+    """
+    __slots__ = ("fingerprint", "status", "headers", "body")
+
+    def __init__(self, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def dump(self) -> bytes:
+        meta = json.dumps({
+            "fingerprint": self.fingerprint,
+            "status": self.status,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in self.headers],
+        })
+        return meta.encode() + b"\n" + self.body
+
+    @classmethod
+    def load(cls, blob: bytes) -> "StoredResponse":
+        meta, body = blob.split(b"\n", 1)
+        data = json.loads(meta)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in data["headers"]]
+        return cls(data["fingerprint"], data["status"], headers, body)
+
+    async def replay(self, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": [*self.headers, (b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class IdempotencyStore:
+    def __init__(self, backend: CacheBackend, ttl: int, lock_seconds: float, wait_seconds: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        # Keys claimed (or being claimed) in this process; duplicates here wait on them.
+        self._claims: Dict[str, asyncio.Future] = {}
+        self.results: Counter = Counter()
+
+    def _finish(self, key: str) -> None:
+        claim = self._claims.pop(key, None)
+        if claim is not None and not claim.done():
+            claim.set_result(None)
+
+    async def claim(self, key: str) -> Optional[StoredResponse]:
+        """
+        The stored response for `key`, or None once this request holds the key and has to
+        run. Waits while another request holds it; raises KeyInProgress after
+        `wait_seconds`.
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            claim = self._claims.get(key)
+            if claim is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(claim), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    raise KeyInProgress()
+                continue
+
+            self._claims[key] = asyncio.get_running_loop().create_future()
+            try:
+                blob = await self.backend.get(key)
+                if blob is None and await self.backend.add(key, PENDING, self.lock_seconds):
+                    return None
+            except BaseException:
+                self._finish(key)
+                raise
+            # Held by another worker, or already answered.
+            self._finish(key)
+            if blob is not None and blob != PENDING:
+                try:
+                    return StoredResponse.load(blob)
+                except (ValueError, KeyError):
+                    await self.backend.delete(key)
+                    continue
+            if time.monotonic() >= deadline:
+                raise KeyInProgress()
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        try:
+            await self.backend.set(key, response.dump(), self.ttl)
+        finally:
+            self._finish(key)
+
+    async def release(self, key: str) -> None:
+        try:
+            await self.backend.delete(key)
+        finally:
+            self._finish(key)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, "in_flight": len(self._claims), "results": dict(self.results)}
+
+
+def create_store(name: str) -> IdempotencyStore:
+    if name == "memory":
+        backend = MemoryCacheBackend(settings.idempotency_max_entries, settings.idempotency_max_bytes)
+    elif name == "redis":
+        backend = RespCacheBackend(settings.cache_url, prefix="idempotency:")
+    elif name == "none":
+        backend = CacheBackend()
+    else:
+        raise ValueError(f"Unknown idempotency backend: {name}")
+    return IdempotencyStore(
+        backend, settings.idempotency_ttl_seconds, settings.idempotency_lock_seconds, settings.idempotency_wait_seconds
+    )
+
+
+def _error(status_code: int, detail: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status_code, headers=headers)
+
+
+class IdempotencyMiddleware:
+    """
+    Sits outside admission control, so waiting duplicates hold no concurrency slot and
+    replays cost no rate limit tokens.
+    """
+
+    def __init__(self, app, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.store = store or idempotency
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS \
+                or scope["path"].rstrip("/") in EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        key = next((value for name, value in scope["headers"] if name == HEADER), None)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        store = self.store
+        if not key.strip() or len(key) > MAX_KEY_LENGTH:
+            await _error(400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")(scope, receive, send)
+            return
+
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > settings.idempotency_max_request_bytes:
+                await _error(413, "Request body too large for an Idempotency-Key")(scope, receive, send)
+                return
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        fingerprint = hashlib.sha256(
+            b"\0".join((scope["method"].encode(), scope["path"].encode(), scope["query_string"], body))
+        ).hexdigest()
+        client = AdmissionController.client_key(scope, "default")
+        store_key = hashlib.sha256(client.encode() + b"\0" + key).hexdigest()
+
+        try:
+            stored = await store.claim(store_key)
+        except KeyInProgress:
+            store.results["in_progress"] += 1
+            response = _error(409, "A request with this Idempotency-Key is still in progress", {"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                store.results["mismatched"] += 1
+                await _error(422, "Idempotency-Key was already used for a different request")(scope, receive, send)
+                return
+            store.results["replayed"] += 1
+            await stored.replay(send)
+            return
+
+        replayed = False
+
+        async def receive_body():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status, headers, parts, length, complete = 500, [], [], 0, False
+
+        async def capture(message):
+            nonlocal status, headers, length, complete
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", ()))
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                length += len(chunk)
+                if length <= settings.idempotency_max_response_bytes:
+                    parts.append(chunk)
+                complete = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, capture)
+        except BaseException:
+            await store.release(store_key)
+            raise
+
+        if complete and status < 500 and status not in UNSTORED_STATUSES \
+                and length <= settings.idempotency_max_response_bytes:
+            store.results["stored"] += 1
+            await store.complete(store_key, StoredResponse(fingerprint, status, headers, b"".join(parts)))
+        else:
+            store.results["not_stored"] += 1
+            await store.release(store_key)
+
+
+idempotency = create_store(settings.idempotency_backend)
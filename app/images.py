@@ -0,0 +1,220 @@
+"""
+Resized image derivatives of uploaded (content-addressed) images.
+
+Variants live at /files/variants/{sha256}/{variant}.{webp|jpg}. They are rendered in a
+process pool, either right after upload or on first request, and kept in a size-bounded
+on-disk cache that evicts the least recently served files first.
+"""
+import asyncio
+import contextlib
+import os
+import re
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .config import settings
+from .storage import image_storage
+
+VARIANTS: Dict[str, Tuple[int, int]] = {
+    "thumb": (160, 160),
+    "card": (400, 400),
+    "large": (1200, 1200),
+}
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+MEDIA_URL_RE = re.compile(r"^/media/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.\w+$")
+
+
+class ImageTooLarge(Exception):
+    """
+    The source image is over Pillow's decompression bomb limit. Raised in the worker
+    process instead of Pillow's own error, so the server never has to import Pillow.
+    """
+
+
+class RendererUnavailable(Exception):
+    pass
+
+
+def variant_url(digest: str, variant: str, fmt: str = "webp") -> str:
+    return f"/files/variants/{digest}/{variant}.{fmt}"
+
+
+def variant_urls(image_url: Optional[str], fmt: str = "webp") -> Optional[Dict[str, str]]:
+    """
+    Variant URLs for an uploaded image URL; None for external or legacy images.
+    """
+    match = MEDIA_URL_RE.match(image_url or "")
+    if match is None:
+        return None
+    return {name: variant_url(match["digest"], name, fmt) for name in VARIANTS}
+
+
+def render_variant(source: str, target: str, size: Tuple[int, int], pil_format: str, quality: int) -> None:
+    # Runs in a worker process; Pillow is only imported there.
+    from PIL import Image, ImageOps
+
+    tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+    try:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(size, Image.Resampling.LANCZOS)
+
+            if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                rgba = image.convert("RGBA")
+                background.paste(rgba, mask=rgba.getchannel("A"))
+                image = background
+
+            image.save(tmp, pil_format, quality=quality, optimize=True)
+        os.replace(tmp, target)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    finally:
+        # Already renamed on success; a partial file if encoding failed.
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+
+
+class VariantCache:
+    """
+    Size-bounded directory of rendered variants. The index is rebuilt from disk on
+    first use and ordered by last access, oldest first.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._index: "OrderedDict[Path, int]" = OrderedDict()
+        self._loaded = False
+
+    def _scan(self):
+        entries = []
+        if self.root.exists():
+            for path in self.root.rglob("*"):
+                if path.is_file() and not path.name.endswith(".tmp"):
+                    stat = path.stat()
+                    entries.append((stat.st_atime, path, stat.st_size))
+        return sorted(entries)
+
+    async def load(self) -> None:
+        if self._loaded:
+            return
+        for _, path, size in await asyncio.to_thread(self._scan):
+            self._index[path] = size
+            self.size += size
+        self._loaded = True
+
+    def touch(self, path: Path) -> bool:
+        if path not in self._index:
+            return False
+        self._index.move_to_end(path)
+        return True
+
+    async def add(self, path: Path) -> None:
+        size = (await asyncio.to_thread(path.stat)).st_size
+        self.size += size - self._index.pop(path, 0)
+        self._index[path] = size
+
+        victims = []
+        while self.size > self.max_bytes and len(self._index) > 1:
+            victim, victim_size = self._index.popitem(last=False)
+            self.size -= victim_size
+            self.evictions += 1
+            victims.append(victim)
+        for victim in victims:
+            await asyncio.to_thread(victim.unlink, missing_ok=True)
+
+
+class ImageVariants:
+    def __init__(self, workers: int, cache_bytes: int, quality: int):
+        self.workers = workers
+        self.quality = quality
+        self.cache = VariantCache(image_storage.root / ".variants", cache_bytes)
+        self.rendered = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[Path, asyncio.Task] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def target_path(self, digest: str, variant: str, fmt: str) -> Path:
+        return self.cache.root / variant / digest[:2] / f"{digest}.{fmt}"
+
+    def _find_source(self, digest: str) -> Optional[Path]:
+        return next(image_storage.path_for(digest, "").parent.glob(f"{digest}.*"), None)
+
+    async def get(self, digest: str, variant: str, fmt: str) -> Optional[Path]:
+        """
+        Path of the rendered variant, rendering it first if needed. None if the source image
+        is unknown or cannot be decoded; raises ImageTooLarge for decompression bombs and
+        RendererUnavailable if the worker pool died.
+        """
+        await self.cache.load()
+        target = self.target_path(digest, variant, fmt)
+        if self.cache.touch(target):
+            return target
+
+        # Concurrent requests for the same variant share one render.
+        task = self._in_flight.get(target)
+        if task is None:
+            task = asyncio.ensure_future(self._render(digest, variant, fmt, target))
+            self._in_flight[target] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(target, None))
+        return await asyncio.shield(task)
+
+    async def _render(self, digest: str, variant: str, fmt: str, target: Path) -> Optional[Path]:
+        source = await asyncio.to_thread(self._find_source, digest)
+        if source is None:
+            return None
+
+        await asyncio.to_thread(target.parent.mkdir, parents=True, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                self._get_executor(),
+                render_variant,
+                str(source),
+                str(target),
+                VARIANTS[variant],
+                FORMATS[fmt][0],
+                self.quality,
+            )
+        except OSError:
+            # Pillow could not decode the source image.
+            return None
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next render.
+            self.shutdown()
+            raise RendererUnavailable("Image renderer unavailable")
+        self.rendered += 1
+        await self.cache.add(target)
+        return target
+
+    async def pregenerate(self, digest: str, fmt: str = "webp") -> None:
+        await asyncio.gather(*(self.get(digest, variant, fmt) for variant in VARIANTS), return_exceptions=True)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_variants = ImageVariants(
+    workers=settings.image_workers or min(2, os.cpu_count() or 1),
+    cache_bytes=settings.image_variant_cache_bytes,
+    quality=settings.image_quality,
+)
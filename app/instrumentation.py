@@ -0,0 +1,296 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import database, metrics
+from .admission import admission
+from .cache import product_cache
+from .changefeed import changefeed
+from .config import settings
+from .idempotency import idempotency
+from .images import image_variants
+from .inventory import inventory
+from .outbox import outbox_dispatcher
+from .passwords import password_hasher
+from .principals import principal_cache
+from .revocation import revocations
+
+try:
+    # FastAPI releases that include routers lazily, leaving prefixes off the routes.
+    from fastapi.routing import iter_route_contexts
+except ImportError:
+    iter_route_contexts = None
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds", "statement_counts")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.statement_counts: Counter = Counter()
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += time.perf_counter() - started
+        stats.statement_counts[statement] += 1
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Attribute every SQL statement run on `engine` (a sync Engine) to the current request.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class InstrumentationMiddleware:
+    """
+    Records per-route latency, SQL statement counts and DB time, and flags requests that
+    repeat one statement `n_plus_one_threshold` times or more. Latency stops at the last
+    response byte, so background tasks do not count against the route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict[int, str]] = None
+
+    def route_label(self, scope) -> str:
+        """
+        Path template of the matched route, including router prefixes. Older FastAPI
+        releases copy included routes with the prefix in their `path_format`; newer ones
+        keep the router-relative path in `scope["route"]`, and the full one is looked up.
+        """
+        route = scope.get("route")
+        if route is None:
+            return "<unmatched>"
+        if iter_route_contexts is None:
+            return getattr(route, "path_format", None) or getattr(route, "path", "<unmatched>")
+        if self._route_paths is None:
+            self._route_paths = {
+                id(context.original_route): context.path
+                for context in iter_route_contexts(scope["app"].routes)
+                if getattr(context, "path", None)
+            }
+        return self._route_paths.get(id(route)) or getattr(route, "path", "<unmatched>")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        recorded = False
+
+        def record():
+            route_label = self.route_label(scope)
+            method = scope["method"]
+
+            metrics.REQUEST_LATENCY.labels(method, route_label).observe(time.perf_counter() - started)
+            metrics.REQUESTS.inc(method, route_label, str(status_code))
+            metrics.DB_STATEMENTS.labels(method, route_label).observe(stats.statements)
+            metrics.DB_TIME.labels(method, route_label).observe(stats.db_seconds)
+
+            if stats.statement_counts:
+                statement, repeats = stats.statement_counts.most_common(1)[0]
+                if repeats >= settings.n_plus_one_threshold:
+                    metrics.REPEATED_STATEMENTS.inc(method, route_label)
+                    logger.warning(
+                        "Repeated SQL statement, likely N+1",
+                        extra={"method": method, "route": route_label, "repeats": repeats, "statement": statement}
+                    )
+
+        async def send_wrapper(message):
+            nonlocal status_code, recorded
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not recorded:
+                recorded = True
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                recorded = True
+                record()
+            current_request.reset(token)
+
+
+# Seconds from process start (or fork) until the app was ready to serve, once known.
+startup_seconds: Optional[float] = None
+
+
+def process_memory() -> Dict[str, int]:
+    """
+    Resident and proportional set size of this process in bytes. PSS splits pages shared
+    with other processes (e.g. forked workers) between them. Linux only; empty elsewhere.
+    """
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss"):
+                    memory[name.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return memory
+
+
+def runtime_collector():
+    """
+    Gauges and counters owned by other subsystems, read at scrape time.
+    """
+    status = database.pool_status()
+    pools = [({"engine": "primary"}, status)]
+    pools += [({"engine": replica["name"]}, replica["pool"]) for replica in status.get("replicas", ())]
+    pools = [(labels, pool) for labels, pool in pools if "checked_out" in pool]
+    if pools:
+        yield "db_pool_checked_out", "gauge", "Connections currently checked out.", [
+            (labels, pool["checked_out"]) for labels, pool in pools
+        ]
+        yield "db_pool_size", "gauge", "Configured pool size.", [(labels, pool["size"]) for labels, pool in pools]
+        yield "db_pool_overflow", "gauge", "Connections open beyond pool_size.", [
+            (labels, max(pool["overflow"], 0)) for labels, pool in pools
+        ]
+        yield "db_pool_checkout_timeouts_total", "counter", "Checkouts that timed out.", [
+            (labels, pool["checkout_timeouts"]) for labels, pool in pools
+        ]
+
+    if "replicas" in status:
+        yield "db_reads_total", "counter", "Read sessions by target.", [({"target": "primary"}, status["primary_reads"])] + [
+            ({"target": replica["name"]}, replica["reads"]) for replica in status["replicas"]
+        ]
+        yield "db_replica_available", "gauge", "1 while a replica is taking reads.", [
+            ({"replica": replica["name"]}, int(replica["available"])) for replica in status["replicas"]
+        ]
+        yield "db_replica_lag_seconds", "gauge", "Replay lag from the last health check.", [
+            ({"replica": replica["name"]}, replica["lag_seconds"]) for replica in status["replicas"]
+        ]
+
+    gate = admission.stats()
+    yield "admission_in_flight", "gauge", "Requests holding a concurrency slot.", [({}, gate["in_flight"])]
+    yield "admission_queued", "gauge", "Requests waiting for a concurrency slot.", [({}, gate["queued"])]
+    yield "admission_rate_limited_total", "counter", "Requests refused with 429, by route budget.", [
+        ({"budget": budget}, count) for budget, count in gate["rate_limited"].items()
+    ]
+    yield "admission_shed_total", "counter", "Requests refused with 503, by reason.", [
+        ({"reason": reason}, count) for reason, count in gate["shed"].items()
+    ]
+
+    backend = product_cache.backend
+    yield "product_cache_requests_total", "counter", "Product cache lookups.", [
+        ({"backend": backend.name, "result": "hit"}, backend.hits),
+        ({"backend": backend.name, "result": "miss"}, backend.misses),
+    ]
+
+    principals = principal_cache.stats()
+    yield "principal_cache_requests_total", "counter", "Principal cache lookups.", [
+        ({"cache": "users", "result": "hit"}, principals["user_hits"]),
+        ({"cache": "users", "result": "miss"}, principals["user_misses"]),
+        ({"cache": "tokens", "result": "hit"}, principals["token_hits"]),
+        ({"cache": "tokens", "result": "miss"}, principals["token_misses"]),
+    ]
+
+    hasher = password_hasher.stats()
+    yield "password_hash_waiting", "gauge", "Hash requests waiting for a worker slot.", [({}, hasher["waiting"])]
+    yield "password_hash_running", "gauge", "Hash requests running.", [({}, hasher["running"])]
+    yield "password_hash_total", "counter", "Password hash operations by outcome.", [
+        ({"outcome": "completed"}, hasher["completed"]),
+        ({"outcome": "rejected"}, hasher["rejected"]),
+        ({"outcome": "rehashed"}, hasher["rehashed"]),
+    ]
+    yield "password_hash_wait_seconds_total", "counter", "Total time spent queued for a worker.", [
+        ({}, password_hasher.total_wait_seconds)
+    ]
+
+    outbox = outbox_dispatcher.stats()
+    yield "outbox_emails_total", "counter", "Outbox emails by delivery outcome.", [
+        ({"outcome": "sent"}, outbox["sent"]),
+        ({"outcome": "retried"}, outbox["retried"]),
+        ({"outcome": "failed"}, outbox["failed"]),
+    ]
+    yield "outbox_smtp_connections_total", "counter", "SMTP connections opened by the dispatcher.", [
+        ({}, outbox["connections"])
+    ]
+
+    reservations = inventory.stats()
+    yield "inventory_reservations_total", "counter", "Stock reservation requests by outcome.", [
+        ({"outcome": "granted"}, reservations["granted"]),
+        ({"outcome": "rejected"}, reservations["rejected"]),
+    ]
+    yield "inventory_statements_total", "counter", "Statements run against product stock rows.", [
+        ({}, reservations["statements"])
+    ]
+    yield "inventory_units_total", "counter", "Units of stock reserved and released.", [
+        ({"direction": "reserved"}, reservations["units_reserved"]),
+        ({"direction": "released"}, reservations["units_released"]),
+    ]
+    yield "inventory_queued", "gauge", "Reservations waiting for their product's next batch.", [
+        ({}, reservations["queued"])
+    ]
+
+    keys = idempotency.stats()
+    yield "idempotency_requests_total", "counter", "POST requests with an Idempotency-Key, by outcome.", [
+        ({"result": result}, count) for result, count in keys["results"].items()
+    ]
+    yield "idempotency_keys_in_flight", "gauge", "Idempotency keys held by requests still running here.", [
+        ({}, keys["in_flight"])
+    ]
+
+    feed = changefeed.stats()
+    yield "changefeed_subscribers", "gauge", "Open change feed streams.", [({}, feed["subscribers"])]
+    yield "changefeed_events_total", "counter", "Change feed events received by this worker's hub, by type.", [
+        ({"type": kind}, count) for kind, count in feed["events"].items()
+    ]
+    yield "changefeed_deliveries_total", "counter", "Events queued for subscribers, and those folded into a pending update.", [
+        ({"result": "queued"}, feed["delivered"]),
+        ({"result": "coalesced"}, feed["coalesced"]),
+    ]
+    yield "changefeed_dropped_subscribers_total", "counter", "Subscribers dropped for falling behind.", [
+        ({}, feed["dropped_subscribers"])
+    ]
+
+    revoked = revocations.stats()
+    yield "token_revocations", "gauge", "Revoked token and session ids held in memory.", [({}, revoked["revoked"])]
+    yield "token_revocation_checks_total", "counter", "Tokens checked for revocation.", [({}, revoked["checks"])]
+    yield "token_revocation_filter_hits_total", "counter", "Ids the Bloom filter reported as possibly revoked.", [
+        ({"result": "revoked"}, revoked["filter_hits"] - revoked["false_positives"]),
+        ({"result": "false_positive"}, revoked["false_positives"]),
+    ]
+
+    yield "image_variants_rendered_total", "counter", "Image variants rendered.", [({}, image_variants.rendered)]
+    yield "image_variant_cache_bytes", "gauge", "Size of the on-disk variant cache.", [({}, image_variants.cache.size)]
+
+    memory = process_memory()
+    if memory:
+        yield "process_memory_bytes", "gauge", "Memory of this worker process (rss, and pss counting shared pages pro rata).", [
+            ({"kind": kind}, value) for kind, value in memory.items()
+        ]
+    if startup_seconds is not None:
+        yield "process_startup_seconds", "gauge", "Time from process start (or fork) until ready to serve.", [
+            ({}, startup_seconds)
+        ]
@@ -0,0 +1,320 @@
+"""
+Stock reservation for orders.
+
+Stock is taken with a conditional `UPDATE products SET stock = stock - n WHERE stock >= n`,
+so it can never go negative. A cart is reserved in one short transaction of its own, one
+multi-row statement, that commits before the order is written: all of it or, if any
+product falls short, none of it. Hot product rows are therefore locked for the
+reservation rather than for the whole order transaction. `create_order` releases the
+reservation if the order then fails, and `cancel_order` releases it in the cancelling
+transaction.
+
+Concurrent single-product reservations for the same product are coalesced: while one
+statement for a product is in flight, new requests queue behind it and the next statement
+takes the whole queue (up to `inventory_max_batch`) at once. Under a flash sale the number
+of statements against the hot row grows with the number of round trips, not the number of
+buyers. A batch that does not fit is granted in arrival order while stock lasts.
+
+Products with a NULL stock are not tracked and always reserve. Cached product details, and
+the cached listings of their categories, are dropped after each reservation or release. A
+product selling out or coming back in stock updates its category's statistics (see
+facets.py) in the same transaction. Stock levels go out on the change feed after each commit.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Row, case, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import facets, models
+from .cache import product_cache
+from .changefeed import changefeed, stock_event
+from .config import settings
+from .database import AsyncSessionLocal
+from .metrics import COUNT_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id: int, requested: int):
+        super().__init__(f"Insufficient stock for product {product_id}")
+        self.product_id = product_id
+        self.requested = requested
+
+
+class _Request:
+    __slots__ = ("quantity", "future", "queued")
+
+    def __init__(self, quantity: int, future: asyncio.Future):
+        self.quantity = quantity
+        self.future = future
+        self.queued = time.perf_counter()
+
+
+class InventoryReserver:
+    def __init__(self, max_batch: int, coalesce: bool = True):
+        self.max_batch = max_batch
+        self.coalesce = coalesce
+
+        self.requests = 0
+        self.granted = 0
+        self.rejected = 0
+        self.statements = 0
+        self.units_reserved = 0
+        self.units_released = 0
+        self.batch_sizes = Histogram(COUNT_BUCKETS)
+        self.wait = Histogram()
+
+        self._queues: Dict[int, List[_Request]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+
+    async def reserve(self, quantities: Dict[int, int]) -> None:
+        """
+        Reserve every product's quantity or none of them. Raises InsufficientStock for the
+        first product (by id) that could not be reserved.
+        """
+        self.requests += len(quantities)
+        if self.coalesce and len(quantities) == 1:
+            (product_id, quantity), = quantities.items()
+            request = _Request(quantity, asyncio.get_running_loop().create_future())
+            self._queues.setdefault(product_id, []).append(request)
+            if product_id not in self._workers:
+                self._workers[product_id] = asyncio.create_task(self._drain(product_id))
+            if not await request.future:
+                raise InsufficientStock(product_id, quantity)
+            return
+
+        failed, categories = await self._apply_cart(quantities)
+        if failed is not None:
+            raise InsufficientStock(failed, quantities[failed])
+        await self._settled(categories)
+
+    async def _apply_cart(self, quantities: Dict[int, int]) -> Tuple[Optional[int], Dict[int, Optional[str]]]:
+        """
+        Take stock for a whole cart in one transaction with one conditional multi-row
+        UPDATE. Returns the first product (by id) that could not be reserved, with nothing
+        taken, or None and each product's category.
+        """
+        product = models.Product
+        product_ids = sorted(quantities)
+        needed = case(quantities, value=product.id)
+        async with AsyncSessionLocal() as db:
+            if db.bind.dialect.name == "postgresql" and len(product_ids) > 1:
+                # Lock the rows in id order so that concurrent carts cannot deadlock.
+                self.statements += 1
+                await db.execute(
+                    select(product.id).where(product.id.in_(product_ids)).order_by(product.id).with_for_update()
+                )
+            self.statements += 1
+            rows = (await db.execute(
+                update(product)
+                .where(product.id.in_(product_ids), or_(product.stock.is_(None), product.stock >= needed))
+                .values(stock=product.stock - needed)
+                .returning(product.id, product.stock, product.category)
+            )).all()
+            taken = {row.id: row for row in rows}
+            if len(taken) < len(product_ids):
+                await db.rollback()
+                self.rejected += 1
+                return next(pid for pid in product_ids if pid not in taken), {}
+            for row in rows:
+                if row.stock is not None:
+                    await facets.record_stock(db, row.category, row.stock + quantities[row.id], row.stock)
+            await db.commit()
+        self.granted += len(quantities)
+        self.units_reserved += sum(quantities.values())
+        await changefeed.publish(*(stock_event(row.id, row.stock) for row in rows if row.stock is not None))
+        return None, {row.id: row.category for row in rows}
+
+    async def _drain(self, product_id: int) -> None:
+        try:
+            while self._queues.get(product_id):
+                queue = self._queues[product_id]
+                batch, self._queues[product_id] = queue[:self.max_batch], queue[self.max_batch:]
+                # Callers that went away before their turn (client disconnects) are skipped.
+                batch = [request for request in batch if not request.future.done()]
+                if not batch:
+                    continue
+
+                started = time.perf_counter()
+                for request in batch:
+                    self.wait.observe(started - request.queued)
+                quantities = [request.quantity for request in batch]
+                try:
+                    granted, category = await self._apply(product_id, quantities)
+                except Exception as e:
+                    for request in batch:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                    continue
+
+                self._count(quantities, granted)
+                abandoned = 0
+                for request, ok in zip(batch, granted):
+                    if request.future.done():
+                        abandoned += request.quantity if ok else 0
+                    else:
+                        request.future.set_result(ok)
+                if any(granted):
+                    await self._settled({product_id: category}, {product_id: abandoned} if abandoned else None)
+        finally:
+            del self._workers[product_id]
+            for request in self._queues.pop(product_id, ()):
+                if not request.future.done():
+                    request.future.set_exception(RuntimeError("Reservation worker stopped"))
+
+    async def _settled(self, categories: Dict[int, Optional[str]], abandoned: Optional[Dict[int, int]] = None) -> None:
+        """
+        After stock was taken: hand back stock granted to callers that have gone, and drop
+        the cached product details and listings. Failures here must not fail callers
+        already answered.
+        """
+        try:
+            if abandoned:
+                await self.release(abandoned)
+            await self.forget(categories)
+        except Exception:
+            logger.exception("Inventory cleanup failed", extra={"product_ids": sorted(categories), "abandoned": abandoned})
+
+    def _count(self, quantities: List[int], granted: List[bool]) -> None:
+        self.batch_sizes.observe(len(quantities))
+        for quantity, ok in zip(quantities, granted):
+            if ok:
+                self.granted += 1
+                self.units_reserved += quantity
+            else:
+                self.rejected += 1
+
+    async def _apply(self, product_id: int, quantities: List[int]) -> Tuple[List[bool], Optional[str]]:
+        """
+        Take stock for one batch in one transaction; returns which requests were granted,
+        and the product's category.
+        """
+        product = models.Product
+        total = sum(quantities)
+        for _ in range(MAX_ATTEMPTS):
+            async with AsyncSessionLocal() as db:
+                self.statements += 1
+                result = await db.execute(
+                    update(product)
+                    .where(product.id == product_id, product.stock >= total)
+                    .values(stock=product.stock - total)
+                    .returning(product.stock, product.category)
+                )
+                row = result.first()
+                if row is not None:
+                    if row.stock is not None:
+                        await facets.record_stock(db, row.category, row.stock + total, row.stock)
+                    await db.commit()
+                    await changefeed.publish(stock_event(product_id, row.stock))
+                    granted = [True] * len(quantities)
+                    break
+
+                # Not enough for the whole batch: lock the row and grant in arrival order.
+                self.statements += 1
+                row = (await db.execute(
+                    select(product.stock, product.category).where(product.id == product_id).with_for_update()
+                )).first()
+                if row is None:
+                    return [False] * len(quantities), None
+                if row.stock is None:
+                    return [True] * len(quantities), row.category
+
+                remaining = row.stock
+                granted = []
+                for quantity in quantities:
+                    granted.append(quantity <= remaining)
+                    if granted[-1]:
+                        remaining -= quantity
+                taken = row.stock - remaining
+                if not taken:
+                    return granted, row.category
+
+                self.statements += 1
+                result = await db.execute(
+                    update(product)
+                    .where(product.id == product_id, product.stock >= taken)
+                    .values(stock=product.stock - taken)
+                )
+                if result.rowcount == 1:
+                    await facets.record_stock(db, row.category, row.stock, remaining)
+                    await db.commit()
+                    await changefeed.publish(stock_event(product_id, remaining))
+                    break
+                # Backends without row locks: another writer got in between; start over.
+                await db.rollback()
+        else:
+            return [False] * len(quantities), None
+        return granted, row.category
+
+    async def release_in(self, db: AsyncSession, quantities: Dict[int, int]) -> Dict[int, Row]:
+        """
+        Return stock as part of the caller's transaction (e.g. a cancellation). One
+        statement per product, as a product coming back in stock updates its category's
+        statistics. Returns the new `stock` and the `category` of each product still there.
+        """
+        product = models.Product
+        rows = {}
+        for pid, quantity in sorted(quantities.items()):
+            row = (await db.execute(
+                update(product)
+                .where(product.id == pid)
+                .values(stock=product.stock + quantity)
+                .returning(product.stock, product.category)
+            )).first()
+            if row is None:
+                continue
+            rows[pid] = row
+            if row.stock is not None:
+                await facets.record_stock(db, row.category, row.stock - quantity, row.stock)
+        self.units_released += sum(quantities.values())
+        return rows
+
+    async def release(self, quantities: Dict[int, int]) -> None:
+        async with AsyncSessionLocal() as db:
+            rows = await self.release_in(db, quantities)
+            await db.commit()
+        await self.forget({pid: row.category for pid, row in rows.items()})
+        await changefeed.publish(*(stock_event(pid, row.stock) for pid, row in rows.items()))
+
+    async def forget(self, categories: Dict[int, Optional[str]]) -> None:
+        """
+        Drop the cached details of products whose stock changed, and the listings that
+        show them. `categories` maps each product to its category.
+        """
+        await product_cache.invalidate(categories, categories.values())
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "statements": self.statements,
+            "units_reserved": self.units_reserved,
+            "units_released": self.units_released,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_seconds": self.wait.snapshot(),
+        }
+
+
+async def order_quantities(db: AsyncSession, order_id: int) -> Dict[int, int]:
+    items = models.OrderItem
+    result = await db.execute(
+        select(items.product_id, items.quantity).where(items.order_id == order_id)
+    )
+    quantities: Counter = Counter()
+    for product_id, quantity in result.all():
+        if product_id is not None:
+            quantities[product_id] += quantity or 1
+    return dict(quantities)
+
+
+inventory = InventoryReserver(settings.inventory_max_batch, settings.inventory_coalesce)
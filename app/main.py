@@ -1,25 +1,71 @@
+import logging
 from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 
-from .database import engine, Base
-from .routers import auth, products, files, orders
+from .database import engine, AsyncSessionLocal, read_pins, replica_set
+from .schema import ensure_schema
+from .warmup import warm_up
+from .search import search_index
+from .cache import product_cache
+from .passwords import password_hasher
+from .storage import image_storage, ImmutableStaticFiles
+from .images import image_variants
+from .outbox import outbox_dispatcher
+from .revocation import revocations
+from .changefeed import changefeed
+from .config import settings
+from .admission import AdmissionMiddleware, admission
+from .compression import CompressionMiddleware
+from .idempotency import IdempotencyMiddleware, idempotency
+from .instrumentation import InstrumentationMiddleware, instrument_engine, runtime_collector
+from .logging_config import configure_logging
+from . import facets, metrics, sales
+from .routers import auth, products, files, orders, admin, events, analytics
 
 BASE_DIR = Path(__file__).resolve().parent
 FRONTEND_DIR = BASE_DIR.parent / "frontend"
 STATIC_DIR = BASE_DIR / "static"
 
+configure_logging(settings.log_level, settings.log_format)
+logger = logging.getLogger(__name__)
+
+instrument_engine(engine.sync_engine)
+for replica in replica_set.replicas:
+    instrument_engine(replica.engine.sync_engine)
+metrics.register_collector(runtime_collector)
+
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    print("Starting up database connection...")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    logger.info("Starting up database connection", extra={"dialect": engine.dialect.name})
+    await ensure_schema()
+    async with AsyncSessionLocal() as session:
+        await search_index.rebuild(session)
+        await facets.ensure_built(session)
+        await sales.ensure_built(session)
+        await revocations.load(session)
+    await warm_up()
+    replica_set.start()
+    revocations.start()
+    changefeed.start()
+    if settings.outbox_dispatch:
+        outbox_dispatcher.start()
     yield
-    print("Shutting down...")
+    logger.info("Shutting down")
+    await outbox_dispatcher.stop()
+    await replica_set.stop()
+    await revocations.stop()
+    await changefeed.stop()
+    await product_cache.backend.close()
+    await read_pins.backend.close()
+    await admission.store.close()
+    await idempotency.backend.close()
+    password_hasher.shutdown()
+    image_variants.shutdown()
 
 app = FastAPI(
     title="High-Performance E-Commerce Backend API",
@@ -29,19 +75,33 @@ app = FastAPI(
 )
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+app.mount("/media", ImmutableStaticFiles(directory=image_storage.root, check_dir=False), name="media")
 
+app.add_middleware(AdmissionMiddleware)
+if settings.idempotency_backend != "none":
+    app.add_middleware(IdempotencyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(InstrumentationMiddleware)
 
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(products.router, prefix="/products", tags=["Products"])
 app.include_router(files.router, prefix="/files", tags=["Files"])
 app.include_router(orders.router)
+app.include_router(admin.router)
+app.include_router(analytics.router)
+app.include_router(events.router)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 @app.get("/", include_in_schema=False)
 def server_frontend():
@@ -0,0 +1,164 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Upper bounds in seconds, shared by all latency histograms.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram in the Prometheus style: `counts[i]` holds observations
+    in (buckets[i-1], buckets[i]], with a final overflow bucket.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th observation (an over-estimate, as in Prometheus).
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): total for bound, total in self.cumulative()},
+        }
+
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class HistogramFamily:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.children: Dict[Tuple, Histogram] = {}
+
+    def labels(self, *values) -> Histogram:
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram(self.buckets)
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, histogram in sorted(self.children.items()):
+            for bound, total in histogram.cumulative():
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, values, le)} {total}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(histogram.sum)}")
+            lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *values, amount: float = 1) -> None:
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(total)}")
+        return lines
+
+
+# A collector returns (name, type, help, [(labels dict, value), ...]) tuples, read at scrape time.
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict[str, str], float]]]]]
+
+_families: List = []
+_collectors: List[Collector] = []
+
+
+def histogram(name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS) -> HistogramFamily:
+    family = HistogramFamily(name, documentation, label_names, buckets)
+    _families.append(family)
+    return family
+
+
+def counter(name: str, documentation: str, label_names: Sequence[str]) -> CounterFamily:
+    family = CounterFamily(name, documentation, label_names)
+    _families.append(family)
+    return family
+
+
+def register_collector(collector: Collector) -> None:
+    _collectors.append(collector)
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for family in _families:
+        lines.extend(family.render())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_LATENCY = histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte.", ("method", "route")
+)
+REQUESTS = counter("http_requests_total", "Completed HTTP requests.", ("method", "route", "status"))
+DB_STATEMENTS = histogram(
+    "db_statements_per_request", "SQL statements executed per request.", ("method", "route"), COUNT_BUCKETS
+)
+DB_TIME = histogram("db_time_per_request_seconds", "Time spent in SQL statements per request.", ("method", "route"))
+REPEATED_STATEMENTS = counter(
+    "db_repeated_statement_requests_total",
+    "Requests that ran one statement at least n_plus_one_threshold times (likely N+1 queries).",
+    ("method", "route"),
+)
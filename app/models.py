@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Date, DateTime, Index, Text, func, literal_column
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -38,6 +38,12 @@ class Product(Base):
     image_url = Column(String, nullable=True)
     category = Column(String, index=True)
 
+    __table_args__ = (
+        Index("ix_products_category_id", "category", "id"),
+        # Keyset order of ?sort=category, see pagination.sort_key.
+        Index("ix_products_category_key_id", func.coalesce(category, literal_column("''")), id),
+    )
+
 class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True)
@@ -46,4 +52,109 @@ class Order(Base):
     status = Column(String, default="Processing") 
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    owner = relationship("User", back_populates="orders")
\ No newline at end of file
+    owner = relationship("User", back_populates="orders")
+    items = relationship("OrderItem", back_populates="order")
+
+    __table_args__ = (
+        Index("ix_orders_user_created_id", "user_id", "created_at", "id"),
+    )
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"), index=True, nullable=True)
+    product_name = Column(String)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)
+
+    order = relationship("Order", back_populates="items")
+    product = relationship("Product")
+
+# Per-user order totals, kept up to date by the order endpoints (see order_summaries.py).
+class OrderSummary(Base):
+    __tablename__ = "user_order_summaries"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    cancelled_count = Column(Integer, nullable=False, default=0)
+    lifetime_spend = Column(Float, nullable=False, default=0.0)
+    last_order_id = Column(Integer, nullable=True)
+    last_order_at = Column(DateTime, nullable=True)
+    last_order_total = Column(Float, nullable=True)
+    last_order_status = Column(String, nullable=True)
+
+class OutboxEmail(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    template = Column(String, nullable=False)
+    context = Column(Text, nullable=False, default="{}")
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_due", "status", "next_attempt_at"),
+    )
+
+# Per-category catalog statistics, kept up to date by the product endpoints (see facets.py).
+# Products without a category are counted under "".
+class CategoryStats(Base):
+    __tablename__ = "category_stats"
+    category = Column(String, primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    in_stock_count = Column(Integer, nullable=False, default=0)
+    price_sum = Column(Float, nullable=False, default=0.0)
+    min_price = Column(Float, nullable=True)
+    max_price = Column(Float, nullable=True)
+
+# Revoked token ids (jti) and session ids (sid), see revocation.py. A row is only needed
+# until every token it can match has expired.
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+    id = Column(Integer, primary_key=True)
+    token_id = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Fingerprint of the models the schema was last created for (see schema.py).
+class SchemaFingerprint(Base):
+    __tablename__ = "schema_fingerprint"
+    fingerprint = Column(String, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+# Sales rollups, kept up to date by the order endpoints (see sales.py). Each day (and day
+# and category) is split over `shard` rows so concurrent orders do not queue on one row.
+class SalesDay(Base):
+    __tablename__ = "sales_daily"
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+    cancelled_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    cancelled_revenue = Column(Float, nullable=False, default=0.0)
+    units = Column(Integer, nullable=False, default=0)
+
+class SalesDayCategory(Base):
+    __tablename__ = "sales_daily_categories"
+    day = Column(Date, primary_key=True)
+    category = Column(String, primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+    cancelled_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    cancelled_revenue = Column(Float, nullable=False, default=0.0)
+    units = Column(Integer, nullable=False, default=0)
+
+# An order's amount and units per product category at the time it was placed, so a
+# cancellation is taken off the same category buckets even if products moved since.
+class OrderCategoryTotal(Base):
+    __tablename__ = "order_category_totals"
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    category = Column(String, primary_key=True)
+    amount = Column(Float, nullable=False)
+    units = Column(Integer, nullable=False)
\ No newline at end of file
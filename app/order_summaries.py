@@ -0,0 +1,165 @@
+"""
+Incrementally maintained per-user order summaries (count, lifetime spend, last order).
+
+`create_order` and `cancel_order` adjust the summary with one atomic UPDATE in the same
+transaction as the order change. A user without a summary row (one who ordered before
+summaries existed) gets it computed from the orders table on first use. Lifetime spend
+excludes cancelled orders.
+
+    python -m app.order_summaries rebuild
+"""
+import argparse
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .database import AsyncSessionLocal
+
+CANCELLED = "Cancelled"
+REBUILD_BATCH = 1000
+
+
+def _aggregate(user_id=None):
+    orders = models.Order
+    query = select(
+        orders.user_id,
+        func.count(orders.id).label("order_count"),
+        func.coalesce(func.sum(case((orders.status == CANCELLED, 1), else_=0)), 0).label("cancelled_count"),
+        func.coalesce(func.sum(case((orders.status != CANCELLED, orders.total_price), else_=0.0)), 0.0).label("lifetime_spend"),
+    ).group_by(orders.user_id)
+    if user_id is not None:
+        query = query.where(orders.user_id == user_id)
+    return query
+
+
+def _last_orders(user_id=None):
+    orders = models.Order
+    position = func.row_number().over(
+        partition_by=orders.user_id, order_by=(orders.created_at.desc(), orders.id.desc())
+    ).label("position")
+    ranked = select(orders.user_id, orders.id, orders.created_at, orders.total_price, orders.status, position)
+    if user_id is not None:
+        ranked = ranked.where(orders.user_id == user_id)
+    ranked = ranked.subquery()
+    return select(
+        ranked.c.user_id, ranked.c.id, ranked.c.created_at, ranked.c.total_price, ranked.c.status
+    ).where(ranked.c.position == 1)
+
+
+def _summary_row(user_id: int, totals, last) -> dict:
+    return {
+        "user_id": user_id,
+        "order_count": totals.order_count if totals else 0,
+        "cancelled_count": totals.cancelled_count if totals else 0,
+        "lifetime_spend": float(totals.lifetime_spend) if totals else 0.0,
+        "last_order_id": last.id if last else None,
+        "last_order_at": last.created_at if last else None,
+        "last_order_total": last.total_price if last else None,
+        "last_order_status": last.status if last else None,
+    }
+
+
+def _insert_ignore(dialect: str, row: dict):
+    if dialect == "postgresql":
+        return postgresql.insert(models.OrderSummary).values(**row).on_conflict_do_nothing(index_elements=["user_id"])
+    if dialect == "sqlite":
+        return sqlite.insert(models.OrderSummary).values(**row).on_conflict_do_nothing(index_elements=["user_id"])
+    return insert(models.OrderSummary).values(**row)
+
+
+async def _backfill(db: AsyncSession, user_id: int) -> bool:
+    """
+    Compute a user's summary from their orders, including changes already flushed in this
+    transaction. Returns False if another transaction created the row first.
+    """
+    totals = (await db.execute(_aggregate(user_id))).first()
+    last = (await db.execute(_last_orders(user_id))).first()
+    result = await db.execute(_insert_ignore(db.bind.dialect.name, _summary_row(user_id, totals, last)))
+    return result.rowcount == 1
+
+
+async def _apply(db: AsyncSession, user_id: int, **values) -> None:
+    statement = update(models.OrderSummary).where(models.OrderSummary.user_id == user_id).values(**values)
+    result = await db.execute(statement)
+    if result.rowcount == 0 and not await _backfill(db, user_id):
+        await db.execute(statement)
+
+
+async def record_order(db: AsyncSession, user_id: int, order_id: int, total: float, created_at: datetime) -> None:
+    """
+    Count a new order. Call after the order has been flushed, before the commit.
+    """
+    summary = models.OrderSummary
+    await _apply(
+        db,
+        user_id,
+        order_count=summary.order_count + 1,
+        lifetime_spend=summary.lifetime_spend + total,
+        last_order_id=order_id,
+        last_order_at=created_at,
+        last_order_total=total,
+        last_order_status="Processing",
+    )
+
+
+async def record_cancellation(db: AsyncSession, user_id: int, order_id: int, total: float) -> None:
+    summary = models.OrderSummary
+    await _apply(
+        db,
+        user_id,
+        cancelled_count=summary.cancelled_count + 1,
+        lifetime_spend=summary.lifetime_spend - total,
+        last_order_status=case((summary.last_order_id == order_id, CANCELLED), else_=summary.last_order_status),
+    )
+
+
+async def get_summary(db: AsyncSession, user_id: int) -> models.OrderSummary:
+    """
+    `db` may be a read replica session; a missing row is backfilled on the primary.
+    """
+    summary = await db.get(models.OrderSummary, user_id)
+    if summary is None:
+        async with AsyncSessionLocal() as primary:
+            await _backfill(primary, user_id)
+            await primary.commit()
+            summary = await primary.get(models.OrderSummary, user_id)
+    return summary
+
+
+async def rebuild(db: AsyncSession) -> int:
+    """
+    Recompute every summary from the orders table. Returns the number of users with orders.
+    Meant for backfills and repairs while no orders are being placed.
+    """
+    totals = {row.user_id: row for row in (await db.execute(_aggregate())).all()}
+    last = {row.user_id: row for row in (await db.execute(_last_orders())).all()}
+    rows = [_summary_row(user_id, row, last.get(user_id)) for user_id, row in totals.items() if user_id is not None]
+
+    await db.execute(delete(models.OrderSummary))
+    for start in range(0, len(rows), REBUILD_BATCH):
+        await db.execute(insert(models.OrderSummary), rows[start:start + REBUILD_BATCH])
+    await db.commit()
+    return len(rows)
+
+
+async def _run_rebuild() -> None:
+    async with AsyncSessionLocal() as db:
+        count = await rebuild(db)
+    print(f"Rebuilt order summaries for {count} users")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain per-user order summaries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="Recompute all summaries from the orders table")
+    parser.parse_args()
+    asyncio.run(_run_rebuild())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Email outbox dispatcher.
+
+Messages are rows in `email_outbox`, inserted in the same transaction as the change that
+triggers them (see `email_utils.queue_email`), so a crash or restart never loses one.
+The dispatcher claims due rows in batches, sends them over one persistent SMTP
+connection, and reschedules failures with exponential backoff; 5xx replies and rows that
+run out of attempts are marked failed. A claim is a lease: rows claimed by a worker that
+dies become due again after `outbox_lease_seconds`, so delivery is at least once.
+
+The dispatcher runs inside the API process by default. With several workers, set
+OUTBOX_DISPATCH=false and run one standalone instead:
+
+    python -m app.outbox run
+    python -m app.outbox purge --days 7
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+from sqlalchemy import delete, update
+from sqlalchemy.future import select
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+from .email_utils import TEMPLATE_FOLDER, mail_config
+
+logger = logging.getLogger(__name__)
+
+# Templates are compiled once per process; auto_reload off skips the per-render stat().
+_templates = Environment(
+    loader=FileSystemLoader(TEMPLATE_FOLDER),
+    autoescape=select_autoescape(["html", "xml"]),
+    auto_reload=False,
+)
+
+
+@lru_cache(maxsize=64)
+def get_template(name: str) -> Template:
+    return _templates.get_template(name)
+
+
+def build_message(email: models.OutboxEmail) -> EmailMessage:
+    conf = mail_config()
+    message = EmailMessage()
+    message["From"] = formataddr((conf.MAIL_FROM_NAME or "", str(conf.MAIL_FROM)))
+    message["To"] = email.recipient
+    message["Subject"] = email.subject
+    message.set_content(get_template(email.template).render(**json.loads(email.context)), subtype="html")
+    return message
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        batch_size: int,
+        poll_seconds: float,
+        max_attempts: int,
+        backoff_seconds: float,
+        max_backoff_seconds: float,
+        lease_seconds: float,
+        idle_seconds: float,
+    ):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.idle_seconds = idle_seconds
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.connections = 0
+
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._last_used = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self) -> None:
+        """
+        Send newly queued mail now instead of at the next poll.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+    async def run(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            try:
+                claimed = await self.dispatch_batch()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                claimed = 0
+            if claimed == self.batch_size:
+                continue
+
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_seconds:
+                await self._disconnect()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> List[models.OutboxEmail]:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(models.OutboxEmail)
+                .where(models.OutboxEmail.status == "pending", models.OutboxEmail.next_attempt_at <= now)
+                .order_by(models.OutboxEmail.next_attempt_at, models.OutboxEmail.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            emails = result.scalars().all()
+            for email in emails:
+                email.next_attempt_at = now + timedelta(seconds=self.lease_seconds)
+            await db.commit()
+        return emails
+
+    async def dispatch_batch(self) -> int:
+        """
+        Claim and send one batch of due messages. Returns how many were claimed.
+        """
+        emails = await self._claim()
+        if not emails:
+            return 0
+
+        outcomes: List[Tuple[models.OutboxEmail, Optional[str], bool]] = []
+        for email in emails:
+            try:
+                await self._send(build_message(email))
+                outcomes.append((email, None, False))
+            except aiosmtplib.SMTPResponseException as e:
+                outcomes.append((email, f"{e.code} {e.message}", e.code >= 500))
+            except (aiosmtplib.SMTPException, OSError) as e:
+                await self._disconnect()
+                outcomes.append((email, f"{e.__class__.__name__}: {e}", False))
+            except Exception as e:
+                # Unrenderable template or bad context: retrying will not help.
+                outcomes.append((email, f"{e.__class__.__name__}: {e}", True))
+
+        await self._record(outcomes)
+        return len(emails)
+
+    async def _record(self, outcomes: List[Tuple[models.OutboxEmail, Optional[str], bool]]) -> None:
+        now = datetime.utcnow()
+        rows = []
+        for email, error, permanent in outcomes:
+            row = {"id": email.id, "attempts": email.attempts + 1, "last_error": error}
+            if error is None:
+                row.update(status="sent", sent_at=now, next_attempt_at=email.next_attempt_at)
+                self.sent += 1
+            elif permanent or row["attempts"] >= self.max_attempts:
+                row.update(status="failed", sent_at=None, next_attempt_at=email.next_attempt_at)
+                self.failed += 1
+                logger.warning("Giving up on outbox email", extra={"email_id": email.id, "error": error})
+            else:
+                delay = min(self.backoff_seconds * 2 ** (row["attempts"] - 1), self.max_backoff_seconds)
+                row.update(
+                    status="pending",
+                    sent_at=None,
+                    next_attempt_at=now + timedelta(seconds=delay * random.uniform(0.8, 1.2)),
+                )
+                self.retried += 1
+            rows.append(row)
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(models.OutboxEmail), rows)
+            await db.commit()
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            return self._smtp
+
+        conf = mail_config()
+        smtp = aiosmtplib.SMTP(
+            hostname=conf.MAIL_SERVER,
+            port=conf.MAIL_PORT,
+            username=conf.MAIL_USERNAME if conf.USE_CREDENTIALS else None,
+            password=conf.MAIL_PASSWORD.get_secret_value() if conf.USE_CREDENTIALS else None,
+            use_tls=conf.MAIL_SSL_TLS,
+            start_tls=conf.MAIL_STARTTLS,
+            validate_certs=conf.VALIDATE_CERTS,
+            timeout=conf.TIMEOUT,
+        )
+        await smtp.connect()
+        self._smtp = smtp
+        self.connections += 1
+        return smtp
+
+    async def _send(self, message: EmailMessage) -> None:
+        smtp = await self._connection()
+        try:
+            await smtp.send_message(message)
+        except aiosmtplib.SMTPServerDisconnected:
+            # The server dropped the idle connection; reconnect once.
+            await self._disconnect()
+            smtp = await self._connection()
+            await smtp.send_message(message)
+        self._last_used = time.monotonic()
+
+    async def _disconnect(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "connections": self.connections,
+        }
+
+
+async def purge(older_than: timedelta) -> int:
+    """
+    Delete sent messages older than `older_than`. Returns the number removed.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            delete(models.OutboxEmail).where(
+                models.OutboxEmail.status == "sent",
+                models.OutboxEmail.sent_at < datetime.utcnow() - older_than,
+            )
+        )
+        await db.commit()
+    return result.rowcount
+
+
+outbox_dispatcher = OutboxDispatcher(
+    batch_size=settings.outbox_batch_size,
+    poll_seconds=settings.outbox_poll_seconds,
+    max_attempts=settings.outbox_max_attempts,
+    backoff_seconds=settings.outbox_backoff_seconds,
+    max_backoff_seconds=settings.outbox_max_backoff_seconds,
+    lease_seconds=settings.outbox_lease_seconds,
+    idle_seconds=settings.outbox_smtp_idle_seconds,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Email outbox dispatcher")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="Send queued email until interrupted")
+    purge_parser = commands.add_parser("purge", help="Delete old sent messages")
+    purge_parser.add_argument("--days", type=float, default=7)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        try:
+            asyncio.run(outbox_dispatcher.run())
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(f"Purged {asyncio.run(purge(timedelta(days=args.days)))} sent messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import base64
+import binascii
+import json
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+
+from sqlalchemy import func, literal_column, tuple_
+from sqlalchemy.sql import Select
+
+from .database import AsyncSessionLocal
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, values: Sequence[Any]) -> str:
+    raw = json.dumps({"s": sort, "k": list(values)}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor("Malformed cursor")
+
+    if not isinstance(data, dict) or data.get("s") != sort or not isinstance(data.get("k"), list):
+        raise InvalidCursor("Cursor does not match the requested sort order")
+
+    return data["k"]
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def sort_key(column):
+    """
+    The expression a keyset column is ordered and compared by. NULL never compares and
+    sorts first or last depending on the database, so a nullable text column is keyed as
+    "" instead (models declare matching expression indexes).
+    """
+    if getattr(column, "nullable", False) and _python_type(column) is str:
+        return func.coalesce(column, literal_column("''"))
+    return column
+
+
+def _check_key_value(column, value: Any) -> Any:
+    if value is None:
+        if getattr(column, "nullable", False) and _python_type(column) is str:
+            return ""
+        raise InvalidCursor("Malformed cursor")
+    expected = _python_type(column)
+    if expected is None:
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float) if expected is float else expected):
+        raise InvalidCursor("Malformed cursor")
+    return value
+
+
+def apply_keyset(query: Select, columns: Sequence, after: Optional[Sequence[Any]] = None, descending: bool = False) -> Select:
+    """
+    Order by the keyset columns and, when resuming, skip everything up to and including `after`.
+    Cursor values must have the types of their columns, so a crafted cursor is refused
+    here instead of failing in the database.
+    """
+    keys = [sort_key(column) for column in columns]
+    if after is not None:
+        if len(after) != len(columns):
+            raise InvalidCursor("Cursor does not match the requested sort order")
+        after = [_check_key_value(column, value) for column, value in zip(columns, after)]
+        key = keys[0] if len(keys) == 1 else tuple_(*keys)
+        bound = after[0] if len(keys) == 1 else tuple_(*after)
+        query = query.where(key < bound if descending else key > bound)
+    return query.order_by(*(key.desc() if descending else key for key in keys))
+
+
+async def stream_ndjson(query: Select, serialize: Callable[[Any], bytes], chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    Stream result rows as NDJSON, one chunk of rows per write. `serialize` returns one
+    newline-terminated line per row.
+
+    Uses its own session so the cursor stays open for as long as the client keeps reading.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions():
+            yield b"".join(serialize(row) for row in partition)
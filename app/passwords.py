@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from .config import settings
+from .utils import pwd_context
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a worker pool so hashing never blocks the event loop.
+
+    At most `max_concurrency` hashes run at once; up to `max_queue` more wait for a slot,
+    and anything beyond that is rejected with `HasherBusy` instead of piling up.
+    """
+
+    def __init__(self, executor: str, workers: int, max_concurrency: int, max_queue: int):
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HasherBusy("Password hashing queue is full")
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        waited = started_at - queued_at
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.total_run_seconds += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Returns (valid, new_hash); `new_hash` is set when the stored hash uses outdated settings.
+        """
+        valid, new_hash = await self._run(_verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        valid, _ = await self.verify_and_update(password, hashed_password)
+        return valid
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "avg_wait_ms": round(self.total_wait_seconds / completed * 1000, 3),
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            "avg_run_ms": round(self.total_run_seconds / completed * 1000, 3),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_workers = settings.password_hash_workers or min(4, os.cpu_count() or 1)
+
+password_hasher = PasswordHasher(
+    executor=settings.password_hash_executor,
+    workers=_workers,
+    max_concurrency=settings.password_hash_max_concurrency or _workers,
+    max_queue=settings.password_hash_max_queue,
+)
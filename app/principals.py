@@ -0,0 +1,76 @@
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import TTLCache
+from .config import settings
+
+# Columns copied into the cache. Everything else (hashed_password, relationships) stays
+# unloaded on a cached principal. get_current_user returns it detached from any session,
+# so it is a snapshot, not a verified row: read it, but load the user by id before
+# changing it.
+PRINCIPAL_FIELDS = ("id", "email", "username", "role", "is_active")
+WATCHED_FIELDS = ("role", "is_active", "email", "username")
+
+
+class PrincipalCache:
+    """
+    Caches the user columns `get_current_user` needs, keyed by user id, plus decoded
+    token claims keyed by the token itself.
+
+    Entries are dropped as soon as a commit changes a user's role, active flag or
+    identity (see the session hooks below). The cache is per process, so other workers
+    pick the change up when their entry's TTL runs out.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.users = TTLCache(max_entries, ttl)
+        self.tokens = TTLCache(max_entries, ttl)
+
+    def get(self, user_id: int) -> Optional[dict]:
+        return self.users.get(user_id)
+
+    def put(self, user: models.User) -> None:
+        self.users.set(user.id, {field: getattr(user, field) for field in PRINCIPAL_FIELDS})
+
+    def invalidate(self, user_id: int) -> None:
+        self.users.pop(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.users),
+            "user_hits": self.users.hits,
+            "user_misses": self.users.misses,
+            "tokens": len(self.tokens),
+            "token_hits": self.tokens.hits,
+            "token_misses": self.tokens.misses,
+        }
+
+
+principal_cache = PrincipalCache(settings.principal_cache_max_entries, settings.principal_cache_ttl_seconds)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session, flush_context):
+    changed = session.info.setdefault("principal_invalidations", set())
+    for obj in session.deleted:
+        if isinstance(obj, models.User):
+            changed.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, models.User):
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in WATCHED_FIELDS):
+                changed.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_principal_changes(session):
+    for user_id in session.info.pop("principal_invalidations", ()):
+        principal_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_changes(session):
+    session.info.pop("principal_invalidations", None)
@@ -0,0 +1,259 @@
+"""
+Minimal Redis-protocol (RESP2) client, plus a local stand-in server that speaks the
+subset of commands this app uses. The stand-in lets several workers share state in
+development without running Redis:
+
+    python -m app.resp --port 6379
+"""
+import argparse
+import asyncio
+import fnmatch
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    pass
+
+
+def encode_command(*args: Any) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            value = arg
+        else:
+            value = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise RespError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Unknown reply type: {line!r}")
+
+
+class RespClient:
+    """
+    Single-connection client. Commands are serialized over the connection with a lock;
+    the connection is (re)opened lazily. Waiting for the lock, connecting and each command
+    are limited to `timeout` seconds; a command that times out, fails or is cancelled
+    drops the connection, so an unread reply can never be taken for the next command's.
+    """
+
+    def __init__(self, url: str, timeout: Optional[float] = None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", self.db)
+
+    async def _send(self, *args: Any) -> Any:
+        self._writer.write(encode_command(*args))
+        await self._writer.drain()
+        return await read_reply(self._reader)
+
+    async def _execute(self, *args: Any) -> Any:
+        if self._writer is None:
+            await self._connect()
+        return await self._send(*args)
+
+    async def execute(self, *args: Any) -> Any:
+        try:
+            await asyncio.wait_for(self._lock.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError("Timed out waiting for the connection")
+        try:
+            return await asyncio.wait_for(self._execute(*args), self.timeout)
+        except asyncio.TimeoutError:
+            self._drop()
+            raise ConnectionError(f"No reply within {self.timeout}s")
+        except BaseException:
+            # Closed without waiting: this may be a cancellation.
+            self._drop()
+            raise
+        finally:
+            self._lock.release()
+
+    def _drop(self) -> Optional[asyncio.StreamWriter]:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+        return writer
+
+    async def _reset(self) -> None:
+        writer = self._drop()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._reset()
+
+
+class RespServer:
+    """
+    In-process stand-in for Redis: GET, SET (EX/PX/NX), DEL, EXISTS, INCR, INCRBY, EXPIRE,
+    PEXPIRE, TTL, KEYS, FLUSHDB, PING, SELECT and AUTH, with per-key expiry.
+    """
+
+    def __init__(self):
+        self._data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _expires_at(self, key: bytes) -> Optional[float]:
+        return self._data[key][1] if self._get(key) is not None else None
+
+    def handle(self, command: List[bytes]) -> Any:
+        name = command[0].upper().decode()
+        args = command[1:]
+
+        if name == "PING":
+            return "PONG"
+        if name in ("SELECT", "AUTH"):
+            return "OK"
+        if name == "GET":
+            return self._get(args[0])
+        if name == "SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            expires_at = None
+            if b"EX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            if b"NX" in options and self._get(key) is not None:
+                return None
+            self._data[key] = (value, expires_at)
+            return "OK"
+        if name == "DEL":
+            removed = 0
+            for key in args:
+                if self._get(key) is not None:
+                    del self._data[key]
+                    removed += 1
+            return removed
+        if name == "EXISTS":
+            return sum(1 for key in args if self._get(key) is not None)
+        if name in ("INCR", "INCRBY"):
+            key = args[0]
+            amount = int(args[1]) if name == "INCRBY" else 1
+            current = self._get(key)
+            try:
+                value = int(current or 0) + amount
+            except ValueError:
+                return RespError("ERR value is not an integer or out of range")
+            self._data[key] = (str(value).encode(), self._expires_at(key))
+            return value
+        if name in ("EXPIRE", "PEXPIRE"):
+            key, value = args[0], self._get(args[0])
+            if value is None:
+                return 0
+            seconds = int(args[1]) / (1000 if name == "PEXPIRE" else 1)
+            self._data[key] = (value, time.monotonic() + seconds)
+            return 1
+        if name == "TTL":
+            if self._get(args[0]) is None:
+                return -2
+            expires_at = self._data[args[0]][1]
+            return -1 if expires_at is None else max(0, round(expires_at - time.monotonic()))
+        if name == "KEYS":
+            pattern = args[0].decode()
+            return [key for key in list(self._data) if self._get(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)]
+        if name == "FLUSHDB":
+            self._data.clear()
+            return "OK"
+        return RespError(f"ERR unknown command '{name}'")
+
+    @staticmethod
+    def encode_reply(reply: Any) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, RespError):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(RespServer.encode_reply(item) for item in reply)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                command = await read_reply(reader)
+                writer.write(self.encode_reply(self.handle(command)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 6379) -> int:
+        self._server = await asyncio.start_server(self._serve_client, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _serve_forever(host: str, port: int) -> None:
+    server = RespServer()
+    bound = await server.start(host, port)
+    print(f"RESP stand-in listening on {host}:{bound}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(_serve_forever(args.host, args.port))
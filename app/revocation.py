@@ -0,0 +1,225 @@
+"""
+Token revocation without a database round trip per request.
+
+Access tokens carry a token id (`jti`) and a session id (`sid`); refresh tokens carry both
+too. Revoking writes the id to the `token_revocations` table, and every worker keeps the
+unexpired ids in memory: a Bloom filter that answers "not revoked" for almost every token
+from a few bit probes, and an exact dict that confirms the filter's positives, so a false
+positive never rejects a valid token. Workers load the table at startup and then poll for
+rows they have not seen every `revocation_sync_seconds`; a revocation made by this worker
+applies here at once and on other workers within one poll.
+
+Refresh tokens are single use: `/auth/refresh` revokes the presented token's id with an
+insert that only one request can win. Presenting it again means it leaked, so the whole
+session is revoked. Logging out revokes the session.
+
+Rows are deleted once every token they can match has expired.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Rows are re-read this far behind the highest id seen: ids are handed out before
+# their transactions commit, so a lower id can become visible after a higher one.
+SYNC_OVERLAP = 256
+PRUNE_INTERVAL = 3600.0
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Double hashing: k positions from one 128-bit digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def _expiry(value: datetime) -> float:
+    return value.timestamp() if value.tzinfo else (value - datetime(1970, 1, 1)).total_seconds()
+
+
+def _insert_ignore(dialect: str, row: dict):
+    if dialect == "postgresql":
+        return postgresql.insert(models.TokenRevocation).values(**row).on_conflict_do_nothing(index_elements=["token_id"])
+    if dialect == "sqlite":
+        return sqlite.insert(models.TokenRevocation).values(**row).on_conflict_do_nothing(index_elements=["token_id"])
+    return insert(models.TokenRevocation).values(**row)
+
+
+class RevocationList:
+    def __init__(self, capacity: int, error_rate: float, sync_interval: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+
+        self.filter = BloomFilter(capacity, error_rate)
+        # Exact set: revoked id -> expiry (unix seconds).
+        self.revoked: Dict[str, float] = {}
+        self.last_id = 0
+
+        self.checks = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+        self.syncs = 0
+        self._last_prune = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        self.checks += 1
+        for key in (payload.get("jti"), payload.get("sid")):
+            if key is None or key not in self.filter:
+                continue
+            self.filter_hits += 1
+            if key in self.revoked:
+                return True
+            self.false_positives += 1
+        return False
+
+    def remember(self, token_id: str, expires_at: datetime) -> None:
+        if token_id not in self.revoked:
+            self.filter.add(token_id)
+        self.revoked[token_id] = _expiry(expires_at)
+
+    def _rebuild_filter(self) -> None:
+        # Bloom filters cannot forget: start a fresh one sized for what is left.
+        self.filter = BloomFilter(max(self.capacity, 2 * len(self.revoked)), self.error_rate)
+        for token_id in self.revoked:
+            self.filter.add(token_id)
+
+    def _forget_expired(self) -> None:
+        now = time.time()
+        expired = [token_id for token_id, expires in self.revoked.items() if expires <= now]
+        for token_id in expired:
+            del self.revoked[token_id]
+        if self.filter.count > max(self.filter.capacity, 2 * len(self.revoked)):
+            self._rebuild_filter()
+
+    async def revoke(self, db: AsyncSession, token_id: str, expires_at: datetime) -> bool:
+        """
+        Revoke an id and commit. Returns False if it had already been revoked.
+        """
+        row = {"token_id": token_id, "expires_at": expires_at, "created_at": datetime.utcnow()}
+        try:
+            result = await db.execute(_insert_ignore(db.bind.dialect.name, row))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            return False
+        self.remember(token_id, expires_at)
+        return result.rowcount == 1
+
+    async def load(self, db: AsyncSession) -> None:
+        """
+        Read every unexpired revocation, replacing what is in memory.
+        """
+        revocations = models.TokenRevocation
+        result = await db.execute(
+            select(revocations.id, revocations.token_id, revocations.expires_at)
+            .where(revocations.expires_at > datetime.utcnow())
+        )
+        self.revoked = {}
+        self.last_id = 0
+        for row in result.all():
+            self.revoked[row.token_id] = _expiry(row.expires_at)
+            self.last_id = max(self.last_id, row.id)
+        self._rebuild_filter()
+        await db.commit()
+
+    async def sync(self, db: AsyncSession) -> int:
+        """
+        Pick up revocations made since the last sync (by any worker). Returns how many
+        were new here.
+        """
+        revocations = models.TokenRevocation
+        result = await db.execute(
+            select(revocations.id, revocations.token_id, revocations.expires_at)
+            .where(revocations.id > self.last_id - SYNC_OVERLAP)
+            .order_by(revocations.id)
+        )
+        new = 0
+        for row in result.all():
+            if row.token_id not in self.revoked:
+                new += 1
+                self.remember(row.token_id, row.expires_at)
+            self.last_id = max(self.last_id, row.id)
+        self.syncs += 1
+        self._forget_expired()
+
+        if time.monotonic() - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = time.monotonic()
+            await db.execute(delete(revocations).where(revocations.expires_at <= datetime.utcnow()))
+        await db.commit()
+        return new
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.sync(db)
+            except Exception:
+                logger.exception("Revocation sync failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self.revoked),
+            "filter_bits": self.filter.size,
+            "filter_hashes": self.filter.hashes,
+            "filter_entries": self.filter.count,
+            "checks": self.checks,
+            "filter_hits": self.filter_hits,
+            "false_positives": self.false_positives,
+            "syncs": self.syncs,
+            "last_id": self.last_id,
+        }
+
+
+revocations = RevocationList(
+    settings.revocation_filter_capacity,
+    settings.revocation_filter_error_rate,
+    settings.revocation_sync_seconds,
+)
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends
+from .. import database, dependencies
+from ..admission import admission
+from ..changefeed import changefeed
+from ..idempotency import idempotency
+from ..inventory import inventory
+from ..revocation import revocations
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(dependencies.require_admin)]
+)
+
+@router.get("/pool")
+async def get_pool_status():
+    """
+    Connection pool gauges, checkout wait histogram (seconds) and timeout count for this worker.
+    """
+    return database.pool_status()
+
+@router.get("/inventory")
+async def get_inventory_status():
+    """
+    Stock reservation counters, batch size and queue wait histograms for this worker.
+    """
+    return inventory.stats()
+
+@router.get("/admission")
+async def get_admission_status():
+    """
+    Concurrency slots in use, queue depth and refusals (429 by route budget, 503 by reason) for this worker.
+    """
+    return admission.stats()
+
+@router.get("/revocations")
+async def get_revocation_status():
+    """
+    Revoked ids held in memory, Bloom filter size and hit/false-positive counters for this worker.
+    """
+    return revocations.stats()
+
+@router.get("/changefeed")
+async def get_changefeed_status():
+    """
+    Change feed subscribers, events published and delivered, coalesced updates and dropped slow subscribers for this worker.
+    """
+    return changefeed.stats()
+
+@router.get("/idempotency")
+async def get_idempotency_status():
+    """
+    Idempotency keys in flight and POST requests with a key by outcome (stored, replayed, waited out, mismatched) for this worker.
+    """
+    return idempotency.stats()
\ No newline at end of file
@@ -0,0 +1,50 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import database, dependencies, sales, schemas
+from ..config import settings
+
+router = APIRouter(
+    prefix="/admin/sales",
+    tags=["Analytics"],
+    dependencies=[Depends(dependencies.require_admin)]
+)
+
+def _date_range(start: Optional[date], end: Optional[date]) -> Tuple[date, date]:
+    # Defaults to the last 30 days (UTC), today included.
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= settings.sales_max_range_days:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {settings.sales_max_range_days} days")
+    return start, end
+
+@router.get("/daily", response_model=List[schemas.SalesDayReport])
+async def get_daily_sales(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    category: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    Orders, revenue, units and cancellation rate per day (UTC) of orders placed from `start`
+    to `end` inclusive, days without orders included. With `category`, only the part of
+    each order in that category counts.
+    """
+    start, end = _date_range(start, end)
+    return await sales.daily(db, start, end, category)
+
+@router.get("/categories", response_model=List[schemas.SalesCategoryReport])
+async def get_category_sales(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    The same totals per product category (as of the order) over the date range, highest
+    revenue first. An order counts once in each category it contains.
+    """
+    start, end = _date_range(start, end)
+    return await sales.by_category(db, start, end)
\ No newline at end of file
@@ -1,20 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.future import select
-from datetime import timedelta
-from .. import models, schemas, utils, database, config, dependencies
-from ..email_utils import send_welcome_email
+from datetime import datetime, timedelta
+from .. import models, schemas, utils, database, config, dependencies, order_summaries
+from ..email_utils import queue_welcome_email
+from ..outbox import outbox_dispatcher
+from ..passwords import password_hasher, HasherBusy
+from ..revocation import revocations
 
 router = APIRouter(
     tags=["Authentication"]
 )
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user: schemas.UserCreate, 
-    background_tasks: BackgroundTasks, 
     db: AsyncSession = Depends(database.get_db)
 ):
     result = await db.execute(select(models.User).where(models.User.email == user.email))
@@ -26,7 +35,10 @@ async def register(
             detail="Email already registered"
         )
     
-    hashed_password = utils.get_password_hash(user.password)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HasherBusy:
+        raise _hasher_busy()
 
     new_user = models.User(
         email=user.email,
@@ -37,10 +49,11 @@ async def register(
     )
 
     db.add(new_user)
+    queue_welcome_email(db, new_user.email, new_user.username)
     await db.commit()
     await db.refresh(new_user)
 
-    background_tasks.add_task(send_welcome_email, new_user.email, new_user.username)
+    outbox_dispatcher.wake()
 
     return new_user
 
@@ -49,7 +62,14 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     result = await db.execute(select(models.User).where(models.User.email == form_data.username))
     user = result.scalars().first()
 
-    if not user or not utils.verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+        except HasherBusy:
+            raise _hasher_busy()
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -58,32 +78,90 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+
+    if new_hash:
+        # Stored hash uses outdated parameters; upgrade it now that we know the password.
+        user.hashed_password = new_hash
+        await db.commit()
     
+    return _issue_tokens(user, utils.new_token_id())
+
+def _issue_tokens(user: models.User, session_id: str) -> dict:
     access_token_expires = timedelta(minutes=config.settings.access_token_expire_minutes)
     access_token = utils.create_access_token(
-        data={"sub": str(user.id)},
+        data={"sub": str(user.id), "role": user.role, "sid": session_id},
         expires_delta=access_token_expires
     )
+    refresh_token, _ = utils.create_refresh_token(user.id, session_id)
+
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh(request: schemas.RefreshRequest, db: AsyncSession = Depends(database.get_db)):
+    """
+    Trade a refresh token for a new access/refresh pair, without the password. Each
+    refresh token works once; presenting a used one again ends its session.
+    """
+    payload = dependencies.decode_refresh_token(request.refresh_token)
+    user = await db.get(models.User, int(payload["sub"]))
+    if user is None or not user.is_active:
+        raise dependencies.credentials_exception
+
+    expires_at = datetime.utcfromtimestamp(payload["exp"])
+    if not await revocations.revoke(db, payload["jti"], expires_at):
+        session_expires = datetime.utcnow() + timedelta(days=config.settings.refresh_token_expire_days)
+        await revocations.revoke(db, payload["sid"], session_expires)
+        raise dependencies.credentials_exception
 
-    return {"access_token": access_token, "token_type": "bearer"}
+    return _issue_tokens(user, payload["sid"])
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(dependencies.oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
+    """
+    Revoke the session of this access token: its access and refresh tokens stop working.
+    """
+    payload = dependencies.decode_token(token)
+    if "sid" in payload:
+        expires_at = datetime.utcnow() + timedelta(days=config.settings.refresh_token_expire_days)
+        await revocations.revoke(db, payload["sid"], expires_at)
+    elif "jti" in payload:
+        await revocations.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+    return None
 
 @router.get("/me", response_model=schemas.UserProfile)
 async def read_users_me(
     current_user: models.User = Depends(dependencies.get_current_user),
-    db: AsyncSession = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
     """
-    Get current user profile with orders and address.
+    Get current user profile with address and an order summary. The orders themselves
+    are paginated under GET /orders/.
     """
     query = select(models.User).options(
-        selectinload(models.User.orders),
-        selectinload(models.User.address)
+        joinedload(models.User.address)
     ).where(models.User.id == current_user.id)
     
     result = await db.execute(query)
     user = result.scalars().first()
-    
-    return user
+    profile = schemas.UserProfile.model_validate(user)
+
+    summary = await order_summaries.get_summary(db, user.id)
+    last_order = None
+    if summary.last_order_id is not None:
+        last_order = schemas.OrderModel(
+            id=summary.last_order_id,
+            total_price=summary.last_order_total,
+            status=summary.last_order_status,
+            created_at=summary.last_order_at
+        )
+
+    profile.order_summary = schemas.OrderSummaryModel(
+        order_count=summary.order_count,
+        cancelled_count=summary.cancelled_count,
+        lifetime_spend=round(summary.lifetime_spend, 2),
+        last_order=last_order
+    )
+    return profile
 
 @router.post("/address", response_model=schemas.AddressModel)
 async def update_address(
@@ -0,0 +1,36 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+from .. import dependencies
+from ..changefeed import HubFull, changefeed
+
+router = APIRouter(
+    tags=["Events"]
+)
+
+@router.get("/events")
+async def change_feed(topics: str = "products,orders", token: Optional[str] = None):
+    """
+    Server-sent events for product, stock and catalog changes (`products`) and for the
+    caller's own orders (`orders`). EventSource cannot send headers, so pass the access
+    token as `token` to receive order events. A `reset` event means events were dropped:
+    refetch what is shown; the browser reconnects by itself.
+    """
+    user_id = None
+    if token:
+        user_id = (await dependencies.get_current_principal(token)).id
+
+    try:
+        subscriber = changefeed.subscribe(user_id, {topic.strip() for topic in topics.split(",")})
+    except HubFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many change feed subscribers",
+            headers={"Retry-After": "5"},
+        )
+
+    return StreamingResponse(
+        changefeed.hub.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
\ No newline at end of file
@@ -1,24 +1,59 @@
-from fastapi import APIRouter, UploadFile, File, Depends, status
-import shutil
-import os
-from .. import dependencies
+from typing import Literal
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from .. import dependencies, schemas
+from ..config import settings
+from ..images import image_variants, variant_url, VARIANTS, FORMATS, DIGEST_RE, ImageTooLarge, RendererUnavailable
+from ..storage import image_storage, UploadTooLarge, UnsupportedMediaType
 
 router = APIRouter(
     tags=["Files"]
 )
 
-IMAGEDIR = "app/static/images/"
-os.makedirs(IMAGEDIR, exist_ok=True)
-
 @router.post("/upload/", status_code=status.HTTP_201_CREATED)
 async def upload_image(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    current_user: int = Depends(dependencies.get_current_user)
+    current_user: schemas.Principal = Depends(dependencies.get_current_principal)
 ):
-    file_location = f"{IMAGEDIR}{file.filename}"
+    try:
+        stored = await image_storage.save(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedMediaType as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+
+    if settings.image_pregenerate and not stored.deduplicated:
+        background_tasks.add_task(image_variants.pregenerate, stored.digest)
+
+    return {
+        "url": stored.url,
+        "sha256": stored.digest,
+        "size": stored.size,
+        "deduplicated": stored.deduplicated,
+        "variants": {name: variant_url(stored.digest, name) for name in VARIANTS}
+    }
+
+@router.get("/variants/{digest}/{variant}.{fmt}")
+async def get_image_variant(digest: str, variant: str, fmt: Literal["webp", "jpg"]):
+    if variant not in VARIANTS or not DIGEST_RE.match(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
 
-    with open(file_location, "wb+") as file_object:
-        shutil.copyfileobj(file.file, file_object)
+    try:
+        path = await image_variants.get(digest, variant, fmt)
+    except ImageTooLarge:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Image too large to process")
+    except RendererUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image renderer unavailable, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
 
-    url = f"/static/images/{file.filename}"
-    return {"url": url}
\ No newline at end of file
+    return FileResponse(
+        path,
+        media_type=FORMATS[fmt][1],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
\ No newline at end of file
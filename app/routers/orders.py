@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from collections import Counter
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
-from .. import models, database, dependencies
+from .. import models, schemas, database, dependencies, pagination, order_summaries, sales
+from ..inventory import InsufficientStock, inventory, order_quantities
+from ..changefeed import changefeed, order_event, stock_event
+from ..config import settings
 
 router = APIRouter(
     prefix="/orders",
@@ -14,6 +20,42 @@ router = APIRouter(
 class OrderCreate(BaseModel):
     product_ids: List[int]
 
+# Newest first; the index on (user_id, created_at, id) serves both the filter and the order.
+ORDER_KEYSET = (models.Order.created_at, models.Order.id)
+
+@router.get("/", response_model=List[schemas.OrderModel])
+async def list_orders(
+    response: Response,
+    limit: int = Query(settings.default_page_size, ge=1, le=settings.max_page_size),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(dependencies.get_current_principal)
+):
+    """
+    The current user's orders, newest first. Pass the `X-Next-Cursor` header of the
+    previous page as `cursor` to continue.
+    """
+    query = select(
+        models.Order.id, models.Order.total_price, models.Order.status, models.Order.created_at
+    ).where(models.Order.user_id == current_user.id)
+
+    try:
+        after = None
+        if cursor:
+            created_at, order_id = pagination.decode_cursor(cursor, "created")
+            after = (datetime.fromisoformat(created_at), order_id)
+        query = pagination.apply_keyset(query, ORDER_KEYSET, after, descending=True)
+    except (pagination.InvalidCursor, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+
+    result = await db.execute(query.limit(limit + 1))
+    orders = result.all()
+    if len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor("created", [last.created_at.isoformat(), last.id])
+    return orders
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_order(
     order_data: OrderCreate,
@@ -21,30 +63,66 @@ async def create_order(
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
     # 1. Calculate Total Price (Server Side Security)
+    # Duplicate ids are quantities; all products are loaded with a single IN query.
+    quantities = Counter(order_data.product_ids)
+    result = await db.execute(
+        select(models.Product.id, models.Product.name, models.Product.price, models.Product.category)
+        .where(models.Product.id.in_(quantities))
+    )
+
+    line_items = []
+    sales_lines = []
+    reserved = {}
     total_price = 0.0
-    
-    # Check if products exist and sum price
-    # Note: In a real app, do this in one query using 'IN' clause
-    for pid in order_data.product_ids:
-        result = await db.execute(select(models.Product).where(models.Product.id == pid))
-        product = result.scalars().first()
-        if product:
-            total_price += product.price
+    for product_id, name, price, category in result.all():
+        quantity = quantities[product_id]
+        total_price += price * quantity
+        reserved[product_id] = quantity
+        sales_lines.append((category, price * quantity, quantity))
+        line_items.append({
+            "product_id": product_id,
+            "product_name": name,
+            "quantity": quantity,
+            "unit_price": price,
+        })
     
     if total_price == 0:
         raise HTTPException(status_code=400, detail="No valid products in order")
 
-    # 2. Create Order
-    new_order = models.Order(
-        user_id=current_user.id,
-        total_price=total_price,
-        status="Processing"
-    )
-    
-    db.add(new_order)
+    # 2. Reserve stock in its own short transaction, so the hot product rows are not
+    #    locked for the rest of this one. End the read transaction first: holding its
+    #    connection while waiting for the reservation's could exhaust the pool.
     await db.commit()
-    await db.refresh(new_order)
-    
+    try:
+        await inventory.reserve(reserved)
+    except InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    try:
+        # 3. Create Order
+        new_order = models.Order(
+            user_id=current_user.id,
+            total_price=total_price,
+            status="Processing"
+        )
+
+        db.add(new_order)
+        await db.flush()
+
+        # 4. Record line items with one bulk insert
+        for item in line_items:
+            item["order_id"] = new_order.id
+        await db.execute(insert(models.OrderItem), line_items)
+        await order_summaries.record_order(db, current_user.id, new_order.id, total_price, new_order.created_at)
+        await sales.record_order(db, new_order.id, new_order.created_at, total_price, sales_lines)
+
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        await inventory.release(reserved)
+        raise
+
+    await changefeed.publish(order_event(new_order.id, current_user.id, "Processing", total=total_price))
     return {"message": "Order created successfully", "order_id": new_order.id, "total": total_price}
 
 @router.patch("/{order_id}/cancel")
@@ -53,17 +131,38 @@ async def cancel_order(
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
-    # Fetch order and ensure it belongs to the user
-    result = await db.execute(select(models.Order).where(models.Order.id == order_id, models.Order.user_id == current_user.id))
-    order = result.scalars().first()
-
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    # Conditional update, so two concurrent cancels cannot both adjust the summary
+    result = await db.execute(
+        update(models.Order)
+        .where(
+            models.Order.id == order_id,
+            models.Order.user_id == current_user.id,
+            models.Order.status == "Processing"
+        )
+        .values(status="Cancelled")
+        .returning(models.Order.total_price, models.Order.created_at)
+    )
+    cancelled = result.first()
 
-    if order.status != "Processing":
+    if cancelled is None:
+        # Nothing changed: tell a missing (or someone else's) order from one that can't be cancelled
+        result = await db.execute(
+            select(models.Order.id).where(models.Order.id == order_id, models.Order.user_id == current_user.id)
+        )
+        if result.first() is None:
+            raise HTTPException(status_code=404, detail="Order not found")
         raise HTTPException(status_code=400, detail="Cannot cancel order that is already shipped or cancelled")
 
-    order.status = "Cancelled"
+    total_price = cancelled.total_price
+    await order_summaries.record_cancellation(db, current_user.id, order_id, total_price)
+    await sales.record_cancellation(db, order_id, cancelled.created_at, total_price)
+    quantities = await order_quantities(db, order_id)
+    released = await inventory.release_in(db, quantities)
     await db.commit()
+    await inventory.forget({pid: row.category for pid, row in released.items()})
+    await changefeed.publish(
+        order_event(order_id, current_user.id, "Cancelled", total=total_price),
+        *(stock_event(pid, row.stock) for pid, row in released.items())
+    )
     
     return {"message": "Order cancelled successfully"}
\ No newline at end of file
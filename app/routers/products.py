@@ -1,66 +1,253 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import and_
-from .. import models, schemas, database, dependencies
+from .. import models, schemas, database, dependencies, pagination, catalog_io, serialization, facets, bulk
+from ..config import settings
+from ..search import search_index
+from ..cache import product_cache
+from ..changefeed import changefeed, product_event
 
 router = APIRouter(
     tags=["Products"]
 )
 
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = {
+    "id": (models.Product.id,),
+    "category": (models.Product.category, models.Product.id),
+}
+
+def _event_fields(product: models.Product) -> dict:
+    return {"name": product.name, "price": product.price, "stock": product.stock, "category": product.category}
+
+def _json_response(body: bytes, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def _ranked_page(
+    db: AsyncSession,
+    query,
+    ranked_ids: List[int],
+    limit: Optional[int],
+    cursor: Optional[str]
+) -> Response:
+    # Search results are ordered by relevance, so pages are offsets into the (bounded) ranking.
+    try:
+        offset = pagination.decode_cursor(cursor, "rank")[0] if cursor else 0
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+
+    position = {product_id: i for i, product_id in enumerate(ranked_ids)}
+    result = await db.execute(query)
+    rows = sorted(result.all(), key=lambda row: position[row.id])
+
+    if limit is None:
+        return _json_response(serialization.products_json(rows))
+
+    headers = {}
+    if offset + limit < len(rows):
+        headers["X-Next-Cursor"] = pagination.encode_cursor("rank", [offset + limit])
+    return _json_response(serialization.products_json(rows[offset:offset + limit]), headers)
+
+async def fetch_page(db: AsyncSession, query, sort: str, limit: Optional[int]):
+    # With a limit: that many rows, plus the cursor of the next page if there is one.
+    headers = {}
+    if limit is None:
+        result = await db.execute(query)
+        rows = result.all()
+    else:
+        result = await db.execute(query.limit(limit + 1))
+        rows = result.all()
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            headers["X-Next-Cursor"] = pagination.encode_cursor(
+                sort, [getattr(last, column.key) for column in SORT_KEYS[sort]]
+            )
+    return rows, headers
+
 @router.get("/", response_model=List[schemas.ProductResponse])
 async def get_products(
+    request: Request,
     category: Optional[str] = None, 
     search: Optional[str] = None, 
-    db: AsyncSession = Depends(database.get_db)
+    limit: Optional[int] = Query(None, ge=1, le=settings.max_page_size),
+    cursor: Optional[str] = None,
+    sort: Literal["id", "category"] = "id",
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(database.get_read_db)
 ):
+    """
+    List products. Pass `limit` (and the `X-Next-Cursor` header of the previous page as `cursor`)
+    for keyset pagination, or `format=ndjson` to stream the result set in chunks.
+    """
+    if category in ["null", "undefined", "All Products", ""]:
+        category = None
+
+    cache_key = None
+    if format == "json" and not (search and search.strip()):
+        cache_key = await product_cache.list_key(category, sort, limit, cursor)
+        cached = await product_cache.get(cache_key)
+        if cached is not None:
+            return cached.to_response(request)
+
     filters = []
 
-    if category and category not in ["null", "undefined", "All Products"]:
+    if category:
         filters.append(models.Product.category == category)
 
+    ranked_ids = None
     if search and search.strip():
-        search_term = f"%{search.strip()}%"
-        filters.append(models.Product.name.ilike(search_term))
+        ranked_ids = await search_index.search(db, search.strip(), settings.search_max_results)
+        filters.append(models.Product.id.in_(ranked_ids))
     
-    query = select(models.Product)
+    # Plain columns, not ORM entities: rows are serialized straight to JSON.
+    query = select(*serialization.PRODUCT_COLUMNS)
     if filters:
         query = query.where(and_(*filters))
 
-    print(f"Applying Filters: {filters}")
-    
-    result = await db.execute(query)
-    return result.scalars().all()
+    logger.debug(
+        "Listing products",
+        extra={"category": category, "search": search, "limit": limit, "sort": sort, "format": format}
+    )
+
+    if cursor and limit is None:
+        limit = settings.default_page_size
+
+    if ranked_ids is not None and format == "json":
+        return await _ranked_page(db, query, ranked_ids, limit, cursor)
+
+    sort_columns = SORT_KEYS[sort]
+    try:
+        after = pagination.decode_cursor(cursor, sort) if cursor else None
+        query = pagination.apply_keyset(query, sort_columns, after)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        if limit is not None:
+            query = query.limit(limit)
+        return StreamingResponse(
+            pagination.stream_ndjson(query, serialization.product_line, settings.stream_chunk_size),
+            media_type="application/x-ndjson"
+        )
+
+    rows, headers = await fetch_page(db, query, sort, limit)
+    entry = await product_cache.put(cache_key, serialization.products_json(rows), headers)
+    return entry.to_response(request)
 
 
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_products(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    mode: Literal["upsert", "insert"] = "upsert",
+    db: AsyncSession = Depends(database.get_db),
+    _: schemas.Principal = Depends(dependencies.require_admin)
+):
+    """
+    Bulk import from CSV or NDJSON (admins only). Upserts match existing products by name;
+    invalid rows, and rows whose name several products share, are listed in the report and skipped.
+    """
+    fmt = format or catalog_io.detect_format(file.filename, file.content_type)
+    return await catalog_io.import_products(db, file.file, fmt, mode)
+
+@router.get("/export")
+async def export_products(
+    format: Literal["csv", "ndjson"] = "csv",
+    _: schemas.Principal = Depends(dependencies.get_current_principal)
+):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        catalog_io.export_products(format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
+
+@router.post("/bulk/update", response_model=schemas.BulkResult)
+async def bulk_update_products(
+    request: schemas.BulkProductUpdate,
+    db: AsyncSession = Depends(database.get_db),
+    principal: schemas.Principal = Depends(dependencies.require_admin)
+):
+    """
+    Apply the same changes to every product matching `where` (ids and/or filters), e.g.
+    `{"where": {"category": "Laptops"}, "changes": {"price_factor": 0.9}}`.
+    """
+    report = await bulk.bulk_update(db, request.where, request.changes)
+    logger.info("Bulk product update", extra={"user_id": principal.id, "affected": report.affected})
+    return report
+
+@router.post("/bulk/delete", response_model=schemas.BulkResult)
+async def bulk_delete_products(
+    selector: schemas.ProductSelector,
+    db: AsyncSession = Depends(database.get_db),
+    principal: schemas.Principal = Depends(dependencies.require_admin)
+):
+    report = await bulk.bulk_delete(db, selector)
+    logger.info("Bulk product delete", extra={"user_id": principal.id, "affected": report.affected})
+    return report
+
+@router.get("/facets", response_model=schemas.CatalogFacets)
+async def get_facets(
+    search: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    Product counts, in-stock counts and min/max/average price per category, over the whole
+    catalog or over the products matching `search`.
+    """
+    product_ids = None
+    if search and search.strip():
+        product_ids = await search_index.search(db, search.strip(), settings.search_max_results)
+    return await facets.get_facets(db, product_ids)
+
 @router.get("/{product_id}", response_model=schemas.ProductResponse)
-async def get_product(product_id: int, db: AsyncSession = Depends(database.get_db)):
-    result = await db.execute(select(models.Product).where(models.Product.id == product_id))
-    product = result.scalars().first()
-    if not product:
+async def get_product(product_id: int, request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    cache_key = product_cache.product_key(product_id)
+    cached = await product_cache.get(cache_key)
+    if cached is not None:
+        return cached.to_response(request)
+
+    result = await db.execute(select(*serialization.PRODUCT_COLUMNS).where(models.Product.id == product_id))
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+
+    entry = await product_cache.put(cache_key, serialization.product_json(row))
+    return entry.to_response(request)
 
 @router.post("/", response_model=schemas.ProductResponse, status_code=status.HTTP_201_CREATED)
 async def create_product(
     product: schemas.ProductCreate,
     db: AsyncSession = Depends(database.get_db),
-    _: models.User = Depends(dependencies.get_current_user)
+    _: schemas.Principal = Depends(dependencies.get_current_principal)
 ):
-    print(f"--- SAVING PRODUCT: {product.name} in CATEGORY: {product.category} ---")
     new_product = models.Product(**product.dict())
 
     db.add(new_product)
+    await db.flush()
+    await facets.record_added(db, new_product.category, new_product.price, new_product.stock)
     await db.commit()
     await db.refresh(new_product)
+    search_index.add(new_product)
+    logger.info("Product created", extra={"product_id": new_product.id, "category": new_product.category})
+    await product_cache.invalidate(categories=[new_product.category])
+    await changefeed.publish(product_event("created", new_product.id, **_event_fields(new_product)))
     return new_product
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_product(
     product_id: int,
     db: AsyncSession = Depends(database.get_db),
-    _: models.User =  Depends(dependencies.get_current_user)
+    _: schemas.Principal = Depends(dependencies.get_current_principal)
 ):
     result = await db.execute(select(models.Product).where(models.Product.id == product_id))
     product = result.scalars().first()
@@ -69,7 +256,12 @@ async def delete_product(
         raise HTTPException(status_code=404, detail="Product not found")
     
     await db.delete(product)
+    await db.flush()
+    await facets.record_removed(db, product.category, product.price, product.stock)
     await db.commit()
+    search_index.remove(product_id)
+    await product_cache.invalidate([product_id], [product.category])
+    await changefeed.publish(product_event("deleted", product_id, category=product.category))
     return None
 
 @router.patch("/{product_id}", response_model=schemas.ProductResponse)
@@ -77,7 +269,7 @@ async def update_product(
     product_id: int,
     product_update: schemas.ProductUpdate, 
     db: AsyncSession = Depends(database.get_db),
-    _: models.User = Depends(dependencies.get_current_user)
+    _: schemas.Principal = Depends(dependencies.get_current_principal)
 ):
     result = await db.execute(select(models.Product).where(models.Product.id == product_id))
     db_product = result.scalars().first()
@@ -86,10 +278,17 @@ async def update_product(
         raise HTTPException(status_code=404, detail="Product not found")
     
     update_data = product_update.dict(exclude_unset=True)
+    previous_category = db_product.category
+    before = (db_product.category, db_product.price, db_product.stock)
 
     for key, value in update_data.items():
         setattr(db_product, key, value)
     
+    await db.flush()
+    await facets.record_changed(db, before, (db_product.category, db_product.price, db_product.stock))
     await db.commit()
     await db.refresh(db_product)
+    search_index.add(db_product)
+    await product_cache.invalidate([product_id], [previous_category, db_product.category])
+    await changefeed.publish(product_event("updated", product_id, **_event_fields(db_product)))
     return db_product
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+Sales analytics (orders, revenue, units and cancellation rate by day and by category),
+read from incrementally maintained rollups behind `/admin/sales/...`.
+
+`create_order` and `cancel_order` add to the rollup rows of the order's day (UTC) in the
+same transaction as the order change: one upsert for the day and one for its categories.
+An order counts once in every category it contains. Its amount and units per category
+are kept in `order_category_totals`, so a cancellation comes off the buckets the order
+was counted in even if its products changed category since. Cancellations count against
+the day the order was placed: a day's cancellation rate is the share of that day's
+orders later cancelled. Revenue and units exclude cancelled orders.
+
+Every bucket is spread over `sales_rollup_shards` rows, picked by order id, so concurrent
+orders rarely wait for each other's row lock; reads add the shards up. A report reads at
+most days x categories x shards rows, however many orders there are.
+
+The rebuild recomputes the rollups from the orders table in chunks of order ids, with
+GROUP BY queries per chunk. Orders placed before the rollups existed get their category
+totals from their line items and the products' current categories. Order history that
+predates the rollups is rebuilt once at startup; `python -m app.serve` does it in the
+parent before forking, while no order can be recorded concurrently, and the workers skip it.
+
+    python -m app.sales rebuild [--chunk-size N]
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, exists, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+from .facets import UNCATEGORIZED
+
+CANCELLED = "Cancelled"
+MEASURES = ("order_count", "cancelled_count", "revenue", "cancelled_revenue", "units")
+# Rollups known to exist in this process (or in the parent it was forked from).
+_built = False
+INSERT_BATCH = 1000
+
+orders = models.Order.__table__
+items = models.OrderItem.__table__
+products = models.Product.__table__
+category_totals = models.OrderCategoryTotal.__table__
+
+# (category, amount, units) of one line of an order.
+Line = Tuple[Optional[str], float, int]
+
+
+def _shard(order_id: int) -> int:
+    return order_id % max(settings.sales_rollup_shards, 1)
+
+
+def _day(value) -> date:
+    # SQLite's date() returns text.
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _keys(model) -> List[str]:
+    return [column.key for column in model.__table__.primary_key.columns]
+
+
+async def _add(db: AsyncSession, model, rows: List[dict]) -> None:
+    """
+    Add each row's measures to its bucket, creating buckets as needed. Rows are applied in
+    key order, so concurrent orders lock shared buckets in the same order.
+    """
+    table, keys = model.__table__, _keys(model)
+    rows = sorted(rows, key=lambda row: tuple(row[key] for key in keys))
+    dialect = db.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        statement = (postgresql if dialect == "postgresql" else sqlite).insert(table).values(rows)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={measure: table.c[measure] + statement.excluded[measure] for measure in MEASURES},
+        ))
+        return
+
+    for row in rows:
+        result = await db.execute(
+            update(table)
+            .where(*(table.c[key] == row[key] for key in keys))
+            .values({measure: table.c[measure] + row[measure] for measure in MEASURES})
+        )
+        if result.rowcount == 0:
+            await db.execute(insert(table).values(**row))
+
+
+def _bucket(keys: dict, **measures) -> dict:
+    return {**keys, **{measure: measures.get(measure, 0) for measure in MEASURES}}
+
+
+async def record_order(db: AsyncSession, order_id: int, created_at: datetime, total: float, lines: Iterable[Line]) -> None:
+    """
+    Count a new order. Call after the order has been flushed, before the commit.
+    """
+    by_category: Dict[str, List] = {}
+    for category, amount, units in lines:
+        entry = by_category.setdefault(UNCATEGORIZED if category is None else category, [0.0, 0])
+        entry[0] += amount
+        entry[1] += units
+    if not by_category:
+        return
+
+    await db.execute(insert(models.OrderCategoryTotal), [
+        {"order_id": order_id, "category": category, "amount": amount, "units": units}
+        for category, (amount, units) in by_category.items()
+    ])
+    keys = {"day": _day(created_at), "shard": _shard(order_id)}
+    units = sum(units for _, units in by_category.values())
+    await _add(db, models.SalesDay, [_bucket(keys, order_count=1, revenue=total, units=units)])
+    await _add(db, models.SalesDayCategory, [
+        _bucket({**keys, "category": category}, order_count=1, revenue=amount, units=units)
+        for category, (amount, units) in by_category.items()
+    ])
+
+
+async def record_cancellation(db: AsyncSession, order_id: int, created_at: datetime, total: float) -> None:
+    result = await db.execute(
+        select(category_totals.c.category, category_totals.c.amount, category_totals.c.units)
+        .where(category_totals.c.order_id == order_id)
+    )
+    lines = result.all()
+    keys = {"day": _day(created_at), "shard": _shard(order_id)}
+    units = sum(line.units for line in lines)
+    await _add(db, models.SalesDay, [
+        _bucket(keys, cancelled_count=1, revenue=-total, cancelled_revenue=total, units=-units)
+    ])
+    if lines:
+        await _add(db, models.SalesDayCategory, [
+            _bucket({**keys, "category": line.category}, cancelled_count=1, revenue=-line.amount,
+                    cancelled_revenue=line.amount, units=-line.units)
+            for line in lines
+        ])
+
+
+def _report(row, **keys) -> dict:
+    order_count = row.order_count if row is not None else 0
+    cancelled_count = row.cancelled_count if row is not None else 0
+    return {
+        **keys,
+        "order_count": order_count,
+        "cancelled_count": cancelled_count,
+        "cancellation_rate": round(cancelled_count / order_count, 4) if order_count else 0.0,
+        "revenue": round(row.revenue, 2) if row is not None else 0.0,
+        "cancelled_revenue": round(row.cancelled_revenue, 2) if row is not None else 0.0,
+        "units": row.units if row is not None else 0,
+    }
+
+
+def _sums(model):
+    return [func.sum(getattr(model, measure)).label(measure) for measure in MEASURES]
+
+
+async def daily(db: AsyncSession, start: date, end: date, category: Optional[str] = None) -> List[dict]:
+    """
+    One entry per day from `start` to `end` inclusive, days without orders included.
+    With `category`, only orders (and the part of them) in that category count.
+    """
+    model = models.SalesDay if category is None else models.SalesDayCategory
+    query = select(model.day, *_sums(model)).where(model.day >= start, model.day <= end).group_by(model.day)
+    if category is not None:
+        query = query.where(model.category == category)
+    rows = {_day(row.day): row for row in (await db.execute(query)).all()}
+
+    days = (end - start).days + 1
+    return [_report(rows.get(day), day=day) for day in (start + timedelta(days=n) for n in range(days))]
+
+
+async def by_category(db: AsyncSession, start: date, end: date) -> List[dict]:
+    """
+    Totals per category over `start` to `end` inclusive, highest revenue first.
+    """
+    model = models.SalesDayCategory
+    result = await db.execute(
+        select(model.category, *_sums(model))
+        .where(model.day >= start, model.day <= end)
+        .group_by(model.category)
+    )
+    reports = [
+        _report(row, category=None if row.category == UNCATEGORIZED else row.category)
+        for row in result.all() if row.order_count
+    ]
+    return sorted(reports, key=lambda report: (-report["revenue"], report["category"] or ""))
+
+
+async def _backfill_category_totals(db: AsyncSession, low: int, high: int) -> None:
+    """
+    Category totals for orders with ids in [low, high) that have none yet.
+    """
+    category = func.coalesce(products.c.category, UNCATEGORIZED)
+    await db.execute(insert(category_totals).from_select(
+        ["order_id", "category", "amount", "units"],
+        select(items.c.order_id, category, func.sum(items.c.unit_price * items.c.quantity), func.sum(items.c.quantity))
+        .select_from(items.outerjoin(products, products.c.id == items.c.product_id))
+        .where(
+            items.c.order_id >= low,
+            items.c.order_id < high,
+            ~exists().where(category_totals.c.order_id == items.c.order_id),
+        )
+        .group_by(items.c.order_id, category)
+    ))
+
+
+def _chunk_aggregates(low: int, high: int, shards: int):
+    cancelled = orders.c.status == CANCELLED
+    day = func.date(orders.c.created_at).label("day")
+    shard = (orders.c.id % shards).label("shard")
+    in_chunk = (orders.c.id >= low, orders.c.id < high)
+
+    order_units = (
+        select(category_totals.c.order_id, func.sum(category_totals.c.units).label("units"))
+        .where(category_totals.c.order_id >= low, category_totals.c.order_id < high)
+        .group_by(category_totals.c.order_id)
+        .subquery()
+    )
+    units = func.coalesce(order_units.c.units, 0)
+    per_day = (
+        select(
+            day, shard,
+            func.count(orders.c.id).label("order_count"),
+            func.sum(case((cancelled, 1), else_=0)).label("cancelled_count"),
+            func.sum(case((cancelled, 0.0), else_=func.coalesce(orders.c.total_price, 0.0))).label("revenue"),
+            func.sum(case((cancelled, func.coalesce(orders.c.total_price, 0.0)), else_=0.0)).label("cancelled_revenue"),
+            func.sum(case((cancelled, 0), else_=units)).label("units"),
+        )
+        .select_from(orders.outerjoin(order_units, order_units.c.order_id == orders.c.id))
+        .where(*in_chunk)
+        .group_by(day, shard)
+    )
+    per_category = (
+        select(
+            day, category_totals.c.category, shard,
+            func.count(orders.c.id).label("order_count"),
+            func.sum(case((cancelled, 1), else_=0)).label("cancelled_count"),
+            func.sum(case((cancelled, 0.0), else_=category_totals.c.amount)).label("revenue"),
+            func.sum(case((cancelled, category_totals.c.amount), else_=0.0)).label("cancelled_revenue"),
+            func.sum(case((cancelled, 0), else_=category_totals.c.units)).label("units"),
+        )
+        .select_from(category_totals.join(orders, orders.c.id == category_totals.c.order_id))
+        .where(*in_chunk)
+        .group_by(day, category_totals.c.category, shard)
+    )
+    return per_day, per_category
+
+
+def _accumulate(buckets: Dict[tuple, dict], keys: dict, row) -> None:
+    bucket = buckets.setdefault(tuple(keys.values()), _bucket(keys))
+    for measure in MEASURES:
+        bucket[measure] += getattr(row, measure) or 0
+
+
+async def rebuild(db: AsyncSession, chunk_size: Optional[int] = None) -> int:
+    """
+    Recompute the rollups from the orders table, `chunk_size` order ids at a time.
+    Returns the number of days with orders. Meant for backfills and repairs while no
+    orders are being placed.
+    """
+    chunk_size = chunk_size or settings.sales_rebuild_chunk_size
+    shards = max(settings.sales_rollup_shards, 1)
+    low, high = (await db.execute(select(func.min(orders.c.id), func.max(orders.c.id)))).one()
+
+    days: Dict[tuple, dict] = {}
+    categories: Dict[tuple, dict] = {}
+    for start in range(low or 0, (high or -1) + 1, chunk_size):
+        await _backfill_category_totals(db, start, start + chunk_size)
+        await db.commit()
+        per_day, per_category = _chunk_aggregates(start, start + chunk_size, shards)
+        for row in (await db.execute(per_day)).all():
+            _accumulate(days, {"day": _day(row.day), "shard": row.shard}, row)
+        for row in (await db.execute(per_category)).all():
+            _accumulate(categories, {"day": _day(row.day), "category": row.category, "shard": row.shard}, row)
+
+    await db.execute(delete(models.SalesDay))
+    await db.execute(delete(models.SalesDayCategory))
+    for model, buckets in ((models.SalesDay, days), (models.SalesDayCategory, categories)):
+        rows = list(buckets.values())
+        for offset in range(0, len(rows), INSERT_BATCH):
+            await db.execute(insert(model), rows[offset:offset + INSERT_BATCH])
+    await db.commit()
+    return len({day for day, _ in days})
+
+
+async def ensure_built(db: AsyncSession) -> None:
+    """
+    Build the rollups once for order history that predates them.
+    """
+    global _built
+    if _built:
+        return
+    if await db.scalar(select(models.SalesDay.day).limit(1)) is None \
+            and await db.scalar(select(models.Order.id).limit(1)) is not None:
+        try:
+            await rebuild(db)
+        except IntegrityError:
+            # Another process built them first.
+            await db.rollback()
+    _built = True
+
+
+async def _run_rebuild(chunk_size: Optional[int]) -> None:
+    async with AsyncSessionLocal() as db:
+        count = await rebuild(db, chunk_size)
+    print(f"Rebuilt sales rollups for {count} days")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the sales analytics rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = commands.add_parser("rebuild", help="Recompute the rollups from the orders table")
+    rebuild_parser.add_argument("--chunk-size", type=int, default=None, help="Order ids aggregated per query")
+    args = parser.parse_args()
+    asyncio.run(_run_rebuild(args.chunk_size))
+
+
+if __name__ == "__main__":
+    main()
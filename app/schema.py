@@ -0,0 +1,96 @@
+"""
+Schema setup that runs once per deployment instead of in every worker.
+
+`create_all` inspects every table each time it runs. Instead, the models are reduced to a
+fingerprint (a hash of their DDL for the connected dialect, plus the search backend) and
+compared with the one stored when the schema was last created; only a mismatch runs
+`create_all`, creates any model index that is missing (`create_all` skips the indexes of
+tables that already exist) and runs the search index setup. Existing tables and indexes
+are never altered.
+
+`python -m app.serve` verifies the schema in the parent before forking, and the workers
+skip the check; a process started any other way checks the stored fingerprint itself,
+which is one query.
+
+    python -m app.schema            # verify, create what is missing
+    python -m app.schema --force    # run create_all even if the fingerprint matches
+"""
+import argparse
+import asyncio
+import hashlib
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from . import models
+from .database import Base, engine
+from .search import search_index
+
+# Fingerprint verified by this process (or by the parent it was forked from).
+_verified: Optional[str] = None
+
+
+def fingerprint(dialect) -> str:
+    digest = hashlib.sha256(search_index.name.encode())
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return digest.hexdigest()[:32]
+
+
+async def stored_fingerprint(target: AsyncEngine) -> Optional[str]:
+    try:
+        async with target.connect() as conn:
+            return await conn.scalar(select(models.SchemaFingerprint.fingerprint).limit(1))
+    except DBAPIError:
+        # No fingerprint table yet.
+        return None
+
+
+async def ensure_schema(target: AsyncEngine = engine, force: bool = False) -> bool:
+    """
+    Make sure the schema matches the models. Returns True if the tables and indexes had to be checked.
+    """
+    global _verified
+    current = fingerprint(target.dialect)
+    if not force and (_verified == current or await stored_fingerprint(target) == current):
+        _verified = current
+        return False
+
+    async with target.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # Reflection cannot see expression indexes, so let the database skip existing ones.
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.execute(CreateIndex(index, if_not_exists=True))
+        await search_index.setup(conn)
+        await conn.execute(delete(models.SchemaFingerprint))
+        await conn.execute(insert(models.SchemaFingerprint).values(fingerprint=current, applied_at=datetime.utcnow()))
+    _verified = current
+    return True
+
+
+async def _run(force: bool) -> None:
+    started = time.perf_counter()
+    created = await ensure_schema(force=force)
+    await engine.dispose()
+    action = "Checked tables and indexes, created any missing" if created else "Schema up to date"
+    print(f"{action} (fingerprint {fingerprint(engine.dialect)}, {time.perf_counter() - started:.3f}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verify the database schema against the models")
+    parser.add_argument("--force", action="store_true", help="Run create_all even if the fingerprint matches")
+    args = parser.parse_args()
+    asyncio.run(_run(args.force))
+
+
+if __name__ == "__main__":
+    main()
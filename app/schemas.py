@@ -1,16 +1,25 @@
-from pydantic import BaseModel, EmailStr, Field, ConfigDict, field_validator
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, field_validator, model_validator, computed_field
+from typing import Optional, List, Dict
 import re
-from datetime import datetime
+from datetime import date, datetime
+from .images import variant_urls
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+class Principal(BaseModel):
+    id: int
+    role: Optional[str] = None
+
 class ProductBase(BaseModel):
     name: str = Field(..., min_length=2, max_length=50, description="Product name must be between 2 and 50 characters")
     description: Optional[str] = None
@@ -36,6 +45,91 @@ class ProductResponse(ProductBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
 
+    @computed_field
+    @property
+    def image_variants(self) -> Optional[Dict[str, str]]:
+        return variant_urls(self.image_url)
+
+class ProductSelector(BaseModel):
+    ids: Optional[List[int]] = None
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_stock: Optional[int] = None
+    max_stock: Optional[int] = None
+
+    @model_validator(mode='after')
+    def require_criteria(self):
+        if all(value is None for value in self.__dict__.values()):
+            raise ValueError('Select products by ids or at least one filter')
+        return self
+
+class ProductBulkChanges(BaseModel):
+    price: Optional[float] = Field(None, gt=0)
+    price_factor: Optional[float] = Field(None, gt=0, description="Multiply prices, e.g. 0.9 for 10% off")
+    stock: Optional[int] = Field(None, ge=0)
+    category: Optional[str] = None
+    description: Optional[str] = None
+    specs: Optional[str] = None
+    image_url: Optional[str] = None
+
+    @model_validator(mode='after')
+    def validate_changes(self):
+        if self.price is not None and self.price_factor is not None:
+            raise ValueError('Set either price or price_factor, not both')
+        if not self.model_fields_set:
+            raise ValueError('No changes given')
+        return self
+
+class BulkProductUpdate(BaseModel):
+    where: ProductSelector
+    changes: ProductBulkChanges
+
+class BulkResult(BaseModel):
+    affected: int = 0
+    chunks: int = 0
+
+class CategoryFacet(BaseModel):
+    category: Optional[str] = None
+    product_count: int
+    in_stock_count: int
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    avg_price: Optional[float] = None
+
+class CatalogFacets(BaseModel):
+    product_count: int
+    in_stock_count: int
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    avg_price: Optional[float] = None
+    categories: List[CategoryFacet]
+
+class SalesBucket(BaseModel):
+    order_count: int
+    cancelled_count: int
+    cancellation_rate: float
+    revenue: float
+    cancelled_revenue: float
+    units: int
+
+class SalesDayReport(SalesBucket):
+    day: date
+
+class SalesCategoryReport(SalesBucket):
+    category: Optional[str] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ImportReport(BaseModel):
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+
 class UserBase(BaseModel):
     username: str = Field(..., min_length=2, max_length=50)
 
@@ -84,11 +178,17 @@ class OrderModel(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+class OrderSummaryModel(BaseModel):
+    order_count: int = 0
+    cancelled_count: int = 0
+    lifetime_spend: float = 0.0
+    last_order: Optional[OrderModel] = None
+
 class UserProfile(UserBase):
     id: int
     email: EmailStr
     role: str
     address: Optional[AddressModel] = None
-    orders: List[OrderModel] = []
+    order_summary: OrderSummaryModel = OrderSummaryModel()
 
     model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
@@ -0,0 +1,263 @@
+import math
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .config import settings
+from .database import engine
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "category": 2.0,
+    "specs": 1.0,
+    "description": 1.0,
+}
+
+PREFIX_WEIGHT = 0.7
+FUZZY_WEIGHT = 0.4
+MIN_TRIGRAM_SIMILARITY = 0.3
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return TOKEN_RE.findall(value.lower())
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchBackend:
+    """
+    Interface shared by all search backends. `search` returns product ids, best match first.
+    """
+    name = "base"
+
+    async def setup(self, conn: AsyncConnection) -> None:
+        pass
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        pass
+
+    def add(self, product: models.Product) -> None:
+        pass
+
+    def remove(self, product_id: int) -> None:
+        pass
+
+    async def search(self, db: AsyncSession, term: str, limit: int) -> List[int]:
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    The original `name ILIKE '%term%'` scan. Kept as a fallback and as the benchmark baseline.
+    """
+    name = "like"
+
+    async def search(self, db: AsyncSession, term: str, limit: int) -> List[int]:
+        result = await db.execute(
+            select(models.Product.id)
+            .where(models.Product.name.ilike(f"%{term}%"))
+            .order_by(models.Product.id)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+
+class MemorySearchBackend(SearchBackend):
+    """
+    In-process inverted index over name, category, specs and description.
+
+    Query tokens match exactly, by prefix, or (when neither hits) by trigram similarity.
+    Every query token must match for a product to be returned; scores are field-weighted
+    and scaled by inverse document frequency.
+    """
+    name = "memory"
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._documents: Dict[int, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._trigram_index: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        self.__init__()
+        result = await db.stream_scalars(
+            select(models.Product).execution_options(yield_per=settings.stream_chunk_size)
+        )
+        async for partition in result.partitions():
+            for product in partition:
+                self.add(product)
+
+    def add(self, product: models.Product) -> None:
+        self.remove(product.id)
+
+        weights: Dict[str, float] = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(getattr(product, field)):
+                weights[token] += weight
+
+        for token, weight in weights.items():
+            if token not in self._postings:
+                insort(self._vocabulary, token)
+                for gram in trigrams(token):
+                    self._trigram_index[gram].add(token)
+            self._postings[token][product.id] = weight
+
+        self._documents[product.id] = set(weights)
+
+    def remove(self, product_id: int) -> None:
+        tokens = self._documents.pop(product_id, None)
+        if not tokens:
+            return
+
+        for token in tokens:
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if postings:
+                continue
+
+            del self._postings[token]
+            index = bisect_left(self._vocabulary, token)
+            if index < len(self._vocabulary) and self._vocabulary[index] == token:
+                del self._vocabulary[index]
+            for gram in trigrams(token):
+                bucket = self._trigram_index.get(gram)
+                if bucket is not None:
+                    bucket.discard(token)
+                    if not bucket:
+                        del self._trigram_index[gram]
+
+    def _expand(self, query_token: str) -> Dict[str, float]:
+        expansions: Dict[str, float] = {}
+
+        if query_token in self._postings:
+            expansions[query_token] = 1.0
+
+        index = bisect_left(self._vocabulary, query_token)
+        while index < len(self._vocabulary) and self._vocabulary[index].startswith(query_token):
+            expansions.setdefault(self._vocabulary[index], PREFIX_WEIGHT)
+            index += 1
+
+        if expansions or len(query_token) < 3:
+            return expansions
+
+        query_grams = trigrams(query_token)
+        overlap: Dict[str, int] = defaultdict(int)
+        for gram in query_grams:
+            for token in self._trigram_index.get(gram, ()):
+                overlap[token] += 1
+
+        for token, shared in overlap.items():
+            similarity = shared / (len(query_grams) + len(trigrams(token)) - shared)
+            if similarity >= MIN_TRIGRAM_SIMILARITY:
+                expansions[token] = FUZZY_WEIGHT * similarity
+
+        return expansions
+
+    def rank(self, term: str, limit: int) -> List[int]:
+        query_tokens = list(dict.fromkeys(tokenize(term)))
+        if not query_tokens or not self._documents:
+            return []
+
+        total = len(self._documents)
+        scores: Optional[Dict[int, float]] = None
+
+        for query_token in query_tokens:
+            token_scores: Dict[int, float] = {}
+            for token, match_weight in self._expand(query_token).items():
+                postings = self._postings[token]
+                idf = math.log(1 + total / len(postings))
+                for product_id, field_weight in postings.items():
+                    score = match_weight * field_weight * idf
+                    if score > token_scores.get(product_id, 0.0):
+                        token_scores[product_id] = score
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores}
+
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, _ in ranked[:limit]]
+
+    async def search(self, db: AsyncSession, term: str, limit: int) -> List[int]:
+        return self.rank(term, limit)
+
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(specs, '') || ' ' || coalesce(description, '')), 'C')"
+)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Full-text search on a weighted tsvector expression index, with pg_trgm similarity
+    on the name as a typo-tolerant fallback. The database keeps both indexes current,
+    so `add`/`remove` are no-ops.
+    """
+    name = "postgres"
+
+    async def setup(self, conn: AsyncConnection) -> None:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (({SEARCH_VECTOR}))"
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)"
+        ))
+
+    async def search(self, db: AsyncSession, term: str, limit: int) -> List[int]:
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+
+        ts_query = " & ".join(f"{token}:*" for token in tokens)
+        result = await db.execute(
+            text(
+                f"SELECT id FROM products "
+                f"WHERE ({SEARCH_VECTOR}) @@ to_tsquery('simple', :ts_query) OR name % :term "
+                f"ORDER BY ts_rank(({SEARCH_VECTOR}), to_tsquery('simple', :ts_query)) "
+                f"+ similarity(name, :term) DESC, id "
+                f"LIMIT :limit"
+            ),
+            {"ts_query": ts_query, "term": " ".join(tokens), "limit": limit}
+        )
+        return list(result.scalars().all())
+
+
+BACKENDS = {
+    LikeSearchBackend.name: LikeSearchBackend,
+    MemorySearchBackend.name: MemorySearchBackend,
+    PostgresSearchBackend.name: PostgresSearchBackend,
+}
+
+
+def create_backend(name: str, dialect: str) -> SearchBackend:
+    if name == "auto":
+        name = "postgres" if dialect == "postgresql" else "memory"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown search backend: {name}")
+    return BACKENDS[name]()
+
+
+search_index = create_backend(settings.search_backend, engine.dialect.name)
@@ -0,0 +1,38 @@
+"""
+Column-level read path for products.
+
+Catalog reads select plain columns and turn the Core rows straight into JSON bytes with
+orjson, skipping ORM identities and pydantic validation. The output has the same fields,
+in the same order, as `schemas.ProductResponse`.
+"""
+from typing import Any, Iterable, Sequence
+
+import orjson
+
+from . import models
+from .images import variant_urls
+
+PRODUCT_FIELDS = ("name", "description", "specs", "price", "stock", "image_url", "category", "id")
+PRODUCT_COLUMNS = [getattr(models.Product, name) for name in PRODUCT_FIELDS]
+
+
+def product_dict(row: Sequence[Any]) -> dict:
+    data = dict(zip(PRODUCT_FIELDS, row))
+    data["image_variants"] = variant_urls(data["image_url"])
+    return data
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value)
+
+
+def product_json(row: Sequence[Any]) -> bytes:
+    return orjson.dumps(product_dict(row))
+
+
+def product_line(row: Sequence[Any]) -> bytes:
+    return orjson.dumps(product_dict(row), option=orjson.OPT_APPEND_NEWLINE)
+
+
+def products_json(rows: Iterable[Sequence[Any]]) -> bytes:
+    return orjson.dumps([product_dict(row) for row in rows])
@@ -0,0 +1,225 @@
+"""
+Production server: pre-forked uvicorn workers sharing one listening socket.
+
+    python -m app.serve --host 0.0.0.0 --port 5000 [--workers N]
+
+The parent imports the application once, verifies the schema (see schema.py) and the mail
+settings, builds the sales rollups if they are missing (see sales.py), closes its database
+connections, binds the socket and forks the workers (WEB_CONCURRENCY, or one per CPU).
+Workers inherit the imported modules copy-on-write instead of importing them again, and
+skip the schema check and the rollup build. Each worker runs the app lifespan (search
+index, category statistics, revocations, connection pool and listing cache warm-up)
+before it accepts a connection, then logs how long it took from the fork and its memory;
+both are also exported on /metrics.
+
+Several workers need the response cache and Idempotency-Key replays in a store they all
+share (CACHE_BACKEND=redis, IDEMPOTENCY_BACKEND=redis, see CACHE_URL): with "memory" each
+worker would keep serving entries another worker invalidated, and replay only the keys it
+saw itself, so the server refuses to start that way.
+
+The parent restarts workers that exit unexpectedly and passes SIGTERM/SIGINT on to them
+for a graceful shutdown. `uvicorn app.main:app --reload` remains the development server.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from . import instrumentation, sales
+from .config import settings
+from .main import app
+from .database import AsyncSessionLocal, engine, replica_set
+from .email_utils import mail_config
+from .schema import ensure_schema
+
+# Named explicitly: run with -m, this module is __main__.
+logger = logging.getLogger("app.serve")
+
+# A worker that dies this soon after starting is restarted only after a pause.
+MIN_WORKER_SECONDS = 5.0
+
+# Backends that must be shared once there is more than one worker.
+SHARED_BACKENDS = ("cache_backend", "idempotency_backend")
+
+
+def worker_count(requested: Optional[int] = None) -> int:
+    return requested or settings.web_concurrency or os.cpu_count() or 1
+
+
+def unshared_backends(count: int) -> List[str]:
+    """
+    Settings among SHARED_BACKENDS that keep per-process state although `count` workers
+    will serve requests.
+    """
+    if count <= 1:
+        return []
+    return [name for name in SHARED_BACKENDS if getattr(settings, name) == "memory"]
+
+
+def _megabytes(memory: Dict[str, int]) -> Dict[str, float]:
+    return {f"{kind}_mb": round(value / 2 ** 20, 1) for kind, value in memory.items()}
+
+
+class WorkerServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config, index: int, forked_at: float):
+        super().__init__(config)
+        self.index = index
+        self.forked_at = forked_at
+
+    async def startup(self, sockets=None) -> None:
+        # The lifespan has run by the time the sockets are served.
+        await super().startup(sockets)
+        instrumentation.startup_seconds = round(time.monotonic() - self.forked_at, 3)
+        logger.info("Worker ready", extra={
+            "worker": self.index,
+            "startup_seconds": instrumentation.startup_seconds,
+            **_megabytes(instrumentation.process_memory()),
+        })
+
+
+async def prepare() -> bool:
+    """
+    One-time work in the parent. Connections must not leak into the forked workers.
+    """
+    try:
+        created = await ensure_schema()
+        # Before any worker can record an order.
+        async with AsyncSessionLocal() as session:
+            await sales.ensure_built(session)
+    finally:
+        await engine.dispose()
+        for replica in replica_set.replicas:
+            await replica.engine.dispose()
+    if settings.outbox_dispatch:
+        mail_config()
+    return created
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, index: int, args) -> None:
+    forked_at = time.monotonic()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    random.seed()
+
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        log_config=None,
+        access_log=False,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        timeout_keep_alive=args.keep_alive,
+    )
+    server = WorkerServer(config, index, forked_at)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        logging.shutdown()
+
+
+class Supervisor:
+    def __init__(self, sock: socket.socket, count: int, args):
+        self.sock = sock
+        self.count = count
+        self.args = args
+        self.workers: Dict[int, tuple] = {}
+        self.stopping = False
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, index, self.args)
+            except BaseException:
+                logger.exception("Worker crashed", extra={"worker": index})
+                code = 1
+            os._exit(code)
+        self.workers[pid] = (index, time.monotonic())
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.count):
+            self.spawn(index)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index, started = self.workers.pop(pid, (None, 0.0))
+            if index is None or self.stopping:
+                continue
+            logger.warning("Worker exited, restarting", extra={"worker": index, "pid": pid, "status": status})
+            if time.monotonic() - started < MIN_WORKER_SECONDS:
+                time.sleep(1)
+            if not self.stopping:
+                self.spawn(index)
+        return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the API with pre-forked workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None, help="Default: WEB_CONCURRENCY, else the CPU count")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5, help="Seconds to hold idle keep-alive connections")
+    parser.add_argument("--forwarded-allow-ips", default="127.0.0.1")
+    args = parser.parse_args()
+
+    count = worker_count(args.workers)
+    unshared = unshared_backends(count)
+    if unshared:
+        logger.error("Refusing to start: per-process backends cannot be shared by workers", extra={
+            "workers": count,
+            "settings": [name.upper() for name in unshared],
+        })
+        sys.exit(f"Set {', '.join(f'{name.upper()}=redis' for name in unshared)} or run --workers 1")
+    if settings.rate_limit_backend == "memory" and count > 1:
+        # Not wrong, only looser: each worker grants the full budgets.
+        logger.warning("Rate limits are per worker, set RATE_LIMIT_BACKEND=redis to share them", extra={"workers": count})
+
+    # The application is already imported (module import above); time the rest.
+    started = time.monotonic()
+    created = asyncio.run(prepare())
+    sock = bind(args.host, args.port, args.backlog)
+    logger.info("Forking workers", extra={
+        "workers": count,
+        "address": f"{args.host}:{args.port}",
+        "schema_created": created,
+        "prepare_seconds": round(time.monotonic() - started, 3),
+        **_megabytes(instrumentation.process_memory()),
+    })
+    sys.exit(Supervisor(sock, count, args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Local SMTP stand-in for development and for exercising the email outbox: accepts mail
+over plain SMTP (EHLO/HELO, AUTH, MAIL, RCPT, DATA, RSET, NOOP, QUIT) and keeps it in
+memory instead of delivering it. Point MAIL_SERVER/MAIL_PORT at it with
+MAIL_STARTTLS=false:
+
+    python -m app.smtp_sink --port 1025
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from typing import List, Optional
+
+
+@dataclass
+class ReceivedMessage:
+    sender: str
+    recipients: List[str]
+    data: bytes
+
+    def parsed(self) -> EmailMessage:
+        return message_from_bytes(self.data, policy=policy.default)
+
+
+class SmtpSink:
+    """
+    `fail_next(n, code)` makes the next n transactions fail at MAIL FROM with the given
+    reply code, to exercise retries (4xx) and permanent failures (5xx).
+    """
+
+    def __init__(self):
+        self.messages: List[ReceivedMessage] = []
+        self.connections = 0
+        self._failures: List[int] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def fail_next(self, count: int = 1, code: int = 451) -> None:
+        self._failures.extend([code] * count)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+
+        def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+
+        sender, recipients = None, []
+        reply("220 smtp-sink ready")
+        try:
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode("utf-8", "replace").strip().partition(" ")
+                command = command.upper()
+
+                if command == "EHLO":
+                    reply("250-smtp-sink")
+                    reply("250-AUTH PLAIN LOGIN")
+                    reply("250 8BITMIME")
+                elif command == "HELO":
+                    reply("250 smtp-sink")
+                elif command == "AUTH":
+                    mechanism = argument.split(" ")[0].upper()
+                    if mechanism == "LOGIN":
+                        for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                            reply(prompt)
+                            await writer.drain()
+                            await reader.readline()
+                    reply("235 Authentication successful")
+                elif command == "MAIL":
+                    if self._failures:
+                        code = self._failures.pop(0)
+                        reply(f"{code} Simulated failure")
+                        continue
+                    sender, recipients = argument.partition(":")[2].strip().strip("<>"), []
+                    reply("250 OK")
+                elif command == "RCPT":
+                    recipients.append(argument.partition(":")[2].strip().strip("<>"))
+                    reply("250 OK")
+                elif command == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    lines = []
+                    while True:
+                        data_line = await reader.readline()
+                        if data_line in (b".\r\n", b".\n", b""):
+                            break
+                        lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    self.messages.append(ReceivedMessage(sender or "", recipients, b"".join(lines)))
+                    sender, recipients = None, []
+                    reply("250 OK: queued")
+                elif command == "RSET":
+                    sender, recipients = None, []
+                    reply("250 OK")
+                elif command == "NOOP":
+                    reply("250 OK")
+                elif command == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 1025) -> int:
+        self._server = await asyncio.start_server(self._serve_client, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _serve_forever(host: str, port: int) -> None:
+    sink = SmtpSink()
+    bound = await sink.start(host, port)
+    print(f"SMTP stand-in listening on {host}:{bound}")
+    seen = 0
+    while True:
+        await asyncio.sleep(0.5)
+        for message in sink.messages[seen:]:
+            parsed = message.parsed()
+            print(f"{message.sender} -> {', '.join(message.recipients)}: {parsed['Subject']}")
+        seen = len(sink.messages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    asyncio.run(_serve_forever(args.host, args.port))
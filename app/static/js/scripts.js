@@ -4,11 +4,18 @@
 
 let allProducts = [];
 let cart = JSON.parse(localStorage.getItem("cart")) || [];
+// Idempotency-Key of an order that may or may not have gone through; see checkout().
+let checkoutKey = null;
 let productToDeleteId = null;
 let searchTimeout = null;
+let currentCategory = null;
+let currentProductId = null;
+let refreshTimeout = null;
 
 document.addEventListener("DOMContentLoaded", () => {
     loadProducts();
+    loadFacets();
+    connectChangeFeed();
     checkLoginStatus();
     updateCartUI();
 
@@ -91,6 +98,7 @@ function changeQuantity(productId, change) {
 }
 
 function saveCart() {
+    checkoutKey = null;
     localStorage.setItem("cart", JSON.stringify(cart));
 }
 
@@ -164,6 +172,11 @@ function updateCartUI() {
     if (totalEl) totalEl.innerText = "$" + totalPrice.toFixed(2);
 }
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
 async function checkout() {
     const token = localStorage.getItem("token");
 
@@ -182,15 +195,19 @@ async function checkout() {
         }
     });
 
+    // Reused until the server answers, so retrying after a network error cannot order twice.
+    checkoutKey = checkoutKey || newIdempotencyKey();
     try {
         const response = await fetch("/orders/", {
             method: "POST",
             headers: {
                 "Content-Type": "application/json",
-                "Authorization": `Bearer ${token}`
+                "Authorization": `Bearer ${token}`,
+                "Idempotency-Key": checkoutKey
             },
             body: JSON.stringify({ product_ids: productIds })
         });
+        if (response.status !== 409 || !response.headers.get("Retry-After")) checkoutKey = null;
 
         if (response.ok) {
             alert("Order placed successfully!");
@@ -200,7 +217,8 @@ async function checkout() {
             bootstrap.Offcanvas.getInstance(document.getElementById('cartOffcanvas')).hide();
             openProfile();
         } else {
-            alert("Failed to place order.");
+            const error = await response.json().catch(() => ({}));
+            alert(response.status === 409 && error.detail ? `Failed to place order: ${error.detail}.` : "Failed to place order.");
         }
     } catch (error) {
         console.error(error);
@@ -237,7 +255,7 @@ function handleSearch(query) {
                         document.getElementById('global-search').value = '';
                     };
                     div.innerHTML = `
-                        <img src="${p.image_url || 'https://via.placeholder.com/50'}" alt="${p.name}">
+                        <img src="${p.image_variants?.thumb || p.image_url || 'https://via.placeholder.com/50'}" alt="${p.name}">
                         <div>
                             <div class="fw-bold small">${p.name}</div>
                             <div class="text-primary small">$${p.price}</div>
@@ -261,9 +279,56 @@ async function filterCategory(category, element) {
     backToGallery(true);
 }
 
+async function loadFacets() {
+    try {
+        const response = await fetch("/products/facets");
+        if (!response.ok) return;
+        const facets = await response.json();
+        const counts = { "": facets.product_count };
+        facets.categories.forEach(facet => { counts[facet.category || ""] = facet.product_count; });
+
+        document.querySelectorAll('.category-item[data-category]').forEach(el => {
+            const badge = el.querySelector('.facet-count');
+            if (badge) badge.innerText = counts[el.dataset.category] ?? 0;
+        });
+    } catch (error) {
+        console.error("Error loading facets:", error);
+    }
+}
+
+// Live stock and order updates; anything bigger than a stock change reloads the listing.
+function connectChangeFeed() {
+    const token = localStorage.getItem("token");
+    const feed = new EventSource(token ? `/events?token=${encodeURIComponent(token)}` : "/events?topics=products");
+
+    feed.addEventListener("product", event => {
+        const change = JSON.parse(event.data);
+        const product = allProducts.find(p => p.id === change.id);
+        if (product && change.stock !== undefined) product.stock = change.stock;
+        if (change.id === currentProductId && change.stock !== undefined) {
+            document.getElementById("view-stock").innerText = change.stock;
+        }
+        if (change.action !== "stock") scheduleCatalogRefresh();
+    });
+    feed.addEventListener("catalog", scheduleCatalogRefresh);
+    feed.addEventListener("reset", scheduleCatalogRefresh);
+    feed.addEventListener("order", () => {
+        if (!document.getElementById("profile-view").classList.contains("d-none")) loadOrders(true);
+    });
+}
+
+function scheduleCatalogRefresh() {
+    clearTimeout(refreshTimeout);
+    refreshTimeout = setTimeout(() => {
+        loadProducts(currentCategory);
+        loadFacets();
+    }, 1000);
+}
+
 async function loadProducts(category = null) {
     const container = document.getElementById("products-container");
     const token = localStorage.getItem("token");
+    currentCategory = category;
 
     let url = "/products/";
     if (category && category !== "All Products") {
@@ -282,7 +347,7 @@ async function loadProducts(category = null) {
         }
 
         products.forEach(product => {
-            const image = product.image_url || "https://via.placeholder.com/300x300?text=No+Image";
+            const image = product.image_variants?.card || product.image_url || "https://via.placeholder.com/300x300?text=No+Image";
             let adminButtons = "";
 
             if (token) {
@@ -334,6 +399,7 @@ async function loadProducts(category = null) {
 function viewProduct(id, pushState = true) {
     const product = allProducts.find(p => p.id === id);
     if (!product) return;
+    currentProductId = id;
 
     document.getElementById("view-name").innerText = product.name;
     document.getElementById("breadcrumb-name").innerText = product.name;
@@ -384,37 +450,67 @@ function openProfile(pushState = true) {
                 document.getElementById("addrZip").value = user.address.zip_code || "";
             }
 
-            const tbody = document.getElementById("orders-table-body");
-            tbody.innerHTML = "";
-            const noOrdersMsg = document.getElementById("no-orders-msg");
-
-            if (user.orders && user.orders.length > 0) {
-                noOrdersMsg.classList.add('d-none');
-                user.orders.forEach(order => {
-                    let statusBadge = `<span class="badge bg-secondary">${order.status}</span>`;
-                    let actionBtn = `<button class="btn btn-sm btn-light disabled">None</button>`;
-
-                    if (order.status === 'Processing') {
-                        statusBadge = `<span class="badge bg-warning text-dark">Processing</span>`;
-                        actionBtn = `<button class="btn btn-sm btn-outline-danger rounded-pill px-3" onclick="cancelOrder(${order.id})">Cancel</button>`;
-                    } else if (order.status === 'Cancelled') {
-                        statusBadge = `<span class="badge bg-danger">Cancelled</span>`;
-                        actionBtn = `<span class="text-muted small">Cancelled</span>`;
-                    }
-
-                    tbody.innerHTML += `
-                        <tr>
-                            <td>#${order.id}</td>
-                            <td>${new Date(order.created_at).toLocaleDateString()}</td>
-                            <td>${statusBadge}</td>
-                            <td>$${order.total_price.toFixed(2)}</td>
-                            <td>${actionBtn}</td>
-                        </tr>`;
-                });
-            } else {
-                noOrdersMsg.classList.remove('d-none');
-            }
+            const summary = user.order_summary;
+            document.getElementById("order-summary").innerText = summary.order_count > 0
+                ? `${summary.order_count} orders, $${summary.lifetime_spend.toFixed(2)} spent`
+                : "";
         }).catch(e => console.error(e));
+
+    loadOrders(true);
+}
+
+let ordersCursor = null;
+
+async function loadOrders(reset) {
+    const token = localStorage.getItem("token");
+    const tbody = document.getElementById("orders-table-body");
+    const noOrdersMsg = document.getElementById("no-orders-msg");
+    const moreBtn = document.getElementById("more-orders-btn");
+
+    if (reset) {
+        ordersCursor = null;
+        tbody.innerHTML = "";
+    }
+
+    const params = new URLSearchParams({ limit: 20 });
+    if (ordersCursor) params.set("cursor", ordersCursor);
+
+    try {
+        const res = await fetch(`/orders/?${params}`, { headers: { "Authorization": `Bearer ${token}` } });
+        const orders = await res.json();
+        ordersCursor = res.headers.get("X-Next-Cursor");
+        moreBtn.classList.toggle("d-none", !ordersCursor);
+
+        if (reset && orders.length === 0) {
+            noOrdersMsg.classList.remove('d-none');
+            return;
+        }
+        noOrdersMsg.classList.add('d-none');
+
+        orders.forEach(order => {
+            let statusBadge = `<span class="badge bg-secondary">${order.status}</span>`;
+            let actionBtn = `<button class="btn btn-sm btn-light disabled">None</button>`;
+
+            if (order.status === 'Processing') {
+                statusBadge = `<span class="badge bg-warning text-dark">Processing</span>`;
+                actionBtn = `<button class="btn btn-sm btn-outline-danger rounded-pill px-3" onclick="cancelOrder(${order.id})">Cancel</button>`;
+            } else if (order.status === 'Cancelled') {
+                statusBadge = `<span class="badge bg-danger">Cancelled</span>`;
+                actionBtn = `<span class="text-muted small">Cancelled</span>`;
+            }
+
+            tbody.innerHTML += `
+                <tr>
+                    <td>#${order.id}</td>
+                    <td>${new Date(order.created_at).toLocaleDateString()}</td>
+                    <td>${statusBadge}</td>
+                    <td>$${order.total_price.toFixed(2)}</td>
+                    <td>${actionBtn}</td>
+                </tr>`;
+        });
+    } catch (e) {
+        console.error(e);
+    }
 }
 
 async function cancelOrder(orderId) {
@@ -613,6 +709,7 @@ async function login() {
     if (res.ok) {
         const data = await res.json();
         localStorage.setItem("token", data.access_token);
+        localStorage.setItem("refreshToken", data.refresh_token);
         location.reload();
     } else {
         alert("Invalid");
@@ -637,12 +734,43 @@ async function registerUser() {
     }
 }
 
-function logout() {
+async function logout() {
+    const token = localStorage.getItem("token");
+    if (token) {
+        // Revoke the session server-side; the local sign-out happens either way.
+        await fetch("/auth/logout", { method: "POST", headers: { "Authorization": `Bearer ${token}` } }).catch(() => {});
+    }
     localStorage.removeItem("token");
+    localStorage.removeItem("refreshToken");
     location.reload();
 }
 
-function handleSessionExpired() {
+async function refreshSession() {
+    const refreshToken = localStorage.getItem("refreshToken");
+    if (!refreshToken) return false;
+    try {
+        const res = await fetch("/auth/refresh", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ refresh_token: refreshToken })
+        });
+        if (!res.ok) return false;
+        const data = await res.json();
+        localStorage.setItem("token", data.access_token);
+        localStorage.setItem("refreshToken", data.refresh_token);
+        return true;
+    } catch (error) {
+        return false;
+    }
+}
+
+async function handleSessionExpired() {
+    if (await refreshSession()) {
+        location.reload();
+        return;
+    }
     alert("Session expired");
-    logout();
+    localStorage.removeItem("token");
+    localStorage.removeItem("refreshToken");
+    location.reload();
 }
\ No newline at end of file
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import IO, Optional
+
+from fastapi import UploadFile
+from fastapi.staticfiles import StaticFiles
+
+from .config import settings
+
+BASE_DIR = Path(__file__).resolve().parent
+
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedMediaType(Exception):
+    pass
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def _write_chunk(handle: IO[bytes], hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    handle.write(chunk)
+
+
+class StoredFile:
+    __slots__ = ("digest", "extension", "size", "path", "url", "deduplicated")
+
+    def __init__(self, digest: str, extension: str, size: int, path: Path, url: str, deduplicated: bool):
+        self.digest = digest
+        self.extension = extension
+        self.size = size
+        self.path = path
+        self.url = url
+        self.deduplicated = deduplicated
+
+
+class ContentAddressedStorage:
+    """
+    Stores uploads under their SHA-256, sharded two levels deep (ab/cd/abcd….jpg).
+
+    Uploads are streamed to a temporary file in chunks, hashed on the way, and then
+    atomically renamed into place, so identical content is stored once and a URL
+    always refers to the same bytes.
+    """
+
+    def __init__(self, root: Path, url_prefix: str, max_bytes: int, chunk_size: int):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.tmp_dir = root / ".tmp"
+
+    def relative_path(self, digest: str, extension: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def path_for(self, digest: str, extension: str) -> Path:
+        return self.root / self.relative_path(digest, extension)
+
+    def url_for(self, digest: str, extension: str) -> str:
+        return f"{self.url_prefix}/{self.relative_path(digest, extension)}"
+
+    async def save(self, upload: UploadFile) -> StoredFile:
+        await asyncio.to_thread(self.tmp_dir.mkdir, parents=True, exist_ok=True)
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        hasher = hashlib.sha256()
+        size = 0
+        extension = None
+
+        handle = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            try:
+                while True:
+                    chunk = await upload.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if extension is None:
+                        extension = sniff_image_type(chunk[:16])
+                        if extension is None:
+                            raise UnsupportedMediaType("Only JPEG, PNG, GIF and WebP images are accepted")
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+                    await asyncio.to_thread(_write_chunk, handle, hasher, chunk)
+            finally:
+                await asyncio.to_thread(handle.close)
+
+            if extension is None:
+                raise UnsupportedMediaType("Empty upload")
+
+            digest = hasher.hexdigest()
+            target = self.path_for(digest, extension)
+            deduplicated = await asyncio.to_thread(self._commit, tmp_path, target)
+        except BaseException:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+            raise
+
+        return StoredFile(digest, extension, size, target, self.url_for(digest, extension), deduplicated)
+
+    @staticmethod
+    def _commit(tmp_path: Path, target: Path) -> bool:
+        if target.exists():
+            tmp_path.unlink(missing_ok=True)
+            return True
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+        return False
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    Static files whose URLs never change content, so clients may cache them forever.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+media_root = Path(settings.media_root) if settings.media_root else BASE_DIR / "static" / "media"
+
+image_storage = ContentAddressedStorage(
+    root=media_root,
+    url_prefix="/media",
+    max_bytes=settings.upload_max_bytes,
+    chunk_size=settings.upload_chunk_size,
+)
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+from uuid import uuid4
 from jose import jwt
 from passlib.context import CryptContext
 from .config import settings
@@ -21,6 +22,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
 
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", new_token_id())
 
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+def new_token_id() -> str:
+    return uuid4().hex
+
+def create_refresh_token(user_id: int, session_id: str) -> Tuple[str, datetime]:
+    """
+    A single-use token that trades for a new access/refresh pair in the same session.
+    Returns the token and its expiry.
+    """
+    expire = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
+    to_encode = {"sub": str(user_id), "sid": session_id, "typ": "refresh", "jti": new_token_id(), "exp": expire}
+    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm), expire
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Work done before a worker accepts traffic, so its first requests do not pay for it:
+database connections are opened (and their statement caches primed), and the first
+page of the product listing (`default_page_size` products), overall and for the largest
+categories, is put in the product cache exactly as `GET /products/?limit=...` would
+cache it.
+"""
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.future import select
+
+from . import models, pagination, serialization
+from .cache import product_cache
+from .config import settings
+from .database import AsyncSessionLocal, engine
+from .routers.products import SORT_KEYS, fetch_page
+
+logger = logging.getLogger(__name__)
+
+
+async def open_connections(count: int) -> None:
+    async def touch():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(touch() for _ in range(count)))
+
+
+async def warm_listings(max_categories: int) -> int:
+    """
+    Cache the first page of the unfiltered listing and of the largest categories'
+    listings, unless another worker sharing the cache already did. Returns how many listings were cached.
+    """
+    stats = models.CategoryStats
+    warmed = 0
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(stats.category).where(stats.category != "")
+            .order_by(stats.product_count.desc()).limit(max_categories)
+        )
+        for category in [None, *result.scalars().all()]:
+            key = await product_cache.list_key(category, "id", settings.default_page_size, None)
+            if await product_cache.get(key) is not None:
+                continue
+            query = select(*serialization.PRODUCT_COLUMNS)
+            if category is not None:
+                query = query.where(models.Product.category == category)
+            query = pagination.apply_keyset(query, SORT_KEYS["id"], None)
+            rows, headers = await fetch_page(db, query, "id", settings.default_page_size)
+            await product_cache.put(key, serialization.products_json(rows), headers)
+            warmed += 1
+    return warmed
+
+
+async def warm_up() -> None:
+    started = time.perf_counter()
+    await open_connections(min(settings.warmup_connections, settings.db_pool_size))
+    listings = await warm_listings(settings.warmup_listing_categories) if settings.warmup_listings else 0
+    logger.info("Warmed up", extra={"listings": listings, "seconds": round(time.perf_counter() - started, 3)})
@@ -0,0 +1,138 @@
+"""
+Shared setup for the benchmark scripts: a deterministic synthetic catalog and a
+throwaway database. Benchmarks drop and recreate the schema, so they never use
+DATABASE_URL; set BENCH_DATABASE_URL to run against a scratch Postgres instead
+of a temporary SQLite file. Uploads go to a temporary MEDIA_ROOT as well.
+"""
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+os.environ["DATABASE_URL"] = os.environ.get(
+    "BENCH_DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/benchmark.db"
+)
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("MEDIA_ROOT", tempfile.mkdtemp())
+# Only the outbox dispatcher (off here) builds the mail config; placeholders keep it valid.
+os.environ.setdefault("MAIL_USERNAME", "benchmark")
+os.environ.setdefault("MAIL_PASSWORD", "benchmark")
+os.environ.setdefault("MAIL_FROM", "benchmark@example.com")
+os.environ.setdefault("MAIL_SERVER", "localhost")
+os.environ.setdefault("OUTBOX_DISPATCH", "false")
+# Load generators send everything from one address with a handful of users.
+os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+
+from sqlalchemy import delete, event, insert, select  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import Base, engine  # noqa: E402
+
+BRANDS = ["Apple", "Samsung", "Sony", "Dell", "Lenovo", "Asus", "Google", "Xiaomi", "Bose", "Logitech"]
+KINDS = ["Phone", "Laptop", "Headphones", "Monitor", "Keyboard", "Mouse", "Tablet", "Camera", "Speaker", "Watch"]
+ADJECTIVES = ["Pro", "Max", "Ultra", "Mini", "Air", "Plus", "Lite", "Studio", "Wireless", "Gaming"]
+CATEGORIES = [kind + "s" for kind in KINDS]
+
+
+def make_products(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(count):
+        kind = rng.choice(KINDS)
+        yield {
+            "name": f"{rng.choice(BRANDS)} {kind} {rng.choice(ADJECTIVES)} {i}",
+            "description": f"A {rng.choice(ADJECTIVES).lower()} {kind.lower()} for everyday use",
+            "specs": f"{rng.randint(4, 64)}GB RAM, {rng.randint(1, 5)} year warranty",
+            "price": round(rng.uniform(10, 3000), 2),
+            "stock": rng.randint(1, 500),
+            "category": kind + "s",
+        }
+
+
+async def reset_schema() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def seed_products(count: int, batch_size: int = 5000) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(delete(models.Product))
+        rows = list(make_products(count))
+        for start in range(0, len(rows), batch_size):
+            await conn.execute(insert(models.Product), rows[start:start + batch_size])
+
+
+async def seed_users(count: int, hashed_password: str) -> None:
+    """
+    Users bench0..bench{count-1}@example.com, all sharing one precomputed password hash.
+    """
+    async with engine.begin() as conn:
+        await conn.execute(insert(models.User), [
+            {"email": f"bench{i}@example.com", "username": f"bench{i}", "hashed_password": hashed_password,
+             "role": "user", "is_active": True}
+            for i in range(count)
+        ])
+
+
+async def seed_orders(count: int, user_count: int, product_count: int, items_per_order: int = 3, seed: int = 42,
+                      days: int = 0) -> None:
+    """
+    With `days`, orders are spread over that many days up to now instead of all placed now.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    async with engine.begin() as conn:
+        prices = dict((await conn.execute(select(models.Product.id, models.Product.price))).all())
+        for start in range(0, count, 1000):
+            orders, carts = [], []
+            for _ in range(min(1000, count - start)):
+                cart = [rng.randint(1, product_count) for _ in range(items_per_order)]
+                carts.append(cart)
+                orders.append({
+                    "user_id": rng.randint(1, user_count),
+                    "total_price": round(sum(prices[pid] for pid in cart), 2),
+                    "status": "Processing",
+                    "created_at": now - timedelta(seconds=rng.uniform(0, days * 86400)) if days else now,
+                })
+            result = await conn.execute(
+                insert(models.Order).returning(models.Order.id, sort_by_parameter_order=True), orders
+            )
+            await conn.execute(insert(models.OrderItem), [
+                {"order_id": order_id, "product_id": pid, "product_name": None, "quantity": 1, "unit_price": prices[pid]}
+                for order_id, cart in zip(result.scalars().all(), carts)
+                for pid in cart
+            ])
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", counter)
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self.started) * 1000
@@ -0,0 +1,68 @@
+"""
+Event-loop responsiveness during a login storm: bcrypt on the loop (the old
+`utils.verify_password` path) versus the bounded worker pool.
+
+A ticker coroutine sleeps 5 ms at a time and records how late it wakes up; that
+lateness is the latency every other request on the worker would see.
+
+    python -m benchmarks.hashing_bench --logins 50
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import percentile
+
+from app import utils
+from app.passwords import password_hasher
+
+TICK = 0.005
+
+
+async def ticker(stop: asyncio.Event, lateness: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lateness.append((time.perf_counter() - started - TICK) * 1000)
+
+
+async def storm(verify, hashed: str, logins: int):
+    stop, lateness = asyncio.Event(), []
+    tick_task = asyncio.create_task(ticker(stop, lateness))
+    await asyncio.sleep(TICK * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(verify("password123", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await tick_task
+    return elapsed, lateness
+
+
+async def blocking_verify(password: str, hashed: str) -> bool:
+    return utils.verify_password(password, hashed)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args()
+
+    hashed = utils.get_password_hash("password123")
+
+    print(f"{args.logins} concurrent logins, pool: {password_hasher.stats()['workers']} {password_hasher.executor_kind} workers\n")
+    print(f"{'path':<10}{'logins/s':>10}{'loop lag p50 ms':>18}{'p99 ms':>10}{'max ms':>10}")
+    for name, verify in [("blocking", blocking_verify), ("pool", password_hasher.verify)]:
+        elapsed, lateness = await storm(verify, hashed, args.logins)
+        print(
+            f"{name:<10}{args.logins / elapsed:>10.1f}{percentile(lateness, 0.5):>18.2f}"
+            f"{percentile(lateness, 0.99):>10.2f}{max(lateness):>10.2f}"
+        )
+
+    print(f"\npool stats: {password_hasher.stats()}")
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""
+Flash sale: thousands of simultaneous orders for one product with limited stock, sent
+through the API in process. Checks that stock never oversells (every accepted order is
+backed by stock, stock never goes negative, and the stock taken matches the order rows)
+and reports the throughput and latency achieved, with reservations coalesced per
+product and, for comparison, with one conditional UPDATE per order.
+
+    python -m benchmarks.inventory_bench --orders 5000 --stock 1000 --concurrency 1000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+if "BENCH_DATABASE_URL" not in os.environ:
+    # SQLite takes one writer at a time; extra connections only queue on its file lock,
+    # where waiters are not served in order and time out with "database is locked".
+    os.environ.setdefault("DB_POOL_SIZE", "1")
+    os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+# Every order is let in: this measures reservations, not load shedding.
+os.environ.setdefault("ADMISSION_MAX_CONCURRENCY", "100000")
+os.environ.setdefault("ADMISSION_MAX_POOL_WAIT_SECONDS", "0")
+
+from benchmarks.common import percentile, reset_schema, seed_users
+
+import httpx
+from sqlalchemy import func, insert
+from sqlalchemy.future import select
+
+from app import models, utils
+from app.database import AsyncSessionLocal, engine
+from app.inventory import inventory
+from app.main import app
+
+
+async def seed(stock: int, users: int) -> None:
+    await reset_schema()
+    async with engine.begin() as conn:
+        await conn.execute(insert(models.Product), [{
+            "name": "Flash Sale Phone", "description": "Limited run", "price": 499.0,
+            "stock": stock, "category": "Phones",
+        }])
+    await seed_users(users, "unused")
+
+
+async def flash_sale(args, coalesce: bool) -> dict:
+    await seed(args.stock, args.users)
+    inventory.coalesce = coalesce
+    before = inventory.stats()
+
+    headers = [
+        {"Authorization": "Bearer " + utils.create_access_token({"sub": str(i + 1), "role": "user"})}
+        for i in range(args.users)
+    ]
+    gate = asyncio.Semaphore(args.concurrency)
+    statuses: Counter = Counter()
+    latencies = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def buy(i: int):
+                async with gate:
+                    sent = time.perf_counter()
+                    response = await client.post(
+                        "/orders/", json={"product_ids": [1] * args.quantity}, headers=headers[i % args.users]
+                    )
+                    latencies.append((time.perf_counter() - sent) * 1000)
+                    statuses[response.status_code] += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(buy(i) for i in range(args.orders)))
+            wall = time.perf_counter() - started
+
+    async with AsyncSessionLocal() as db:
+        stock = (await db.execute(select(models.Product.stock).where(models.Product.id == 1))).scalar_one()
+        orders = (await db.execute(select(func.count(models.Order.id)))).scalar_one()
+        units = (await db.execute(select(func.coalesce(func.sum(models.OrderItem.quantity), 0)))).scalar_one()
+    await engine.dispose()
+
+    after = inventory.stats()
+    batches = after["batch_size"]["count"] - before["batch_size"]["count"]
+    return {
+        "mode": "coalesced" if coalesce else "per order",
+        "wall": wall,
+        "statuses": statuses,
+        "latencies": latencies,
+        "stock": stock,
+        "orders": orders,
+        "units": units,
+        "statements": after["statements"] - before["statements"],
+        "batches": batches,
+        "requests": after["requests"] - before["requests"],
+    }
+
+
+def check(args, result: dict) -> list:
+    accepted = result["statuses"][201]
+    problems = []
+    if result["stock"] < 0:
+        problems.append(f"stock went negative: {result['stock']}")
+    if accepted != result["orders"]:
+        problems.append(f"{accepted} orders accepted but {result['orders']} order rows")
+    if result["units"] != args.stock - result["stock"]:
+        problems.append(f"{result['units']} units ordered but {args.stock - result['stock']} taken from stock")
+    if accepted * args.quantity > args.stock:
+        problems.append(f"oversold: {accepted * args.quantity} units sold from {args.stock}")
+    if accepted < min(args.orders, args.stock // args.quantity) and not set(result["statuses"]) - {201, 409}:
+        problems.append(f"undersold: {accepted} orders accepted with stock left for more")
+    return problems
+
+
+def report(args, result: dict) -> None:
+    statuses = ", ".join(f"{code}: {count}" for code, count in sorted(result["statuses"].items()))
+    latencies = result["latencies"]
+    print(f"{result['mode']}")
+    print(f"  responses     {statuses}")
+    print(f"  stock         {args.stock} -> {result['stock']} ({result['units']} units in {result['orders']} orders)")
+    print(f"  throughput    {args.orders / result['wall']:.0f} requests/s, "
+          f"{result['statuses'][201] / result['wall']:.0f} accepted orders/s over {result['wall']:.2f}s")
+    print(f"  latency ms    p50 {percentile(latencies, 0.5):.1f}  p99 {percentile(latencies, 0.99):.1f}  "
+          f"mean {statistics.mean(latencies):.1f}")
+    if result["batches"]:
+        print(f"  stock rows    {result['statements']} statements, {result['batches']} batches, "
+              f"{result['requests'] / result['batches']:.1f} reservations per batch")
+    else:
+        print(f"  stock rows    {result['statements']} statements")
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--quantity", type=int, default=1, help="Units of the product per order")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1000, help="Orders in flight at once")
+    parser.add_argument("--mode", choices=["coalesced", "per-order", "both"], default="both")
+    args = parser.parse_args()
+
+    modes = {"coalesced": [True], "per-order": [False], "both": [True, False]}[args.mode]
+    print(f"{engine.dialect.name}: {args.orders} orders of {args.quantity} unit(s), stock {args.stock}, "
+          f"{args.concurrency} in flight\n")
+    failed = False
+    for coalesce in modes:
+        result = await flash_sale(args, coalesce)
+        report(args, result)
+        problems = check(args, result)
+        for problem in problems:
+            print(f"  FAIL          {problem}")
+        failed = failed or bool(problems)
+        print()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
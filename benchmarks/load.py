@@ -0,0 +1,404 @@
+"""
+Load test for the whole API. Seeds a throwaway database with a synthetic catalog,
+users and order history, then drives a weighted mix of product, order, auth and file
+requests from concurrent clients and reports throughput, p50/p95/p99 latency and SQL
+statements per request for every scenario.
+
+    python -m benchmarks.load run --duration 20 --output benchmarks/baselines/asgi-sqlite.json
+    python -m benchmarks.load run --transport http --concurrency 64 --compare benchmarks/baselines/http-sqlite.json
+    python -m benchmarks.load compare benchmarks/baselines/asgi-sqlite.json current.json
+
+`--transport asgi` runs the app in-process over httpx's ASGI transport, so it measures the
+application without sockets; `--transport http` starts uvicorn on a free port in a
+subprocess and sends real HTTP. Statement counts come from the app's own /metrics
+histograms, which are per route: scenarios that share a method and route (the three
+listing variants, say) report the same figure.
+
+`compare` (and `run --compare`) exits with status 1 when a scenario's p50 or p95 latency
+grows, or its throughput drops, by more than the tolerance, or when it runs more SQL
+statements per request than the baseline did.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.common import BRANDS, CATEGORIES, KINDS, percentile, reset_schema, seed_orders, seed_products, seed_users
+
+import httpx
+
+from app.database import engine
+from app.utils import pwd_context
+
+PASSWORD = "benchmark-password"
+IMAGE_COUNT = 8
+
+
+@dataclass
+class LoadContext:
+    product_count: int
+    auth_headers: List[Dict[str, str]] = field(default_factory=list)
+    logins: List[Dict[str, str]] = field(default_factory=list)
+    images: List[bytes] = field(default_factory=list)
+    digests: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    route: str
+    weight: int
+    build: Callable[[LoadContext, random.Random], dict]
+
+
+def _product_id(ctx: LoadContext, rng: random.Random) -> int:
+    return rng.randint(1, ctx.product_count)
+
+
+SCENARIOS = [
+    Scenario("products.list", "GET", "/products/", 20, lambda ctx, rng: {
+        "url": "/products/", "params": {"limit": 50}}),
+    Scenario("products.category", "GET", "/products/", 15, lambda ctx, rng: {
+        "url": "/products/", "params": {"category": rng.choice(CATEGORIES), "limit": 50}}),
+    Scenario("products.search", "GET", "/products/", 15, lambda ctx, rng: {
+        "url": "/products/", "params": {"search": f"{rng.choice(BRANDS)} {rng.choice(KINDS)}", "limit": 20}}),
+    Scenario("products.detail", "GET", "/products/{product_id}", 25, lambda ctx, rng: {
+        "url": f"/products/{_product_id(ctx, rng)}"}),
+    Scenario("products.update", "PATCH", "/products/{product_id}", 2, lambda ctx, rng: {
+        "url": f"/products/{_product_id(ctx, rng)}", "json": {"price": round(rng.uniform(10, 3000), 2)},
+        "headers": rng.choice(ctx.auth_headers)}),
+    Scenario("orders.create", "POST", "/orders/", 8, lambda ctx, rng: {
+        "url": "/orders/", "json": {"product_ids": [_product_id(ctx, rng) for _ in range(3)]},
+        "headers": rng.choice(ctx.auth_headers)}),
+    Scenario("auth.me", "GET", "/auth/me", 8, lambda ctx, rng: {
+        "url": "/auth/me", "headers": rng.choice(ctx.auth_headers)}),
+    Scenario("auth.login", "POST", "/auth/login", 1, lambda ctx, rng: {
+        "url": "/auth/login", "data": rng.choice(ctx.logins)}),
+    Scenario("files.upload", "POST", "/files/upload/", 1, lambda ctx, rng: {
+        "url": "/files/upload/", "files": {"file": ("bench.png", rng.choice(ctx.images), "image/png")},
+        "headers": rng.choice(ctx.auth_headers)}),
+    Scenario("files.variant", "GET", "/files/variants/{digest}/{variant}.{fmt}", 5, lambda ctx, rng: {
+        "url": f"/files/variants/{rng.choice(ctx.digests)}/{rng.choice(['thumb', 'card'])}.webp"}),
+]
+
+
+def make_images(count: int, seed: int = 42) -> List[bytes]:
+    from PIL import Image
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        image = Image.new("RGB", (800, 600), tuple(rng.randint(0, 255) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+async def seed(args) -> None:
+    await reset_schema()
+    await seed_products(args.products)
+    await seed_users(args.users, pwd_context.hash(PASSWORD))
+    await seed_orders(args.orders, args.users, args.products)
+    await engine.dispose()
+
+
+async def prepare(client: httpx.AsyncClient, args) -> LoadContext:
+    """
+    Log in as many users as there are clients and upload the sample images, so the
+    scenarios have tokens and image digests to work with.
+    """
+    ctx = LoadContext(product_count=args.products, images=make_images(IMAGE_COUNT))
+    for i in range(min(args.users, args.concurrency)):
+        login = {"username": f"bench{i}@example.com", "password": PASSWORD}
+        response = await client.post("/auth/login", data=login)
+        response.raise_for_status()
+        ctx.logins.append(login)
+        ctx.auth_headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+    for image in ctx.images:
+        response = await client.post(
+            "/files/upload/", files={"file": ("bench.png", image, "image/png")}, headers=ctx.auth_headers[0]
+        )
+        response.raise_for_status()
+        ctx.digests.append(response.json()["sha256"])
+    return ctx
+
+
+async def drive(client: httpx.AsyncClient, ctx: LoadContext, scenarios: List[Scenario], args, seconds: float):
+    """
+    Closed loop: every client sends its next request as soon as the previous one completes.
+    Returns per-scenario latencies in ms, per-scenario error counts and the wall time.
+    """
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    weights = [scenario.weight for scenario in scenarios]
+    started = time.perf_counter()
+    deadline = started + seconds
+
+    async def client_loop(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(scenarios, weights)[0]
+            request = scenario.build(ctx, rng)
+            sent = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, **request)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[scenario.name].append((time.perf_counter() - sent) * 1000)
+            if failed:
+                errors[scenario.name] += 1
+
+    await asyncio.gather(*(client_loop(i) for i in range(args.concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def statement_totals(exposition: str) -> Dict[Tuple[str, str], List[float]]:
+    """
+    (method, route) -> [statement sum, request count] from a /metrics scrape.
+    """
+    totals: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0.0, 0.0])
+    for line in exposition.splitlines():
+        for suffix, slot in (("_sum{", 0), ("_count{", 1)):
+            prefix = "db_statements_per_request" + suffix
+            if line.startswith(prefix):
+                labels_part, value = line[len(prefix):].rsplit("} ", 1)
+                labels = dict(LABEL_RE.findall(labels_part))
+                totals[(labels["method"], labels["route"])][slot] = float(value)
+    return totals
+
+
+def summarize(scenarios: List[Scenario], latencies, errors, wall: float, before, after) -> dict:
+    results = {}
+    for scenario in scenarios:
+        samples = latencies.get(scenario.name)
+        if not samples:
+            continue
+        key = (scenario.method, scenario.route)
+        statements = after.get(key, [0.0, 0.0])[0] - before.get(key, [0.0, 0.0])[0]
+        requests = after.get(key, [0.0, 0.0])[1] - before.get(key, [0.0, 0.0])[1]
+        results[scenario.name] = {
+            "requests": len(samples),
+            "errors": errors[scenario.name],
+            "throughput_rps": round(len(samples) / wall, 2),
+            "p50_ms": round(percentile(samples, 0.50), 3),
+            "p95_ms": round(percentile(samples, 0.95), 3),
+            "p99_ms": round(percentile(samples, 0.99), 3),
+            "queries_per_request": round(statements / requests, 2) if requests else None,
+        }
+
+    everything = [sample for samples in latencies.values() for sample in samples]
+    total = {
+        "requests": len(everything),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(everything) / wall, 2),
+        "p50_ms": round(percentile(everything, 0.50), 3),
+        "p95_ms": round(percentile(everything, 0.95), 3),
+        "p99_ms": round(percentile(everything, 0.99), 3),
+    }
+    return {"scenarios": results, "total": total}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class UvicornServer:
+    def __init__(self):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.process: Optional[subprocess.Popen] = None
+
+    async def __aenter__(self) -> str:
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port),
+             "--log-level", "warning", "--no-access-log"],
+            env=os.environ.copy(),
+        )
+        async with httpx.AsyncClient(base_url=self.base_url) as client:
+            for _ in range(300):
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {self.process.returncode}")
+                try:
+                    await client.get("/metrics")
+                    return self.base_url
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        raise RuntimeError("uvicorn did not start within 30s")
+
+    async def __aexit__(self, *exc):
+        self.process.terminate()
+        try:
+            await asyncio.to_thread(self.process.wait, 10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_scenarios(client: httpx.AsyncClient, args) -> dict:
+    scenarios = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    ctx = await prepare(client, args)
+    if args.warmup:
+        await drive(client, ctx, scenarios, args, args.warmup)
+
+    before = statement_totals((await client.get("/metrics")).text)
+    latencies, errors, wall = await drive(client, ctx, scenarios, args, args.duration)
+    after = statement_totals((await client.get("/metrics")).text)
+    return summarize(scenarios, latencies, errors, wall, before, after)
+
+
+async def run(args) -> dict:
+    await seed(args)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(60.0)
+
+    if args.transport == "asgi":
+        from app.main import app
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                results = await run_scenarios(client, args)
+    else:
+        async with UvicornServer() as base_url:
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+                results = await run_scenarios(client, args)
+
+    results["meta"] = {
+        "transport": args.transport,
+        "dialect": engine.dialect.name,
+        "products": args.products,
+        "users": args.users,
+        "orders": args.orders,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "seed": args.seed,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    return results
+
+
+def print_report(results: dict) -> None:
+    meta = results["meta"]
+    print(f"{meta['transport']} / {meta['dialect']}: {meta['products']} products, {meta['users']} users, "
+          f"{meta['orders']} orders, {meta['concurrency']} clients for {meta['duration']}s\n")
+    print(f"{'scenario':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+    rows = list(results["scenarios"].items()) + [("total", results["total"])]
+    for name, row in rows:
+        queries = row.get("queries_per_request")
+        print(f"{name:<20}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+              f"{'-' if queries is None else f'{queries:.2f}':>9}")
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """
+    Regressions of `current` against `baseline`, one message each.
+    """
+    regressions = []
+    for key in ("transport", "dialect", "products", "users", "orders", "concurrency"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"warning: {key} differs from the baseline "
+                  f"({baseline['meta'].get(key)} vs {current['meta'].get(key)})", file=sys.stderr)
+
+    for name, base in baseline["scenarios"].items():
+        cur = current["scenarios"].get(name)
+        if cur is None:
+            print(f"warning: scenario {name} missing from the current run", file=sys.stderr)
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if cur[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {base[metric]:.2f} -> {cur[metric]:.2f}")
+        if cur["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']:.1f} -> {cur['throughput_rps']:.1f} req/s")
+        if base["queries_per_request"] is not None and cur["queries_per_request"] is not None \
+                and cur["queries_per_request"] > base["queries_per_request"]:
+            regressions.append(
+                f"{name}: queries per request {base['queries_per_request']} -> {cur['queries_per_request']}"
+            )
+        if cur["errors"] / cur["requests"] > base["errors"] / base["requests"] + 0.01:
+            regressions.append(f"{name}: error rate {base['errors']}/{base['requests']} -> {cur['errors']}/{cur['requests']}")
+    return regressions
+
+
+def report_comparison(baseline_path: str, current: dict, tolerance: float) -> int:
+    baseline = json.loads(Path(baseline_path).read_text())
+    regressions = compare(baseline, current, tolerance)
+    if not regressions:
+        print(f"\nno regressions against {baseline_path} (tolerance {tolerance:.0%})")
+        return 0
+    print(f"\n{len(regressions)} regression(s) against {baseline_path} (tolerance {tolerance:.0%}):")
+    for message in regressions:
+        print(f"  {message}")
+    return 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Seed a scratch database and run the load mix")
+    run_parser.add_argument("--transport", choices=["asgi", "http"], default="asgi")
+    run_parser.add_argument("--products", type=int, default=5000)
+    run_parser.add_argument("--users", type=int, default=200)
+    run_parser.add_argument("--orders", type=int, default=2000)
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=15.0, help="measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds first")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--scenarios", nargs="+", choices=[s.name for s in SCENARIOS])
+    run_parser.add_argument("--output", help="write the results to this JSON file")
+    run_parser.add_argument("--compare", metavar="BASELINE", help="fail on regressions against this baseline")
+    run_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        sys.exit(report_comparison(args.baseline, json.loads(Path(args.current).read_text()), args.tolerance))
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        sys.exit(report_comparison(args.compare, results, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
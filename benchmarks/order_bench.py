@@ -0,0 +1,73 @@
+"""
+Order-creation latency against cart size: the set-based `create_order` versus the
+previous one-SELECT-per-item loop.
+
+    python -m benchmarks.order_bench --sizes 1 10 50 200 --repeat 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+
+from benchmarks.common import Timer, count_queries, reset_schema, seed_products
+
+from sqlalchemy.future import select
+
+from app import models
+from app.database import AsyncSessionLocal, engine
+from app.routers.orders import OrderCreate, create_order
+
+
+async def legacy_create_order(order_data: OrderCreate, db, current_user):
+    total_price = 0.0
+    for pid in order_data.product_ids:
+        result = await db.execute(select(models.Product).where(models.Product.id == pid))
+        product = result.scalars().first()
+        if product:
+            total_price += product.price
+
+    new_order = models.Order(user_id=current_user.id, total_price=total_price, status="Processing")
+    db.add(new_order)
+    await db.commit()
+    await db.refresh(new_order)
+
+
+async def measure(handler, user, product_count: int, size: int, repeat: int):
+    rng = random.Random(size)
+    timings, queries = [], []
+    for _ in range(repeat):
+        cart = OrderCreate(product_ids=[rng.randint(1, product_count) for _ in range(size)])
+        async with AsyncSessionLocal() as db:
+            with count_queries() as counter, Timer() as timer:
+                await handler(cart, db=db, current_user=user)
+        timings.append(timer.ms)
+        queries.append(counter.count)
+    return statistics.median(timings), statistics.median(queries)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    await reset_schema()
+    await seed_products(args.products)
+    async with AsyncSessionLocal() as db:
+        user = models.User(email="bench@example.com", username="bench", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+    print(f"{engine.dialect.name}, median of {args.repeat} orders per cart size\n")
+    print(f"{'cart size':>10}{'legacy ms':>12}{'legacy queries':>16}{'batched ms':>12}{'batched queries':>17}")
+    for size in args.sizes:
+        legacy_ms, legacy_queries = await measure(legacy_create_order, user, args.products, size, args.repeat)
+        batched_ms, batched_queries = await measure(create_order, user, args.products, size, args.repeat)
+        print(f"{size:>10}{legacy_ms:>12.2f}{legacy_queries:>16.0f}{batched_ms:>12.2f}{batched_queries:>17.0f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
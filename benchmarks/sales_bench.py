@@ -0,0 +1,95 @@
+"""
+Sales report latency against order volume: the daily and per-category reports read from
+the rollups versus the same aggregates computed from the orders and line items, plus the
+time to rebuild the rollups from scratch.
+
+    python -m benchmarks.sales_bench --orders 10000 50000 200000 --days 90
+"""
+import argparse
+import asyncio
+import statistics
+from datetime import datetime, timedelta
+
+from benchmarks.common import Timer, reset_schema, seed_orders, seed_products, seed_users
+
+from sqlalchemy import case, func, update
+from sqlalchemy.future import select
+
+from app import models, sales
+from app.database import AsyncSessionLocal, engine
+
+
+async def scan_daily(db, start, end):
+    orders = models.Order
+    cancelled = orders.status == sales.CANCELLED
+    day = func.date(orders.created_at)
+    result = await db.execute(
+        select(day, func.count(orders.id), func.sum(case((cancelled, 1), else_=0)),
+               func.sum(case((cancelled, 0.0), else_=orders.total_price)))
+        .where(orders.created_at >= start, orders.created_at < end + timedelta(days=1))
+        .group_by(day)
+    )
+    return result.all()
+
+
+async def scan_categories(db, start, end):
+    orders, items, products = models.Order, models.OrderItem, models.Product
+    cancelled = orders.status == sales.CANCELLED
+    result = await db.execute(
+        select(products.category, func.count(func.distinct(orders.id)),
+               func.sum(case((cancelled, 0.0), else_=items.unit_price * items.quantity)))
+        .select_from(items)
+        .join(orders, orders.id == items.order_id)
+        .outerjoin(products, products.id == items.product_id)
+        .where(orders.created_at >= start, orders.created_at < end + timedelta(days=1))
+        .group_by(products.category)
+    )
+    return result.all()
+
+
+async def measure(report, start, end, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        async with AsyncSessionLocal() as db:
+            with Timer() as timer:
+                await report(db, start, end)
+        timings.append(timer.ms)
+    return statistics.median(timings)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--days", type=int, default=90, help="Orders are spread over this many days; reports cover them all")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=args.days)
+    print(f"{engine.dialect.name}, {args.days}-day reports, median of {args.repeat}\n")
+    print(f"{'orders':>8}{'rebuild ms':>12}{'daily scan':>12}{'daily rollup':>14}{'category scan':>15}{'category rollup':>17}")
+    for count in args.orders:
+        await reset_schema()
+        await seed_products(args.products)
+        await seed_users(100, "x")
+        await seed_orders(count, 100, args.products, days=args.days)
+        async with engine.begin() as conn:
+            # Every tenth order cancelled.
+            await conn.execute(update(models.Order).where(models.Order.id % 10 == 0).values(status=sales.CANCELLED))
+
+        async with AsyncSessionLocal() as db:
+            with Timer() as rebuild:
+                await sales.rebuild(db)
+
+        daily_scan = await measure(scan_daily, start, end, args.repeat)
+        daily_rollup = await measure(sales.daily, start, end, args.repeat)
+        category_scan = await measure(scan_categories, start, end, args.repeat)
+        category_rollup = await measure(sales.by_category, start, end, args.repeat)
+        print(f"{count:>8}{rebuild.ms:>12.0f}{daily_scan:>12.2f}{daily_rollup:>14.2f}{category_scan:>15.2f}{category_rollup:>17.2f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
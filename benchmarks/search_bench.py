@@ -0,0 +1,70 @@
+"""
+Compare the indexed search backends against the original ILIKE scan.
+
+    python -m benchmarks.search_bench --products 50000 --repeat 20
+
+Set BENCH_DATABASE_URL to a scratch Postgres database to include the tsvector backend.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import reset_schema, seed_products
+
+from app import search
+from app.database import AsyncSessionLocal, engine
+
+TERMS = ["phone", "pro max", "wireless headphones", "lapt", "samsng", "gaming monitor", "ultra", "zzz"]
+
+
+async def time_backend(backend: search.SearchBackend, repeat: int):
+    async with engine.begin() as conn:
+        await backend.setup(conn)
+
+    async with AsyncSessionLocal() as session:
+        started = time.perf_counter()
+        await backend.rebuild(session)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        timings = {}
+        for term in TERMS:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                ids = await backend.search(session, term, 1000)
+                samples.append((time.perf_counter() - started) * 1000)
+            samples.sort()
+            timings[term] = (samples[len(samples) // 2], len(ids))
+    return build_ms, timings
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    await reset_schema()
+    await seed_products(args.products)
+
+    names = ["like", "memory"]
+    if engine.dialect.name == "postgresql":
+        names.append("postgres")
+
+    print(f"{args.products} products on {engine.dialect.name}, median of {args.repeat} runs\n")
+    print(f"{'term':<22}" + "".join(f"{name + ' ms (hits)':>22}" for name in names))
+
+    results = {}
+    for name in names:
+        results[name] = await time_backend(search.create_backend(name, engine.dialect.name), args.repeat)
+
+    for term in TERMS:
+        cells = "".join(f"{results[n][1][term][0]:>13.2f} ({results[n][1][term][1]:>5})" for n in names)
+        print(f"{term:<22}{cells}")
+    print("\nindex build ms: " + ", ".join(f"{n}={results[n][0]:.0f}" for n in names))
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+CPU cost of the product listing read path per 1,000 products: ORM entities validated
+through `ProductResponse` and encoded with the standard library (the previous path),
+versus Core rows encoded with orjson. Also reports the cost and ratio of compressing the
+resulting body.
+
+    python -m benchmarks.serialization_bench --page 1000 --repeat 30
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+from benchmarks.common import reset_schema, seed_products
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy.future import select
+
+from app import models, schemas, serialization
+from app.compression import Compressor, brotli
+from app.database import AsyncSessionLocal, engine
+
+PRODUCT_LIST = TypeAdapter(List[schemas.ProductResponse])
+
+
+async def orm_path(db, limit: int) -> bytes:
+    result = await db.execute(select(models.Product).order_by(models.Product.id).limit(limit))
+    products = PRODUCT_LIST.validate_python(result.scalars().all(), from_attributes=True)
+    return json.dumps(jsonable_encoder(products)).encode()
+
+
+async def core_path(db, limit: int) -> bytes:
+    result = await db.execute(select(*serialization.PRODUCT_COLUMNS).order_by(models.Product.id).limit(limit))
+    return serialization.products_json(result.all())
+
+
+async def measure(path, limit: int, repeat: int):
+    """
+    Median CPU and wall milliseconds per call, each call in a fresh session so no
+    identities carry over.
+    """
+    cpu, wall = [], []
+    for _ in range(repeat):
+        async with AsyncSessionLocal() as db:
+            cpu_started, wall_started = time.process_time(), time.perf_counter()
+            body = await path(db, limit)
+            cpu.append((time.process_time() - cpu_started) * 1000)
+            wall.append((time.perf_counter() - wall_started) * 1000)
+    return statistics.median(cpu), statistics.median(wall), body
+
+
+def measure_compression(body: bytes, encoding: str, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        compressor = Compressor(encoding, gzip_level=6, brotli_quality=4)
+        compressed = compressor.compress(body) + compressor.finish()
+        samples.append((time.process_time() - started) * 1000)
+    return statistics.median(samples), len(compressed)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    await reset_schema()
+    await seed_products(args.products)
+
+    scale = 1000 / args.page
+    print(f"{engine.dialect.name}, pages of {args.page} products, median of {args.repeat} runs, "
+          f"figures per 1,000 products\n")
+    print(f"{'path':<28}{'cpu ms':>10}{'wall ms':>10}{'bytes':>10}")
+
+    await measure(orm_path, args.page, 2)
+    orm_cpu, orm_wall, orm_body = await measure(orm_path, args.page, args.repeat)
+    core_cpu, core_wall, core_body = await measure(core_path, args.page, args.repeat)
+    assert json.loads(orm_body) == json.loads(core_body), "read paths disagree"
+
+    print(f"{'ORM + pydantic + json':<28}{orm_cpu * scale:>10.2f}{orm_wall * scale:>10.2f}{len(orm_body):>10}")
+    print(f"{'Core rows + orjson':<28}{core_cpu * scale:>10.2f}{core_wall * scale:>10.2f}{len(core_body):>10}")
+    print(f"\nspeedup: {orm_cpu / core_cpu:.1f}x CPU, {orm_wall / core_wall:.1f}x wall\n")
+
+    print(f"{'encoding':<28}{'cpu ms':>10}{'bytes':>10}{'ratio':>10}")
+    for encoding in ["gzip", "br"] if brotli is not None else ["gzip"]:
+        cpu, size = measure_compression(core_body, encoding, args.repeat)
+        print(f"{encoding:<28}{cpu * scale:>10.2f}{size:>10}{len(core_body) / size:>10.1f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Shared fixtures. Every test gets an empty SQLite database, fresh in-process stores, and
+an httpx client that talks to the app over ASGI with its lifespan running.
+
+    pip install -r tests/requirements.txt
+    python -m pytest tests
+"""
+import os
+import shutil
+import tempfile
+
+_root = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_root}/test.db"
+os.environ["MEDIA_ROOT"] = os.path.join(_root, "media")
+os.environ.setdefault("SECRET_KEY", "test")
+# Only the outbox dispatcher (off here) builds the mail config; placeholders keep it valid.
+os.environ.setdefault("MAIL_USERNAME", "test")
+os.environ.setdefault("MAIL_PASSWORD", "test")
+os.environ.setdefault("MAIL_FROM", "test@example.com")
+os.environ.setdefault("MAIL_SERVER", "localhost")
+os.environ["OUTBOX_DISPATCH"] = "false"
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ["IDEMPOTENCY_BACKEND"] = "memory"
+# Tests send everything from one address; admission has its own tests.
+os.environ["RATE_LIMIT_BACKEND"] = "none"
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app import models, sales, schema, utils  # noqa: E402
+from app.cache import MemoryCacheBackend, product_cache  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import Base, engine, read_pins  # noqa: E402
+from app.idempotency import idempotency  # noqa: E402
+from app.images import VariantCache, image_variants  # noqa: E402
+from app.main import app  # noqa: E402
+from app.principals import principal_cache  # noqa: E402
+from app.storage import image_storage  # noqa: E402
+
+PASSWORD = "password123"
+# bcrypt is slow on purpose; users created by the fixtures share one hash.
+HASHED_PASSWORD = utils.get_password_hash(PASSWORD)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+async def reset_state() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await schema.ensure_schema(force=True)
+    product_cache.backend = MemoryCacheBackend(settings.cache_max_entries, settings.cache_max_bytes)
+    read_pins.backend = MemoryCacheBackend(settings.cache_max_entries, settings.cache_max_bytes)
+    idempotency.backend = MemoryCacheBackend(settings.idempotency_max_entries, settings.idempotency_max_bytes)
+    idempotency.results.clear()
+    principal_cache.users.clear()
+    principal_cache.tokens.clear()
+    sales._built = False
+    shutil.rmtree(image_storage.root, ignore_errors=True)
+    image_variants.cache = VariantCache(image_variants.cache.root, image_variants.cache.max_bytes)
+
+
+@pytest.fixture
+async def client(anyio_backend):
+    await reset_state()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            yield c
+    await engine.dispose()
+
+
+def auth_headers(user_id: int, role: str = "user") -> dict:
+    token = utils.create_access_token({"sub": str(user_id), "role": role, "sid": utils.new_token_id()})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def make_user(client):
+    """
+    Insert a user (password `PASSWORD`) and return the headers of a fresh access token.
+    """
+    async def make(email: str = "user@example.com", role: str = "user") -> dict:
+        async with engine.begin() as conn:
+            user_id = (await conn.execute(
+                insert(models.User).values(
+                    email=email, username=email.split("@")[0], hashed_password=HASHED_PASSWORD,
+                    role=role, is_active=True,
+                ).returning(models.User.id)
+            )).scalar_one()
+        return auth_headers(user_id, role)
+
+    return make
+
+
+@pytest.fixture
+async def user(make_user) -> dict:
+    return await make_user()
+
+
+@pytest.fixture
+async def admin(make_user) -> dict:
+    return await make_user("admin@example.com", "admin")
+
+
+@pytest.fixture
+def add_products(client, user):
+    """
+    Create products through the API; returns their ids in order.
+    """
+    async def add(*products: dict) -> list:
+        ids = []
+        for i, fields in enumerate(products):
+            body = {"name": f"Product {i}", "description": "", "price": 10.0, "stock": 10, "category": "Phones", **fields}
+            response = await client.post("/products/", json=body, headers=user)
+            assert response.status_code == 201, response.text
+            ids.append(response.json()["id"])
+        return ids
+
+    return add
@@ -0,0 +1,44 @@
+import pytest
+
+from app.admission import AdmissionController, MemoryRateLimitStore, admission
+
+
+def scope(method: str, path: str, query: bytes = b"") -> dict:
+    return {"type": "http", "method": method, "path": path, "query_string": query, "headers": []}
+
+
+@pytest.mark.parametrize("method, path, query, budget", [
+    ("POST", "/auth/login", b"", "login"),
+    ("POST", "/auth/register", b"", "register"),
+    ("GET", "/products/", b"search=phone", "search"),
+    ("GET", "/products", b"category=Phones&search=phone", "search"),
+    ("GET", "/products/", b"search=", "default"),
+    ("GET", "/products/", b"search=+++", "default"),
+    ("GET", "/products/", b"research=phone", "default"),
+    ("GET", "/products/", b"category=Phones", "default"),
+    ("GET", "/products/1", b"search=phone", "default"),
+])
+def test_route_budget(method, path, query, budget):
+    assert AdmissionController.route_budget(scope(method, path, query)) == budget
+
+
+@pytest.fixture
+def search_budget(monkeypatch):
+    """
+    Limit searches to a burst of two per client; everything else stays unlimited.
+    """
+    monkeypatch.setattr(admission, "store", MemoryRateLimitStore(100))
+    monkeypatch.setattr(admission, "budgets", {"search": (0.001, 2.0)})
+
+
+@pytest.mark.anyio
+async def test_search_budget_limits_only_real_searches(client, search_budget):
+    for _ in range(2):
+        assert (await client.get("/products/?search=phone")).status_code == 200
+    limited = await client.get("/products/?search=phone")
+    assert limited.status_code == 429
+    assert int(limited.headers["retry-after"]) >= 1
+
+    # A blank search lists the catalog and is not charged to the search budget.
+    for _ in range(3):
+        assert (await client.get("/products/?search=")).status_code == 200
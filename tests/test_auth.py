@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+from app import models
+from app.database import AsyncSessionLocal, engine
+from app.principals import principal_cache
+from app.revocation import RevocationList, revocations
+
+from .conftest import PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_me_reads_the_row_not_the_cached_principal(client, user):
+    first = await client.get("/auth/me", headers=user)
+    assert first.status_code == 200
+    user_id = first.json()["id"]
+    assert principal_cache.get(user_id) is not None
+
+    # Changed outside this process (another worker): the cached principal is now stale.
+    async with engine.begin() as conn:
+        await conn.execute(update(models.User).where(models.User.id == user_id).values(username="renamed"))
+
+    assert (await client.get("/auth/me", headers=user)).json()["username"] == "renamed"
+
+
+
+async def login(client, email: str = "user@example.com") -> dict:
+    response = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def bearer(tokens: dict) -> dict:
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+async def refresh(client, tokens: dict):
+    return await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+
+async def test_refresh_tokens_rotate(client, user):
+    first = await login(client)
+    response = await refresh(client, first)
+    assert response.status_code == 200
+    second = response.json()
+    assert second["refresh_token"] != first["refresh_token"]
+    assert (await client.get("/auth/me", headers=bearer(second))).status_code == 200
+
+
+async def test_reusing_a_refresh_token_ends_the_session(client, user):
+    first = await login(client)
+    other_session = await login(client)
+    second = (await refresh(client, first)).json()
+
+    assert (await refresh(client, first)).status_code == 401
+    # Everything issued in that session stops working; other sessions do not.
+    assert (await refresh(client, second)).status_code == 401
+    assert (await client.get("/auth/me", headers=bearer(second))).status_code == 401
+    assert (await client.get("/auth/me", headers=bearer(other_session))).status_code == 200
+
+
+async def test_logout_revokes_the_session(client, user):
+    tokens = await login(client)
+    assert (await client.get("/auth/me", headers=bearer(tokens))).status_code == 200
+    assert (await client.post("/auth/logout", headers=bearer(tokens))).status_code == 204
+
+    assert (await client.get("/auth/me", headers=bearer(tokens))).status_code == 401
+    assert (await refresh(client, tokens)).status_code == 401
+
+
+async def test_token_types_are_not_interchangeable(client, user):
+    tokens = await login(client)
+    assert (await client.get("/auth/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})).status_code == 401
+    assert (await client.post("/auth/refresh", json={"refresh_token": tokens["access_token"]})).status_code == 401
+
+
+async def test_revocations_by_other_workers_arrive_on_sync(client, user):
+    tokens = await login(client)
+    me = await client.get("/auth/me", headers=bearer(tokens))
+    claims = principal_cache.tokens.get(tokens["access_token"])
+    assert me.status_code == 200 and claims is not None
+
+    async with engine.begin() as conn:
+        await conn.execute(insert(models.TokenRevocation).values(
+            token_id=claims["sid"], expires_at=datetime.utcnow() + timedelta(days=1), created_at=datetime.utcnow(),
+        ))
+    async with AsyncSessionLocal() as db:
+        assert await revocations.sync(db) == 1
+    assert (await client.get("/auth/me", headers=bearer(tokens))).status_code == 401
+
+
+def test_filter_false_positives_do_not_revoke():
+    # A filter this small answers "maybe" for nearly everything.
+    revocation_list = RevocationList(capacity=1, error_rate=0.5, sync_interval=60)
+    for i in range(50):
+        revocation_list.remember(f"revoked-{i}", datetime.utcnow() + timedelta(days=1))
+
+    assert all(revocation_list.is_revoked({"jti": f"revoked-{i}"}) for i in range(50))
+    assert not any(revocation_list.is_revoked({"jti": f"valid-{i}", "sid": f"session-{i}"}) for i in range(50))
+    assert revocation_list.false_positives > 0
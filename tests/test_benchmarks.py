@@ -0,0 +1,48 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.images import image_variants
+from app.utils import pwd_context
+from benchmarks import load
+from benchmarks.common import reset_schema, seed_orders, seed_products, seed_users
+
+
+def result(p50: float, p95: float, rps: float, queries: float, errors: int = 0) -> dict:
+    return {"requests": 100, "errors": errors, "throughput_rps": rps, "p50_ms": p50, "p95_ms": p95,
+            "p99_ms": p95, "queries_per_request": queries}
+
+
+def test_statement_totals_reads_the_metrics_exposition():
+    exposition = "\n".join([
+        'db_statements_per_request_bucket{method="GET",route="/products/",le="1"} 3',
+        'db_statements_per_request_sum{method="GET",route="/products/"} 7',
+        'db_statements_per_request_count{method="GET",route="/products/"} 4',
+    ])
+    assert load.statement_totals(exposition) == {("GET", "/products/"): [7.0, 4.0]}
+
+
+def test_compare_flags_latency_throughput_and_query_regressions():
+    meta = {"transport": "asgi"}
+    baseline = {"meta": meta, "scenarios": {"a": result(10, 20, 100, 2), "b": result(10, 20, 100, 2)}}
+    current = {"meta": meta, "scenarios": {"a": result(10.5, 21, 95, 2), "b": result(15, 20, 70, 3)}}
+    regressions = load.compare(baseline, current, tolerance=0.15)
+    assert [message.split(":")[0] for message in regressions] == ["b", "b", "b"]
+
+
+@pytest.mark.anyio
+async def test_load_mix_runs_without_errors(client, monkeypatch):
+    monkeypatch.setattr(image_variants, "_executor", ThreadPoolExecutor(1))
+    args = argparse.Namespace(products=50, users=4, orders=10, concurrency=2, seed=1, scenarios=None,
+                              warmup=0, duration=1.0)
+    await reset_schema()
+    await seed_products(args.products)
+    await seed_users(args.users, pwd_context.hash(load.PASSWORD))
+    await seed_orders(args.orders, args.users, args.products)
+
+    results = await load.run_scenarios(client, args)
+    assert results["total"]["requests"] > 0
+    assert results["total"]["errors"] == 0, results["scenarios"]
+    # Statement counts are found by route template, so every scenario names a real route.
+    assert all(row["queries_per_request"] is not None for row in results["scenarios"].values())
@@ -0,0 +1,63 @@
+import pytest
+
+from app import facets
+from app.config import settings
+from app.database import AsyncSessionLocal
+
+pytestmark = pytest.mark.anyio
+
+
+async def prices(client) -> dict:
+    return {p["id"]: p["price"] for p in (await client.get("/products/")).json()}
+
+
+async def test_bulk_endpoints_are_admin_only(client, user):
+    body = {"where": {"category": "Phones"}, "changes": {"price_factor": 0.9}}
+    assert (await client.post("/products/bulk/update", json=body, headers=user)).status_code == 403
+    assert (await client.post("/products/bulk/delete", json={"category": "Phones"}, headers=user)).status_code == 403
+
+
+@pytest.mark.parametrize("body", [
+    {"where": {}, "changes": {"price": 1.0}},
+    {"where": {"category": "Phones"}, "changes": {}},
+    {"where": {"category": "Phones"}, "changes": {"price": 1.0, "price_factor": 0.5}},
+])
+async def test_bulk_update_validates_its_request(client, admin, body):
+    assert (await client.post("/products/bulk/update", json=body, headers=admin)).status_code == 422
+
+
+async def test_bulk_update_reprices_in_chunks(client, admin, add_products, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_chunk_size", 2)
+    phones = await add_products(*({"price": 10.0 + i} for i in range(5)))
+    [laptop] = await add_products({"price": 999.0, "category": "Laptops", "name": "Laptop"})
+    await prices(client)
+
+    body = {"where": {"category": "Phones", "max_price": 13.0}, "changes": {"price_factor": 0.5}}
+    report = (await client.post("/products/bulk/update", json=body, headers=admin)).json()
+    assert report == {"affected": 4, "chunks": 2}
+
+    # The cached listing was dropped along with the changed rows.
+    after = await prices(client)
+    assert [after[pid] for pid in phones] == [5.0, 5.5, 6.0, 6.5, 14.0]
+    assert after[laptop] == 999.0
+    async with AsyncSessionLocal() as db:
+        assert await facets.check(db) == []
+
+
+async def test_bulk_update_reindexes_search_fields(client, admin, add_products):
+    await add_products({"name": "Old Phone"})
+    body = {"where": {"category": "Phones"}, "changes": {"description": "refurbished"}}
+    assert (await client.post("/products/bulk/update", json=body, headers=admin)).json()["affected"] == 1
+    assert [p["name"] for p in (await client.get("/products/?search=refurbished")).json()] == ["Old Phone"]
+
+
+async def test_bulk_delete(client, admin, add_products):
+    keep, *drop = await add_products({"stock": 50}, {"stock": 2}, {"stock": 1})
+    await prices(client)
+
+    report = (await client.post("/products/bulk/delete", json={"max_stock": 5}, headers=admin)).json()
+    assert report["affected"] == 2
+    assert list(await prices(client)) == [keep]
+    assert (await client.get(f"/products/{drop[0]}")).status_code == 404
+    async with AsyncSessionLocal() as db:
+        assert await facets.check(db) == []
@@ -0,0 +1,53 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_etag_revalidation_returns_304(client, add_products):
+    [pid] = await add_products({})
+    first = await client.get(f"/products/{pid}")
+    assert first.status_code == 200
+    assert "last-modified" not in first.headers
+
+    again = await client.get(f"/products/{pid}", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert again.headers["etag"] == first.headers["etag"]
+
+
+async def test_product_write_invalidates_detail_and_listing(client, user, add_products):
+    [pid] = await add_products({"price": 10.0})
+    detail = await client.get(f"/products/{pid}")
+    await client.get("/products/?category=Phones")
+
+    assert (await client.patch(f"/products/{pid}", json={"price": 12.5}, headers=user)).status_code == 200
+
+    changed = await client.get(f"/products/{pid}", headers={"If-None-Match": detail.headers["etag"]})
+    assert changed.status_code == 200
+    assert changed.json()["price"] == 12.5
+    assert [p["price"] for p in (await client.get("/products/?category=Phones")).json()] == [12.5]
+
+
+async def listed_stock(client, pid: int) -> dict:
+    return {
+        scope: next(p["stock"] for p in (await client.get(url)).json() if p["id"] == pid)
+        for scope, url in (("all", "/products/"), ("category", "/products/?category=Phones"))
+    }
+
+
+async def test_cached_listings_follow_reservations_and_cancellations(client, user, add_products):
+    [pid, other] = await add_products({"stock": 5}, {"stock": 5})
+    assert await listed_stock(client, pid) == {"all": 5, "category": 5}
+
+    # A one-product cart (coalesced) and a multi-product cart take different paths.
+    single = await client.post("/orders/", json={"product_ids": [pid, pid]}, headers=user)
+    assert single.status_code == 201
+    assert await listed_stock(client, pid) == {"all": 3, "category": 3}
+
+    cart = await client.post("/orders/", json={"product_ids": [pid, other]}, headers=user)
+    assert cart.status_code == 201
+    assert await listed_stock(client, pid) == {"all": 2, "category": 2}
+
+    cancelled = await client.patch(f"/orders/{single.json()['order_id']}/cancel", headers=user)
+    assert cancelled.status_code == 200
+    assert await listed_stock(client, pid) == {"all": 4, "category": 4}
+    assert (await client.get(f"/products/{pid}")).json()["stock"] == 4
@@ -0,0 +1,46 @@
+import csv
+import io
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+CSV = (
+    "name,description,price,stock,category\n"
+    "Phone A,first,10,5,Phones\n"
+    "Phone B,second,oops,5,Phones\n"
+    "Laptop C,third,999,1,Laptops\n"
+)
+
+
+async def upload(client, headers, body: str, filename: str = "products.csv"):
+    return await client.post("/products/import", files={"file": (filename, body.encode())}, headers=headers)
+
+
+async def test_import_requires_admin(client, user):
+    assert (await upload(client, user, CSV)).status_code == 403
+
+
+async def test_csv_import_reports_invalid_rows_and_upserts_by_name(client, admin):
+    report = (await upload(client, admin, CSV)).json()
+    assert (report["processed"], report["inserted"], report["updated"], report["failed"]) == (3, 2, 0, 1)
+    assert report["errors"][0]["row"] == 3
+
+    again = (await upload(client, admin, "name,price,stock,category\nPhone A,12,5,Phones\n")).json()
+    assert (again["inserted"], again["updated"]) == (0, 1)
+    assert [p["price"] for p in (await client.get("/products/?category=Phones")).json()] == [12.0]
+
+
+async def test_upsert_refuses_names_shared_by_several_products(client, admin, add_products):
+    await add_products({"name": "Twin", "price": 1.0}, {"name": "Twin", "price": 2.0})
+    report = (await upload(client, admin, '{"name": "Twin", "price": 3, "stock": 1, "category": "Phones"}\n', "p.ndjson")).json()
+    assert (report["updated"], report["failed"]) == (0, 1)
+    assert "2 existing products" in report["errors"][0]["errors"][0]
+    assert sorted(p["price"] for p in (await client.get("/products/")).json()) == [1.0, 2.0]
+
+
+async def test_export_round_trips_the_catalog(client, admin, add_products):
+    await add_products({"name": "Phone, with comma"}, {"name": "Plain"})
+    response = await client.get("/products/export?format=csv", headers=admin)
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["name"] for row in rows] == ["Phone, with comma", "Plain"]
@@ -0,0 +1,52 @@
+import pytest
+
+from app.changefeed import ChangeHub, changefeed, order_event, product_event, stock_event
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def subscriber(client):
+    subscriber = changefeed.subscribe(None, {"products", "orders"})
+    yield subscriber
+    changefeed.hub.unsubscribe(subscriber)
+
+
+async def test_writes_publish_after_commit(client, user, subscriber, add_products):
+    [pid] = await add_products({"stock": 3})
+    await client.patch(f"/products/{pid}", json={"price": 12.0}, headers=user)
+    await client.post("/orders/", json={"product_ids": [pid]}, headers=user)
+
+    # The burst folds into the product's latest state; order events go to their owner only.
+    [event] = await subscriber.next_batch(0)
+    assert (event["type"], event["id"], event["action"], event["stock"]) == ("product", pid, "updated", 2)
+    assert event["price"] == 12.0
+
+
+async def test_order_events_reach_only_their_owner(anyio_backend):
+    hub = ChangeHub(max_pending=10, max_subscribers=10, keepalive=1)
+    owner, stranger = hub.subscribe(1, {"orders"}), hub.subscribe(2, {"orders", "products"})
+    hub.deliver([order_event(5, 1, "Processing"), stock_event(9, 4)])
+
+    assert [event["type"] for event in await owner.next_batch(0)] == ["order"]
+    assert [event["type"] for event in await stranger.next_batch(0)] == ["product"]
+
+
+async def test_slow_subscribers_are_reset(anyio_backend):
+    hub = ChangeHub(max_pending=2, max_subscribers=10, keepalive=1)
+    subscriber = hub.subscribe(None, {"products"})
+    hub.deliver([product_event("created", i) for i in range(3)])
+    assert subscriber not in hub.subscribers
+
+    stream = hub.stream(subscriber)
+    assert (await stream.__anext__()).startswith(b"retry:")
+    assert await stream.__anext__() == b"event: reset\ndata: {}\n\n"
+
+
+async def test_events_endpoint_checks_token_and_capacity(client, monkeypatch):
+    assert (await client.get("/events", params={"token": "not-a-token"})).status_code == 401
+
+    monkeypatch.setattr(changefeed.hub, "max_subscribers", 0)
+    response = await client.get("/events")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
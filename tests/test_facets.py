@@ -0,0 +1,49 @@
+import pytest
+
+from app import facets
+from app.database import AsyncSessionLocal
+
+pytestmark = pytest.mark.anyio
+
+
+async def assert_consistent() -> None:
+    async with AsyncSessionLocal() as db:
+        assert await facets.check(db) == []
+
+
+def by_category(body: dict) -> dict:
+    return {facet["category"]: facet for facet in body["categories"]}
+
+
+async def test_facets_follow_product_writes(client, user, add_products):
+    cheap, pricey, laptop = await add_products(
+        {"price": 10.0, "stock": 1}, {"price": 30.0, "stock": 5}, {"price": 900.0, "category": "Laptops"},
+    )
+    body = (await client.get("/products/facets")).json()
+    assert (body["product_count"], body["min_price"], body["max_price"]) == (3, 10.0, 900.0)
+    phones = by_category(body)["Phones"]
+    assert (phones["product_count"], phones["in_stock_count"], phones["avg_price"]) == (2, 2, 20.0)
+    await assert_consistent()
+
+    await client.patch(f"/products/{pricey}", json={"price": 50.0}, headers=user)
+    await client.patch(f"/products/{laptop}", json={"category": "Phones"}, headers=user)
+    assert (await client.post("/orders/", json={"product_ids": [cheap]}, headers=user)).status_code == 201
+    await assert_consistent()
+    phones = by_category((await client.get("/products/facets")).json())["Phones"]
+    assert (phones["product_count"], phones["in_stock_count"], phones["max_price"]) == (3, 2, 900.0)
+
+    await client.delete(f"/products/{cheap}", headers=user)
+    await assert_consistent()
+    body = (await client.get("/products/facets")).json()
+    assert list(by_category(body)) == ["Phones"]
+    assert (body["product_count"], body["in_stock_count"], body["min_price"]) == (2, 2, 50.0)
+
+
+async def test_facets_of_a_search(client, add_products):
+    await add_products({"name": "Galaxy Phone", "price": 300.0}, {"name": "Pixel Phone", "price": 500.0},
+                       {"name": "Galaxy Book", "category": "Laptops", "price": 1000.0})
+    body = (await client.get("/products/facets", params={"search": "galaxy"})).json()
+    assert body["product_count"] == 2
+    assert {category: facet["product_count"] for category, facet in by_category(body).items()} == {"Laptops": 1, "Phones": 1}
+
+    assert (await client.get("/products/facets", params={"search": "nothing"})).json()["product_count"] == 0
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app import models
+from app.database import engine
+
+from .conftest import PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+
+async def order_count() -> int:
+    async with engine.connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(models.Order))
+
+
+def keyed(headers: dict, key: str = "key-1") -> dict:
+    return {**headers, "Idempotency-Key": key}
+
+
+async def test_retried_order_is_replayed_not_placed_again(client, user, add_products):
+    [pid] = await add_products({})
+    first = await client.post("/orders/", json={"product_ids": [pid]}, headers=keyed(user))
+    again = await client.post("/orders/", json={"product_ids": [pid]}, headers=keyed(user))
+
+    assert first.status_code == again.status_code == 201
+    assert again.json() == first.json()
+    assert again.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert await order_count() == 1
+
+
+async def test_key_reused_for_another_request_is_refused(client, user, add_products):
+    pid, other = await add_products({}, {})
+    assert (await client.post("/orders/", json={"product_ids": [pid]}, headers=keyed(user))).status_code == 201
+    assert (await client.post("/orders/", json={"product_ids": [other]}, headers=keyed(user))).status_code == 422
+    assert await order_count() == 1
+
+
+async def test_keys_are_scoped_to_the_caller(client, user, make_user, add_products):
+    [pid] = await add_products({})
+    other = await make_user("other@example.com")
+    await client.post("/orders/", json={"product_ids": [pid]}, headers=keyed(user))
+    response = await client.post("/orders/", json={"product_ids": [pid]}, headers=keyed(other))
+    assert "idempotent-replayed" not in response.headers
+    assert await order_count() == 2
+
+
+async def test_concurrent_duplicates_wait_for_the_first(client, user, add_products):
+    [pid] = await add_products({})
+    responses = await asyncio.gather(*(
+        client.post("/orders/", json={"product_ids": [pid]}, headers=keyed(user)) for _ in range(3)
+    ))
+    assert {response.json()["order_id"] for response in responses} == {responses[0].json()["order_id"]}
+    assert await order_count() == 1
+
+
+async def test_token_endpoints_are_never_replayed(client, user):
+    login = {"username": "user@example.com", "password": PASSWORD}
+    first = await client.post("/auth/login", data=login, headers={"Idempotency-Key": "login"})
+    second = await client.post("/auth/login", data=login, headers={"Idempotency-Key": "login"})
+    assert "idempotent-replayed" not in second.headers
+    assert second.json()["access_token"] != first.json()["access_token"]
+
+    body = {"refresh_token": first.json()["refresh_token"]}
+    assert (await client.post("/auth/refresh", json=body, headers={"Idempotency-Key": "refresh"})).status_code == 200
+    # A replay would hand the rotated-away token's successor out a second time.
+    assert (await client.post("/auth/refresh", json=body, headers={"Idempotency-Key": "refresh"})).status_code == 401
@@ -0,0 +1,79 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+from app import images
+from app.config import settings
+from app.images import image_variants
+
+pytestmark = pytest.mark.anyio
+
+
+def png(width: int = 64, height: int = 48) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def upload(client, headers, body: bytes) -> dict:
+    response = await client.post("/files/upload/", files={"file": ("x.png", body, "image/png")}, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.fixture
+def in_process_renderer(monkeypatch):
+    # Threads share this process's Pillow settings and monkeypatches.
+    monkeypatch.setattr(image_variants, "_executor", ThreadPoolExecutor(1))
+
+
+async def test_variant_is_rendered_once_and_cached(client, user, in_process_renderer):
+    stored = await upload(client, user, png())
+    url = stored["variants"]["thumb"]
+
+    first = await client.get(url)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(first.content)).size == (64, 48)
+    rendered = image_variants.rendered
+
+    assert (await client.get(url)).content == first.content
+    assert image_variants.rendered == rendered
+
+
+async def test_decompression_bomb_is_422(client, user, in_process_renderer, monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100)
+    stored = await upload(client, user, png())
+    assert (await client.get(stored["variants"]["card"])).status_code == 422
+
+
+async def test_dead_worker_pool_is_503_and_replaced(client, user, monkeypatch):
+    class DeadPool(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(settings, "image_pregenerate", False)
+    stored = await upload(client, user, png())
+    monkeypatch.setattr(image_variants, "_executor", DeadPool(1))
+    response = await client.get(stored["variants"]["large"])
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert image_variants._executor is None
+
+
+def test_failed_encode_leaves_no_temp_file(tmp_path, monkeypatch):
+    source = tmp_path / "source.png"
+    source.write_bytes(png())
+
+    def failing_save(self, fp, *args, **kwargs):
+        with open(fp, "wb") as partial:
+            partial.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Image.Image, "save", failing_save)
+    with pytest.raises(OSError):
+        images.render_variant(str(source), str(tmp_path / "thumb.webp"), (160, 160), "WEBP", 80)
+    assert [path.name for path in tmp_path.iterdir()] == ["source.png"]
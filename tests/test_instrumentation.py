@@ -0,0 +1,54 @@
+import pytest
+from starlette.routing import Route
+
+from app import instrumentation
+
+pytestmark = pytest.mark.anyio
+
+
+def metric_lines(text: str, prefix: str) -> list:
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+async def test_requests_are_labelled_by_full_route_template(client, add_products):
+    [pid] = await add_products({})
+    await client.get(f"/products/{pid}")
+    await client.get("/no/such/path")
+
+    text = (await client.get("/metrics")).text
+    requests = metric_lines(text, "http_requests_total")
+    assert any('route="/products/{product_id}"' in line and 'method="GET"' in line for line in requests)
+    assert any('route="<unmatched>"' in line and 'status="404"' in line for line in requests)
+    assert not any(f"/products/{pid}\"" in line for line in requests)
+
+
+async def statements(client) -> tuple:
+    # Metrics live for the whole process, so tests compare before and after.
+    text = (await client.get("/metrics")).text
+    labels = 'method="GET",route="/products/{product_id}"'
+    values = {
+        name: sum(float(line.split()[-1]) for line in metric_lines(text, f"db_statements_per_request_{name}{{{labels}}}"))
+        for name in ("count", "sum")
+    }
+    return values["count"], values["sum"]
+
+
+async def test_statements_are_counted_per_request(client, add_products):
+    [pid] = await add_products({})
+    count, total = await statements(client)
+    await client.get(f"/products/{pid}")
+    after_count, after_total = await statements(client)
+    assert after_count == count + 1
+    assert after_total == total + 1
+    # A cache hit runs no statement at all.
+    await client.get(f"/products/{pid}")
+    assert await statements(client) == (count + 2, total + 1)
+
+
+def test_route_label_without_fastapi_route_contexts(monkeypatch):
+    # FastAPI releases without the helper copy included routes with their full path.
+    monkeypatch.setattr(instrumentation, "iter_route_contexts", None)
+    middleware = instrumentation.InstrumentationMiddleware(None)
+    route = Route("/products/{product_id:int}", lambda request: None)
+    assert middleware.route_label({"route": route}) == "/products/{product_id}"
+    assert middleware.route_label({}) == "<unmatched>"
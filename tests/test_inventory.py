@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from app import models
+from app.database import engine
+
+pytestmark = pytest.mark.anyio
+
+
+async def stock(client, pid: int) -> int:
+    return (await client.get(f"/products/{pid}")).json()["stock"]
+
+
+async def order(client, headers, product_ids: list):
+    return await client.post("/orders/", json={"product_ids": product_ids}, headers=headers)
+
+
+async def test_cart_is_reserved_all_or_nothing(client, user, add_products):
+    plenty, scarce = await add_products({"stock": 5}, {"stock": 1})
+
+    response = await order(client, user, [plenty, scarce, scarce])
+    assert response.status_code == 409
+    assert (await stock(client, plenty), await stock(client, scarce)) == (5, 1)
+
+    assert (await order(client, user, [plenty, scarce])).status_code == 201
+    assert (await stock(client, plenty), await stock(client, scarce)) == (4, 0)
+
+
+async def test_flash_sale_never_oversells(client, user, add_products):
+    [pid] = await add_products({"stock": 10})
+
+    responses = await asyncio.gather(*(order(client, user, [pid]) for _ in range(30)))
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [201] * 10 + [409] * 20
+    assert await stock(client, pid) == 0
+
+
+async def test_cancelling_returns_the_stock(client, user, add_products):
+    pid, other = await add_products({"stock": 3}, {"stock": 3})
+    order_id = (await order(client, user, [pid, pid, other])).json()["order_id"]
+    assert (await stock(client, pid), await stock(client, other)) == (1, 2)
+
+    assert (await client.patch(f"/orders/{order_id}/cancel", headers=user)).status_code == 200
+    assert (await stock(client, pid), await stock(client, other)) == (3, 3)
+
+
+async def test_untracked_stock_always_reserves(client, user, add_products):
+    [pid] = await add_products({})
+    # The API requires a stock level; older rows may have none.
+    async with engine.begin() as conn:
+        await conn.execute(update(models.Product).where(models.Product.id == pid).values(stock=None))
+    assert (await order(client, user, [pid, pid])).status_code == 201
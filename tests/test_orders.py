@@ -0,0 +1,113 @@
+import pytest
+from sqlalchemy import delete, event, select
+
+from app import models, order_summaries
+from app.database import AsyncSessionLocal, engine
+
+pytestmark = pytest.mark.anyio
+
+
+class ProductQueries:
+    """
+    Counts the statements that read the products table while in use.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM products" in statement:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(engine.sync_engine, "before_cursor_execute", self._count)
+
+
+async def test_order_records_line_items(client, user, add_products):
+    phone, case = await add_products({"name": "Phone", "price": 100.0}, {"name": "Case", "price": 5.5})
+
+    response = await client.post("/orders/", json={"product_ids": [phone, case, phone]}, headers=user)
+    assert response.status_code == 201, response.text
+    order_id = response.json()["order_id"]
+    assert response.json()["total"] == 205.5
+
+    async with engine.connect() as conn:
+        items = (await conn.execute(
+            select(models.OrderItem.product_id, models.OrderItem.product_name, models.OrderItem.quantity,
+                   models.OrderItem.unit_price)
+            .where(models.OrderItem.order_id == order_id)
+            .order_by(models.OrderItem.product_id)
+        )).all()
+    assert [tuple(item) for item in items] == [(phone, "Phone", 2, 100.0), (case, "Case", 1, 5.5)]
+
+
+async def test_order_reads_products_with_one_query(client, user, add_products):
+    ids = await add_products(*({} for _ in range(6)))
+
+    with ProductQueries() as one:
+        assert (await client.post("/orders/", json={"product_ids": ids[:1]}, headers=user)).status_code == 201
+    with ProductQueries() as many:
+        assert (await client.post("/orders/", json={"product_ids": ids}, headers=user)).status_code == 201
+    assert 0 < many.count == one.count
+
+
+async def test_order_without_known_products_is_rejected(client, user):
+    response = await client.post("/orders/", json={"product_ids": [999]}, headers=user)
+    assert response.status_code == 400
+
+
+async def place_orders(client, headers, product_id: int, count: int) -> list:
+    ids = []
+    for _ in range(count):
+        response = await client.post("/orders/", json={"product_ids": [product_id]}, headers=headers)
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["order_id"])
+    return ids
+
+
+async def test_order_history_pages_newest_first(client, user, make_user, add_products):
+    [pid] = await add_products({})
+    placed = await place_orders(client, user, pid, 5)
+    await place_orders(client, await make_user("other@example.com"), pid, 1)
+
+    seen, cursor = [], None
+    while True:
+        response = await client.get("/orders/", params={"limit": 2, **({"cursor": cursor} if cursor else {})}, headers=user)
+        assert response.status_code == 200
+        seen.extend(order["id"] for order in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert seen == placed[::-1]
+
+    assert (await client.get("/orders/", params={"cursor": "garbage"}, headers=user)).status_code == 400
+
+
+async def test_me_summarizes_orders_and_cancellations(client, user, add_products):
+    [pid] = await add_products({"price": 20.0})
+    first, second, third = await place_orders(client, user, pid, 3)
+    assert (await client.patch(f"/orders/{second}/cancel", headers=user)).status_code == 200
+
+    summary = (await client.get("/auth/me", headers=user)).json()["order_summary"]
+    assert summary["order_count"] == 3
+    assert summary["cancelled_count"] == 1
+    assert summary["lifetime_spend"] == 40.0
+    assert summary["last_order"]["id"] == third
+
+    # The maintained row agrees with one computed from the orders table.
+    async with AsyncSessionLocal() as db:
+        await order_summaries.rebuild(db)
+    assert (await client.get("/auth/me", headers=user)).json()["order_summary"] == summary
+
+
+async def test_summary_is_backfilled_for_older_orders(client, user, add_products):
+    [pid] = await add_products({"price": 20.0})
+    await place_orders(client, user, pid, 2)
+    async with engine.begin() as conn:
+        await conn.execute(delete(models.OrderSummary))
+
+    summary = (await client.get("/auth/me", headers=user)).json()["order_summary"]
+    assert (summary["order_count"], summary["lifetime_spend"]) == (2, 40.0)
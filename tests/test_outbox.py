@@ -0,0 +1,79 @@
+import aiosmtplib
+import pytest
+from sqlalchemy import update
+from sqlalchemy.future import select
+
+from app import models
+from app.database import engine
+from app.outbox import OutboxDispatcher
+
+pytestmark = pytest.mark.anyio
+
+
+def dispatcher() -> OutboxDispatcher:
+    return OutboxDispatcher(batch_size=10, poll_seconds=1, max_attempts=3, backoff_seconds=30,
+                            max_backoff_seconds=3600, lease_seconds=300, idle_seconds=60)
+
+
+async def outbox_rows() -> list:
+    async with engine.connect() as conn:
+        return (await conn.execute(select(models.OutboxEmail).order_by(models.OutboxEmail.id))).all()
+
+
+async def register(client, email: str) -> None:
+    body = {"email": email, "username": email.split("@")[0], "password": "password123"}
+    assert (await client.post("/auth/register", json=body)).status_code == 201
+
+
+async def test_registration_queues_a_welcome_email_that_is_sent_once(client):
+    await register(client, "new@example.com")
+    [row] = await outbox_rows()
+    assert (row.recipient, row.template, row.status) == ("new@example.com", "welcome.html", "pending")
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    worker = dispatcher()
+    worker._send = send
+    assert await worker.dispatch_batch() == 1
+    assert await worker.dispatch_batch() == 0
+
+    assert [message["To"] for message in sent] == ["new@example.com"]
+    assert "new" in sent[0].get_content()
+    [row] = await outbox_rows()
+    assert (row.status, row.attempts) == ("sent", 1)
+
+
+@pytest.mark.parametrize("code, status", [(451, "pending"), (550, "failed")])
+async def test_smtp_errors_are_retried_or_given_up(client, code, status):
+    await register(client, "new@example.com")
+
+    async def send(message):
+        raise aiosmtplib.SMTPResponseException(code, "nope")
+
+    worker = dispatcher()
+    worker._send = send
+    assert await worker.dispatch_batch() == 1
+    [row] = await outbox_rows()
+    assert (row.status, row.attempts, row.last_error) == (status, 1, f"{code} nope")
+    # A retry is not due yet.
+    assert await worker.dispatch_batch() == 0
+
+
+async def test_retries_stop_after_max_attempts(client):
+    await register(client, "new@example.com")
+
+    async def send(message):
+        raise ConnectionRefusedError("down")
+
+    worker = dispatcher()
+    worker._send = send
+    for _ in range(3):
+        async with engine.begin() as conn:
+            await conn.execute(update(models.OutboxEmail).values(next_attempt_at=models.OutboxEmail.created_at))
+        assert await worker.dispatch_batch() == 1
+    [row] = await outbox_rows()
+    assert (row.status, row.attempts) == ("failed", 3)
+    assert worker.stats()["retried"] == 2
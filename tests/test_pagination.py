@@ -0,0 +1,53 @@
+import orjson
+import pytest
+from sqlalchemy import insert
+
+from app import models
+from app.database import engine
+
+pytestmark = pytest.mark.anyio
+
+
+async def pages(client, url: str) -> list:
+    ids, cursor = [], None
+    while True:
+        response = await client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200, response.text
+        ids += [product["id"] for product in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return ids
+
+
+async def test_keyset_pages_cover_the_catalog_once(client, add_products):
+    ids = await add_products(*({} for _ in range(7)))
+    assert await pages(client, "/products/?limit=3") == ids
+
+
+async def test_category_sort_pages_through_uncategorized_products(client):
+    # The API requires a category, but imported and older rows can have none.
+    categories = ["Phones", None, "Laptops", None, "Phones", None]
+    async with engine.begin() as conn:
+        await conn.execute(insert(models.Product), [
+            {"id": i + 1, "name": f"Product {i}", "price": 1.0, "stock": 1, "category": category}
+            for i, category in enumerate(categories)
+        ])
+    ids = list(range(1, 7))
+    listed = await pages(client, "/products/?sort=category&limit=2")
+    # Uncategorized first, then by category and id.
+    assert listed == [ids[1], ids[3], ids[5], ids[2], ids[0], ids[4]]
+
+
+async def test_ndjson_streams_every_product(client, add_products):
+    ids = await add_products(*({} for _ in range(5)))
+    response = await client.get("/products/?format=ndjson")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [orjson.loads(line)["id"] for line in response.text.splitlines()] == ids
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "eyJzIjoiaWQiLCJrIjpbIngiXX0", "eyJzIjoiY2F0ZWdvcnkiLCJrIjpbMV19"])
+async def test_malformed_or_mismatched_cursors_are_refused(client, add_products, cursor):
+    # A string where the id goes, and a category cursor used with the id sort.
+    await add_products({})
+    response = await client.get(f"/products/?limit=1&cursor={cursor}")
+    assert response.status_code == 400
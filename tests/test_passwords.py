@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from app.passwords import HasherBusy, PasswordHasher
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_register_then_login(client):
+    body = {"email": "new@example.com", "username": "new", "password": "password123"}
+    assert (await client.post("/auth/register", json=body)).status_code == 201
+    assert (await client.post("/auth/register", json=body)).status_code == 409
+
+    login = await client.post("/auth/login", data={"username": "new@example.com", "password": "password123"})
+    assert login.status_code == 200
+    assert login.json()["token_type"] == "bearer"
+
+    wrong = await client.post("/auth/login", data={"username": "new@example.com", "password": "wrong-password"})
+    assert wrong.status_code == 401
+
+
+async def test_hasher_runs_off_the_event_loop(anyio_backend):
+    hasher = PasswordHasher("thread", workers=1, max_concurrency=1, max_queue=1)
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    ticker = asyncio.ensure_future(tick())
+    try:
+        hashed = await hasher.hash("password123")
+    finally:
+        ticker.cancel()
+        hasher.shutdown()
+    assert ticks > 1
+    assert hashed.startswith("$2")
+
+
+async def test_hasher_rejects_beyond_its_queue(anyio_backend):
+    hasher = PasswordHasher("thread", workers=1, max_concurrency=1, max_queue=0)
+    running = asyncio.ensure_future(hasher.hash("password123"))
+    await asyncio.sleep(0)
+    try:
+        with pytest.raises(HasherBusy):
+            await hasher.hash("password123")
+        assert await hasher.verify("password123", await running)
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()["rejected"] == 1
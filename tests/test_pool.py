@@ -0,0 +1,31 @@
+import pytest
+
+from app import database
+from app.config import settings
+
+
+def test_engine_options_configure_the_pool():
+    options = database.engine_options("postgresql+asyncpg://db/store")
+    assert issubclass(options["poolclass"], database.InstrumentedQueuePool)
+    assert options["pool_size"] == settings.db_pool_size
+    assert options["connect_args"] == {"prepared_statement_cache_size": settings.db_statement_cache_size}
+    # Each engine gets metrics of its own.
+    assert database.engine_options("sqlite+aiosqlite:///a.db")["poolclass"].metrics is not options["poolclass"].metrics
+
+
+def test_in_memory_sqlite_keeps_its_default_pool():
+    assert database.engine_options("sqlite+aiosqlite://") == {}
+    assert database.engine_options("sqlite+aiosqlite:///:memory:") == {}
+
+
+@pytest.mark.anyio
+async def test_pool_status_is_admin_only_and_counts_checkouts(client, user, admin):
+    assert (await client.get("/admin/pool", headers=user)).status_code == 403
+
+    before = (await client.get("/admin/pool", headers=admin)).json()
+    await client.get("/products/")
+    status = (await client.get("/admin/pool", headers=admin)).json()
+    assert status["class"] == "InstrumentedQueuePool"
+    assert status["size"] == settings.db_pool_size
+    assert status["checked_out"] == 0
+    assert status["checkout_wait_seconds"]["count"] > before["checkout_wait_seconds"]["count"]
@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import insert, select
+
+from app import database, models
+from app.database import Base, ReplicaSet, engine
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def other(make_user) -> dict:
+    return await make_user("other@example.com")
+
+
+@pytest.fixture
+async def replicas(client, user, other, tmp_path, monkeypatch):
+    """
+    Route reads to one SQLite "replica" holding copies of the users, renamed so that a
+    read shows where it came from.
+    """
+    async with engine.connect() as conn:
+        users = [dict(row._mapping) for row in (await conn.execute(select(models.User.__table__)))]
+    replica_set = ReplicaSet([f"sqlite+aiosqlite:///{tmp_path}/replica.db"], "round_robin", 5.0, 30.0, 60.0)
+    async with replica_set.replicas[0].engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(models.User), [{**row, "username": "replica-" + row["username"]} for row in users])
+    monkeypatch.setattr(database, "replica_set", replica_set)
+    yield replica_set
+    await replica_set.stop()
+
+
+async def username(client, headers) -> str:
+    response = await client.get("/auth/me", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["username"]
+
+
+async def test_reads_go_to_the_replica(client, user, replicas):
+    [replica] = replicas.replicas
+    assert await username(client, user) == "replica-user"
+    assert replica.reads == 1
+    assert replica.in_flight == 0
+
+
+async def test_writers_read_their_writes_from_the_primary(client, user, other, replicas):
+    address = {"street": "1 Main St", "city": "Springfield", "zip_code": "62701"}
+    assert (await client.post("/auth/address", json=address, headers=user)).status_code == 200
+
+    assert await username(client, user) == "user"
+    assert await username(client, other) == "replica-other"
+
+
+async def test_unreachable_replica_falls_back_to_the_primary(client, user, tmp_path, monkeypatch):
+    replica_set = ReplicaSet([f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db"], "round_robin", 5.0, 30.0, 60.0)
+    monkeypatch.setattr(database, "replica_set", replica_set)
+    try:
+        assert await username(client, user) == "user"
+        [replica] = replica_set.replicas
+        assert replica.failures == 1
+        assert not replica_set.available(replica)
+        assert replica_set.primary_reads == 1
+    finally:
+        await replica_set.stop()
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app.cache import ProductCache, RespCacheBackend
+from app.resp import RespClient, RespServer, read_reply
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def server(anyio_backend):
+    server = RespServer()
+    port = await server.start(port=0)
+    yield f"redis://127.0.0.1:{port}/0"
+    await server.stop()
+
+
+@pytest.fixture
+async def slow_server(anyio_backend):
+    """
+    Answers `GET slow` only after half a second, everything else at once.
+    """
+    store = RespServer()
+
+    async def serve(reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                if command == [b"GET", b"slow"]:
+                    await asyncio.sleep(0.5)
+                    reply = b"late"
+                else:
+                    reply = store.handle(command)
+                writer.write(RespServer.encode_reply(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    yield f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+    server.close()
+
+
+async def test_timed_out_reply_is_never_read_as_the_next_one(slow_server):
+    client = RespClient(slow_server, timeout=0.1)
+    with pytest.raises(ConnectionError):
+        await client.execute("GET", "slow")
+    assert await client.execute("SET", "key", "value") == "OK"
+    assert await client.execute("GET", "key") == b"value"
+    await client.close()
+
+
+async def test_cancelled_command_drops_the_connection(slow_server):
+    client = RespClient(slow_server)
+    command = asyncio.ensure_future(client.execute("GET", "slow"))
+    await asyncio.sleep(0.1)
+    command.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await command
+    assert await client.execute("PING") == "PONG"
+    await client.close()
+
+
+async def test_unreachable_store_fails_open(anyio_backend):
+    backend = RespCacheBackend("redis://127.0.0.1:1/0")
+    await backend.set("key", b"value", 10)
+    assert await backend.get("key") is None
+    assert await backend.add("key", b"value", 1.0) is True
+
+
+async def test_invalidation_reaches_every_worker_sharing_the_store(server):
+    # Two workers' caches over one store: a write in one makes the other's listing key stale.
+    first, second = ProductCache(RespCacheBackend(server), 60), ProductCache(RespCacheBackend(server), 60)
+    key = await first.list_key("Phones", "id", 50, None)
+    await first.put(key, b"[]")
+    assert (await second.get(await second.list_key("Phones", "id", 50, None))).body == b"[]"
+
+    await second.invalidate([1], ["Phones"])
+    assert await first.get(await first.list_key("Phones", "id", 50, None)) is None
+    assert await first.list_key("Laptops", "id", 50, None) == await second.list_key("Laptops", "id", 50, None)
+    for cache in (first, second):
+        await cache.backend.close()
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from app import models, sales, serve
+from app.database import AsyncSessionLocal, engine
+
+pytestmark = pytest.mark.anyio
+
+
+async def reports(client, headers) -> tuple:
+    daily = await client.get("/admin/sales/daily", headers=headers)
+    categories = await client.get("/admin/sales/categories", headers=headers)
+    assert daily.status_code == categories.status_code == 200
+    return daily.json(), categories.json()
+
+
+async def test_rollups_match_a_rebuild(client, user, admin, add_products):
+    phone, case, laptop = await add_products(
+        {"price": 100.0}, {"price": 10.0, "category": "Accessories"}, {"price": 1000.0, "category": "Laptops"},
+    )
+    placed = []
+    for cart in ([phone, case, case], [laptop], [phone, laptop]):
+        response = await client.post("/orders/", json={"product_ids": cart}, headers=user)
+        placed.append(response.json()["order_id"])
+    assert (await client.patch(f"/orders/{placed[1]}/cancel", headers=user)).status_code == 200
+    # Orders stay in the category their products had when placed.
+    await client.patch(f"/products/{case}", json={"category": "Phones"}, headers=user)
+
+    daily, categories = await reports(client, admin)
+    today = daily[-1]
+    assert (today["order_count"], today["cancelled_count"], today["units"]) == (3, 1, 5)
+    assert (today["revenue"], today["cancelled_revenue"]) == (1220.0, 1000.0)
+    by_name = {row["category"]: row for row in categories}
+    assert (by_name["Phones"]["order_count"], by_name["Phones"]["revenue"]) == (2, 200.0)
+    assert (by_name["Accessories"]["units"], by_name["Laptops"]["cancelled_count"]) == (2, 1)
+
+    async with AsyncSessionLocal() as db:
+        await sales.rebuild(db, chunk_size=2)
+    assert await reports(client, admin) == (daily, categories)
+
+
+async def test_reports_are_admin_only_and_bounded(client, user, admin):
+    assert (await client.get("/admin/sales/daily", headers=user)).status_code == 403
+    params = {"start": "2026-01-02", "end": "2026-01-01"}
+    assert (await client.get("/admin/sales/daily", params=params, headers=admin)).status_code == 400
+    params = {"start": "2020-01-01", "end": "2026-01-01"}
+    assert (await client.get("/admin/sales/categories", params=params, headers=admin)).status_code == 400
+
+
+async def insert_old_order(user_id: int = 1) -> None:
+    async with engine.begin() as conn:
+        order_id = (await conn.execute(insert(models.Order).values(
+            user_id=user_id, total_price=30.0, status="Processing", created_at=datetime.utcnow(),
+        ).returning(models.Order.id))).scalar_one()
+        await conn.execute(insert(models.OrderItem).values(
+            order_id=order_id, product_id=None, product_name="Old", quantity=3, unit_price=10.0,
+        ))
+
+
+async def rollup_rows() -> int:
+    async with engine.connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(models.SalesDay))
+
+
+async def test_older_orders_are_rolled_up_once_before_workers_fork(client, user, monkeypatch):
+    await insert_old_order()
+
+    # A forked worker inherits the parent's flag and leaves the rollups alone.
+    monkeypatch.setattr(sales, "_built", True)
+    async with AsyncSessionLocal() as db:
+        await sales.ensure_built(db)
+    assert await rollup_rows() == 0
+
+    monkeypatch.setattr(sales, "_built", False)
+    await serve.prepare()
+    assert sales._built
+    assert await rollup_rows() > 0
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.search import MemorySearchBackend
+
+
+def product(product_id: int, name: str, category: str = "Phones", description: str = "", specs: str = ""):
+    return SimpleNamespace(id=product_id, name=name, category=category, description=description, specs=specs)
+
+
+def test_memory_index_ranks_exact_prefix_and_fuzzy_matches():
+    index = MemorySearchBackend()
+    index.add(product(1, "Galaxy Phone"))
+    index.add(product(2, "Pixel", description="A phone with a good camera"))
+    index.add(product(3, "Laptop stand", category="Accessories"))
+
+    # A name match outweighs a description match.
+    assert index.rank("phone", 10) == [1, 2]
+    assert index.rank("gal", 10) == [1]
+    assert index.rank("laptpo", 10) == [3]
+    # Every query token has to match.
+    assert index.rank("phone camera", 10) == [2]
+    assert index.rank("phone stand", 10) == []
+
+
+def test_memory_index_forgets_removed_and_replaced_products():
+    index = MemorySearchBackend()
+    index.add(product(1, "Galaxy Phone", category="Gadgets"))
+    index.add(product(1, "Galaxy Tablet", category="Gadgets"))
+    assert index.rank("phone", 10) == []
+    assert index.rank("tablet", 10) == [1]
+
+    index.remove(1)
+    assert index.rank("tablet", 10) == []
+    assert len(index) == 0
+
+
+@pytest.mark.anyio
+async def test_search_endpoint_follows_writes(client, user, add_products):
+    phone, laptop = await add_products({"name": "Galaxy Phone"}, {"name": "Gaming Laptop", "category": "Computers"})
+
+    names = lambda response: [p["name"] for p in response.json()]
+    assert names(await client.get("/products/?search=galaxy")) == ["Galaxy Phone"]
+    assert names(await client.get("/products/?search=ga&category=Computers")) == ["Gaming Laptop"]
+
+    await client.patch(f"/products/{phone}", json={"name": "Pixel Phone"}, headers=user)
+    assert (await client.get("/products/?search=galaxy")).json() == []
+    assert names(await client.get("/products/?search=pixel")) == ["Pixel Phone"]
+
+    await client.delete(f"/products/{laptop}", headers=user)
+    assert (await client.get("/products/?search=laptop")).json() == []
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from app import compression, models, schemas, serialization
+
+
+@pytest.mark.parametrize("image_url", [None, "/media/ab/cd/abcd.png"])
+def test_product_json_matches_the_response_model(image_url):
+    product = models.Product(id=7, name="Phone", description="Nice", specs="8GB", price=99.5, stock=3,
+                             image_url=image_url, category="Phones")
+    row = [getattr(product, name) for name in serialization.PRODUCT_FIELDS]
+
+    expected = schemas.ProductResponse.model_validate(product).model_dump(mode="json")
+    fast = json.loads(serialization.product_json(row))
+    assert list(fast) == list(expected)
+    assert fast == expected
+
+
+@pytest.mark.parametrize("header, encoding", [
+    ("gzip", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("deflate", None),
+    ("*", "br" if compression.brotli is not None else "gzip"),
+    ("", None),
+])
+def test_negotiate(header, encoding):
+    assert compression.negotiate(header) == encoding
+
+
+@pytest.mark.anyio
+async def test_large_listings_are_compressed(client, add_products):
+    await add_products(*({"description": "x" * 200} for _ in range(20)))
+
+    plain = await client.get("/products/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    gzipped = await client.get("/products/", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in gzipped.headers["vary"].lower()
+    assert gzipped.json() == plain.json()
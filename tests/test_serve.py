@@ -0,0 +1,76 @@
+import json
+import sys
+
+import pytest
+from sqlalchemy import delete, text
+
+from app import models, schema, serve, warmup
+from app.cache import product_cache
+from app.config import settings
+from app.database import engine
+
+
+@pytest.mark.parametrize("workers, cache, idempotency, unshared", [
+    (1, "memory", "memory", []),
+    (4, "memory", "memory", ["cache_backend", "idempotency_backend"]),
+    (4, "redis", "memory", ["idempotency_backend"]),
+    (4, "redis", "redis", []),
+    (4, "none", "none", []),
+])
+def test_unshared_backends(monkeypatch, workers, cache, idempotency, unshared):
+    monkeypatch.setattr(settings, "cache_backend", cache)
+    monkeypatch.setattr(settings, "idempotency_backend", idempotency)
+    assert serve.unshared_backends(workers) == unshared
+
+
+def test_refuses_several_workers_on_memory_backends(monkeypatch):
+    monkeypatch.setattr(settings, "cache_backend", "memory")
+    monkeypatch.setattr(settings, "idempotency_backend", "redis")
+    monkeypatch.setattr(sys, "argv", ["serve", "--workers", "2"])
+
+    def prepare():
+        raise AssertionError("started despite an unshared cache")
+
+    monkeypatch.setattr(serve, "prepare", prepare)
+    with pytest.raises(SystemExit) as exit_info:
+        serve.main()
+    assert "CACHE_BACKEND=redis" in str(exit_info.value.code)
+
+
+async def index_names() -> set:
+    async with engine.connect() as conn:
+        return set((await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))).scalars())
+
+
+@pytest.mark.anyio
+async def test_schema_is_checked_once_and_restores_missing_indexes(client, monkeypatch):
+    monkeypatch.setattr(schema, "_verified", None)
+    assert await schema.ensure_schema() is False
+
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_products_category_key_id"))
+        await conn.execute(delete(models.SchemaFingerprint))
+    assert "ix_products_category_key_id" not in await index_names()
+
+    monkeypatch.setattr(schema, "_verified", None)
+    assert await schema.ensure_schema() is True
+    assert "ix_products_category_key_id" in await index_names()
+    # Existing indexes, expression indexes included, are left alone.
+    assert await schema.ensure_schema(force=True) is True
+
+
+@pytest.mark.anyio
+async def test_warm_up_caches_the_first_listing_pages(client, add_products, monkeypatch):
+    monkeypatch.setattr(settings, "default_page_size", 2)
+    await add_products({}, {}, {}, {"category": "Laptops"})
+
+    assert await warmup.warm_listings(max_categories=5) == 3
+    key = await product_cache.list_key(None, "id", 2, None)
+    cached = await product_cache.get(key)
+    assert len(json.loads(cached.body)) == 2
+    assert "X-Next-Cursor" in cached.headers
+
+    response = await client.get("/products/", params={"limit": 2})
+    assert response.headers["etag"] == cached.etag
+    # Already warm: nothing to do for the next worker sharing the cache.
+    assert await warmup.warm_listings(max_categories=5) == 0
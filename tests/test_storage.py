@@ -0,0 +1,54 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+from app.config import settings
+from app.storage import image_storage
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def no_pregeneration(monkeypatch):
+    monkeypatch.setattr(settings, "image_pregenerate", False)
+
+
+def png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (0, 90, 200)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def upload(client, headers, body: bytes, name: str = "x.png"):
+    return await client.post("/files/upload/", files={"file": (name, body, "image/png")}, headers=headers)
+
+
+def leftover_temp_files() -> list:
+    return list(image_storage.tmp_dir.iterdir()) if image_storage.tmp_dir.exists() else []
+
+
+async def test_identical_uploads_are_stored_once(client, user):
+    body = png()
+    first = (await upload(client, user, body, "a.png")).json()
+    second = (await upload(client, user, body, "b.png")).json()
+
+    digest = hashlib.sha256(body).hexdigest()
+    assert first["sha256"] == second["sha256"] == digest
+    assert first["url"] == second["url"] == f"/media/{digest[:2]}/{digest[2:4]}/{digest}.png"
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert (await client.get(first["url"])).content == body
+    assert leftover_temp_files() == []
+
+
+async def test_rejected_uploads_leave_nothing_behind(client, user, monkeypatch):
+    assert (await upload(client, user, b"#!/bin/sh\necho not an image\n")).status_code == 415
+
+    monkeypatch.setattr(image_storage, "max_bytes", 16)
+    assert (await upload(client, user, png())).status_code == 413
+    assert leftover_temp_files() == []
+
+
+async def test_upload_requires_authentication(client):
+    assert (await upload(client, {}, png())).status_code == 401